@@ -0,0 +1,207 @@
+'''
+Asyncio ingestion: a sketch fed from sockets and queues while the event loop keeps accepting data.
+
+Sources (`consume_queue`, and `serve_tcp` / `serve_unix` for newline-delimited
+numbers) put values into an `AsyncIngestor`, which cuts them into blocks of `be`
+elements, the input of one NEW. The blocks go through a bounded `asyncio.Queue`
+to a single consumer that runs `update` of the sketch (NEW and COLLAPSE) in an
+executor. When the queue is full the producers wait, a connection is not read
+in the meantime and TCP flow control slows down its sender.
+'''
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+QUEUE_BLOCKS = 16
+READ_SIZE = 2 ** 16
+
+
+def _parse(lines: 'list[bytes]') -> np.ndarray:
+    return np.array([float(line) for line in lines if line.strip()], dtype=np.float64)
+
+
+class AsyncIngestor:
+    '''
+    Feeds a sketch from asyncio sources through a bounded queue of NEW-sized blocks
+    '''
+    def __init__(self, sketch, max_blocks: int = QUEUE_BLOCKS, executor: Optional[Executor] = None):
+        '''
+        @param sketch: a sketch of `new_algorithm.create_sketch` (created with input_sequence=None)
+        @param max_blocks: capacity of the queue in blocks; producers wait while it is full
+        @param executor: where `update` of the sketch runs; a thread of its own by default
+        (only one block is in the executor at a time, so the sketch needs no locking)
+        '''
+        assert max_blocks >= 1, 'the queue must hold at least one block'
+        self.sketch = sketch
+        self.block_size = sketch.be
+        self.queue = asyncio.Queue(max_blocks)
+        self.executor = executor
+        self._own_executor = executor is None
+        # values of an incomplete block
+        self._pending = []
+        self._pending_size = 0
+        self._consumer = None
+        self._error = None
+        self._closed = False
+        # number of `put` calls in progress and an event set when there are none
+        self._puts = 0
+        self._idle = asyncio.Event()
+        self.received = 0 # number of values put so far
+
+    def start(self) -> 'AsyncIngestor':
+        '''
+        starts the consumer (must be called from a running event loop)
+        '''
+        if self._consumer is None:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(1)
+            self._consumer = asyncio.get_running_loop().create_task(self._consume())
+        return self
+
+    async def __aenter__(self) -> 'AsyncIngestor':
+        return self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            block = await self.queue.get()
+            try:
+                if block is None:
+                    return
+                if self._error is None:
+                    await loop.run_in_executor(self.executor, self.sketch.update, block)
+            except Exception as error:
+                # the queue is still drained, so the producers do not wait forever
+                self._error = error
+            finally:
+                self.queue.task_done()
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+
+    async def put(self, values):
+        '''
+        adds values; waits while the queue is full
+        @param values: a number or an array of numbers
+        '''
+        assert not self._closed, 'the ingestor is closed'
+        self._check()
+        self._puts += 1
+        try:
+            await self._put(np.asarray(values, dtype=np.float64).reshape(-1))
+        finally:
+            self._puts -= 1
+            if not self._puts:
+                self._idle.set()
+
+    async def _put(self, values: np.ndarray):
+        self.received += len(values)
+        self._pending.append(values)
+        self._pending_size += len(values)
+        if self._pending_size < self.block_size:
+            return
+        data = np.concatenate(self._pending)
+        full = len(data) - len(data) % self.block_size
+        # the rest is taken out before waiting, so concurrent producers never put the same values
+        self._pending = [data[full:]]
+        self._pending_size = len(data) - full
+        blocks = [data[start:start + self.block_size] for start in range(0, full, self.block_size)]
+        for index, block in enumerate(blocks):
+            try:
+                await self.queue.put(block)
+            except asyncio.CancelledError:
+                # a cancelled producer (e.g. a timeout) does not lose the blocks that are not queued yet
+                self._pending[:0] = blocks[index:]
+                self._pending_size += sum(len(rest) for rest in blocks[index:])
+                raise
+
+    async def flush(self):
+        '''
+        queues the values of an incomplete block
+        '''
+        if self._pending_size:
+            block = np.concatenate(self._pending)
+            self._pending, self._pending_size = [], 0
+            await self.queue.put(block)
+
+    async def join(self):
+        '''
+        waits until every value put so far is in the sketch (e.g. before a query of a live sketch)
+        '''
+        self.start()
+        await self.flush()
+        await self.queue.join()
+        self._check()
+
+    async def close(self):
+        '''
+        queues the rest of the values, waits until they are in the sketch and stops the consumer
+        @return the sketch, ready for `run` or `summary`
+        '''
+        if not self._closed:
+            self.start()
+            # producers that are waiting for room in the queue finish first
+            while self._puts:
+                self._idle.clear()
+                await self._idle.wait()
+            await self.flush()
+            self._closed = True
+            await self.queue.put(None)
+            await self._consumer
+            if self._own_executor:
+                self.executor.shutdown()
+        self._check()
+        return self.sketch
+
+    async def consume_queue(self, queue: asyncio.Queue):
+        '''
+        reads values from an `asyncio.Queue` until it gets None
+        @param queue: a queue of numbers or of arrays of numbers
+        '''
+        while True:
+            item = await queue.get()
+            try:
+                if item is None:
+                    return
+                await self.put(item)
+            finally:
+                queue.task_done()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        '''
+        reads newline-delimited numbers until the peer closes the connection (a callback of `asyncio.start_server`)
+        '''
+        tail = b''
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                lines = (tail + data).split(b'\n')
+                # the last line may continue in the next read
+                tail = lines.pop()
+                await self.put(_parse(lines))
+            await self.put(_parse([tail]))
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    async def serve_tcp(self, host: str = '127.0.0.1', port: int = 0) -> asyncio.AbstractServer:
+        '''
+        listens for newline-delimited numbers over TCP
+        @param port: 0 picks a free port, see `server.sockets[0].getsockname()`
+        '''
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def serve_unix(self, path: Union[str, Path]) -> asyncio.AbstractServer:
+        '''
+        listens for newline-delimited numbers on a Unix domain socket
+        '''
+        return await asyncio.start_unix_server(self.handle_connection, str(path))
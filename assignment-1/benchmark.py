@@ -0,0 +1,223 @@
+'''
+Reproducible benchmark of the quantile algorithms.
+
+Sweeps algorithm (MRL98, MRL99, the np.quantile baseline) x distribution x e x N.
+Every configuration generates its dataset from a fixed seed and records
+throughput, the `metrics.Metrics` of the sketch (time spent in NEW, COLLAPSE and
+OUTPUT, ...), peak memory of the sketch and the observed rank error. Results are written as JSON lines, one record per
+configuration, so that two versions can be compared with `compare`.
+
+    python benchmark.py run -o before.jsonl
+    python benchmark.py run -o after.jsonl
+    python benchmark.py compare before.jsonl after.jsonl
+'''
+import json
+import platform
+import subprocess
+import tracemalloc
+from itertools import product
+from pathlib import Path
+from time import perf_counter
+from typing import Iterable, Optional, Union
+
+import click
+import numpy as np
+
+import datagen
+import sizing
+from evaluation import rank_error
+from metrics import Metrics
+from new_algorithm import create_sketch
+from scheduler import POLICIES
+
+ALGORITHMS = ['98', '99', 'kll', 'numpy']
+DEFAULT_E = [0.01, 0.005]
+DEFAULT_N = [10**5, 10**6]
+SEED = 0
+
+
+def generate(distribution: str, N: int, seed: int) -> np.ndarray:
+    '''
+    dataset of one configuration; the same seed always gives the same data
+    '''
+    return datagen.fill(distribution, np.empty(N), seed)
+
+
+def _solve(algorithm: str, data: np.ndarray, b: int, k: int, phi: float, vectorized: bool, seed: int, policy: str,
+           metrics: Optional[Metrics] = None):
+    if algorithm == 'numpy':
+        return np.quantile(data, phi)
+    return create_sketch(algorithm, data, b, k, phi, vectorized, seed, metrics, policy).run()
+
+
+def _peak_memory(algorithm: str, data: np.ndarray, b: int, k: int, phi: float, vectorized: bool, seed: int, policy: str) -> int:
+    '''
+    peak memory allocated while answering, not counting the dataset itself
+    '''
+    tracemalloc.start()
+    try:
+        _solve(algorithm, data, b, k, phi, vectorized, seed, policy)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def benchmark_one(algorithm: str, distribution: str, e: float, N: int, phi: float = 0.5, seed: int = SEED,
+                  vectorized: bool = True, memory: bool = True, policy: str = 'new') -> dict:
+    '''
+    runs one configuration
+    @param algorithm: '98', '99', 'kll' or 'numpy'
+    @param distribution: a key of `datagen.possible_streams`
+    @param e: allowed error rate, b and k are chosen by `sizing.solve`
+    @param N: size of the dataset
+    @param phi: quantile to answer
+    @param seed: seed of the dataset and of the MRL99 sampling
+    @param vectorized: use array-backed buffers with the vectorized COLLAPSE
+    @param memory: also measure the peak memory (a second, untimed run under tracemalloc)
+    @param policy: collapse policy (see scheduler.py); b and k are the New Algorithm's for every policy
+    @return record of the configuration and its measurements
+    '''
+    assert algorithm in ALGORITHMS, f'algorithm must be from {ALGORITHMS}'
+    data = generate(distribution, N, seed)
+    sorted_data = np.sort(data)
+    b = k = None
+    # the variant that runs: MRL98 for '99' where sampling does not pay off
+    variant = algorithm
+    if algorithm != 'numpy':
+        params = sizing.solve(algorithm, e, N)
+        b, k, variant = params['b'], params['k'], params['mrl_type']
+
+    metrics = Metrics()
+    start = perf_counter()
+    value = _solve(variant, data, b, k, phi, vectorized, seed, policy, metrics)
+    seconds = perf_counter() - start
+    return {
+        'algorithm': algorithm,
+        'variant': variant,
+        'distribution': distribution,
+        'e': e,
+        'N': N,
+        'phi': phi,
+        'seed': seed,
+        'vectorized': vectorized,
+        'policy': policy if algorithm not in ('numpy', 'kll') else None,
+        'b': b,
+        'k': k,
+        'seconds': seconds,
+        'throughput': N / seconds,
+        # calls and seconds of NEW, COLLAPSE and OUTPUT, elements merged, tree height, r
+        'metrics': metrics.as_dict() if algorithm not in ('numpy', 'kll') else None,
+        'peak_memory': _peak_memory(variant, data, b, k, phi, vectorized, seed, policy) if memory else None,
+        'value': float(value),
+        'rank_error': rank_error(sorted_data, value, phi),
+    }
+
+
+def environment() -> dict:
+    '''
+    versions that the measurements depend on
+    '''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine()}
+
+
+def run_benchmark(path: Union[str, Path], algorithms: Iterable[str] = ALGORITHMS, distributions: Optional[Iterable[str]] = None,
+                  errors: Iterable[float] = DEFAULT_E, sizes: Iterable[int] = DEFAULT_N, policies: Iterable[str] = ('new',),
+                  **kwargs) -> 'list[dict]':
+    '''
+    runs the sweep and appends every record to a JSON lines file as soon as it is measured
+    @param path: output file
+    @param policies: collapse policies to run MRL98 and MRL99 with
+    @param kwargs: passed to `benchmark_one`
+    @return the records
+    '''
+    distributions = list(datagen.possible_streams) if distributions is None else distributions
+    policies = list(policies)
+    env = environment()
+    records = []
+    with open(path, 'a') as file:
+        for algorithm, policy, distribution, e, N in product(algorithms, policies, distributions, errors, sizes):
+            # numpy and KLL have no collapse policy
+            if algorithm in ('numpy', 'kll') and policy != policies[0]:
+                continue
+            record = {**benchmark_one(algorithm, distribution, e, N, policy=policy, **kwargs), **env}
+            file.write(json.dumps(record) + '\n')
+            file.flush()
+            records.append(record)
+    return records
+
+
+def load_results(path: Union[str, Path]) -> 'list[dict]':
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def _key(record: dict) -> tuple:
+    return (record['algorithm'], record.get('policy'), record['distribution'], record['e'], record['N'], record['phi'],
+            record['vectorized'])
+
+
+def compare(baseline: 'list[dict]', current: 'list[dict]', tolerance: float = 0.1) -> 'list[dict]':
+    '''
+    matches the configurations of two runs
+    @param tolerance: allowed relative loss of throughput
+    @return one row per common configuration with the throughput ratio (current / baseline),
+    the rank errors of both runs and whether it is a regression
+    '''
+    # the last record wins if a file holds several runs of a configuration
+    previous = {_key(record): record for record in baseline}
+    rows = []
+    for record in current:
+        old = previous.get(_key(record))
+        if old is None:
+            continue
+        ratio = record['throughput'] / old['throughput']
+        regression = ratio < 1 - tolerance or record['rank_error'] > max(old['rank_error'], record['e'])
+        rows.append({'config': _key(record), 'speedup': ratio, 'rank_error': (old['rank_error'], record['rank_error']),
+                     'regression': regression})
+    return rows
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command('run')
+@click.option('-o', '--output', type=click.Path(dir_okay=False), default='benchmark.jsonl', help='JSON lines file to append to')
+@click.option('-a', '--algorithm', 'algorithms', multiple=True, type=click.Choice(ALGORITHMS), default=ALGORITHMS)
+@click.option('-d', '--distribution', 'distributions', multiple=True, type=click.Choice(list(datagen.possible_streams)), default=list(datagen.possible_streams))
+@click.option('-e', '--error', 'errors', multiple=True, type=float, default=DEFAULT_E)
+@click.option('-n', '--size', 'sizes', multiple=True, type=int, default=DEFAULT_N)
+@click.option('--phi', type=float, default=0.5)
+@click.option('--seed', type=int, default=SEED)
+@click.option('-p', '--policy', 'policies', multiple=True, type=click.Choice(list(POLICIES)), default=['new'])
+@click.option('--lists', is_flag=True, help='use list-based buffers instead of the vectorized ones')
+@click.option('--no-memory', is_flag=True, help='skip the peak memory measurement')
+def run_command(output, algorithms, distributions, errors, sizes, policies, phi, seed, lists, no_memory):
+    for record in run_benchmark(output, algorithms, distributions, errors, sizes, policies, phi=phi, seed=seed,
+                                vectorized=not lists, memory=not no_memory):
+        print(f"{record['algorithm']:>5} {record['policy'] or '':>19} {record['distribution']:>8} e={record['e']:<6} N={record['N']:<9} "
+              f"{record['throughput']:12.0f} el/s  rank error {record['rank_error']:.5f}")
+
+
+@cli.command('compare')
+@click.argument('baseline', type=click.Path(exists=True, dir_okay=False))
+@click.argument('current', type=click.Path(exists=True, dir_okay=False))
+@click.option('--tolerance', type=float, default=0.1, help='allowed relative loss of throughput')
+def compare_command(baseline, current, tolerance):
+    rows = compare(load_results(baseline), load_results(current), tolerance)
+    for row in rows:
+        flag = 'REGRESSION' if row['regression'] else ''
+        print(f"{str(row['config']):60} x{row['speedup']:.2f}  rank error {row['rank_error'][0]:.5f} -> {row['rank_error'][1]:.5f} {flag}")
+    if any(row['regression'] for row in rows):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    cli()
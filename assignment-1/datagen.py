@@ -1,6 +1,12 @@
+from typing import Callable, Iterator, Optional
+
 import numpy as np
 import matplotlib.pyplot as plt
 
+from stream import CHUNK_SIZE
+
+RANDOM_RESOLUTION = 2**16
+
 def generate_bimodal_normal(N:int=1000) -> np.ndarray:
     assert N % 2 == 0, 'size of the dataset must be an even number'
     mu, sigma = 50, 10
@@ -27,3 +33,80 @@ def generate_random(N:int=1000, start:int=0, end:int=10) -> np.ndarray:
     np.random.shuffle(probs)
     data = np.random.choice(data, N, p=probs)
     return data
+
+
+def _chunked(sample: Callable[[int], np.ndarray], N: Optional[int], chunk_size: int) -> Iterator[np.ndarray]:
+    '''
+    yields `sample(size)` chunks until N elements are produced, forever if N is None
+    '''
+    assert chunk_size >= 1, 'chunk_size must be a positive number'
+    produced = 0
+    while N is None or produced < N:
+        size = chunk_size if N is None else min(chunk_size, N - produced)
+        produced += size
+        yield sample(size)
+
+def stream_bimodal_normal(N: Optional[int] = None, seed=None, chunk_size: int = CHUNK_SIZE) -> Iterator[np.ndarray]:
+    '''
+    the mixture of `generate_bimodal_normal` in chunks; every element comes from either mode with probability 1/2
+    (instead of the first half of the dataset from one mode and the second half from the other)
+    '''
+    rng = np.random.default_rng(seed)
+    mu, sigma = 50, 10
+    mu2, sigma2 = 10, 20
+    def sample(size):
+        return np.where(rng.random(size) < 0.5, rng.normal(mu, sigma, size), rng.normal(mu2, sigma2, size))
+    return _chunked(sample, N, chunk_size)
+
+def stream_normal(N: Optional[int] = None, seed=None, chunk_size: int = CHUNK_SIZE) -> Iterator[np.ndarray]:
+    rng = np.random.default_rng(seed)
+    mu, sigma = 100, 50
+    return _chunked(lambda size: rng.normal(mu, sigma, size), N, chunk_size)
+
+def stream_poisson(N: Optional[int] = None, seed=None, chunk_size: int = CHUNK_SIZE, lam: int = 5) -> Iterator[np.ndarray]:
+    rng = np.random.default_rng(seed)
+    return _chunked(lambda size: rng.poisson(lam, size), N, chunk_size)
+
+def stream_random(N: Optional[int] = None, seed=None, chunk_size: int = CHUNK_SIZE, start: int = 0, end: int = 10,
+                  resolution: int = RANDOM_RESOLUTION) -> Iterator[np.ndarray]:
+    '''
+    like `generate_random`, a random distribution over evenly spaced values in [start, end]: value i is drawn with
+    probability proportional to a random weight. There are at most `resolution` values instead of N, so memory
+    does not grow with N.
+    '''
+    rng = np.random.default_rng(seed)
+    values = np.linspace(start, end, resolution if N is None else min(N, resolution))
+    weights = rng.permutation(np.linspace(0, 1, len(values)))
+    cdf = np.cumsum(weights) / np.sum(weights)
+    # the last value must be reachable by every draw from [0, 1)
+    cdf[-1] = 1
+    return _chunked(lambda size: values[np.searchsorted(cdf, rng.random(size), side='right')], N, chunk_size)
+
+def fill(name: str, out: np.ndarray, seed=None, chunk_size: int = CHUNK_SIZE) -> np.ndarray:
+    '''
+    writes a streamed dataset into an existing array (e.g. shared memory) without an intermediate copy
+    @param name: a key of `possible_streams`
+    @param out: the array to fill, its length is the size of the dataset
+    @param seed: seed of the generator
+    @return out
+    '''
+    position = 0
+    for chunk in possible_streams[name](len(out), seed, chunk_size):
+        out[position:position + len(chunk)] = chunk
+        position += len(chunk)
+    return out
+
+
+possible_d = {
+    'random': generate_random,
+    'bimodal': generate_bimodal_normal,
+    'poisson': generate_poisson,
+    'normal': generate_normal
+}
+
+possible_streams = {
+    'random': stream_random,
+    'bimodal': stream_bimodal_normal,
+    'poisson': stream_poisson,
+    'normal': stream_normal
+}
@@ -0,0 +1,83 @@
+'''
+Accuracy of the sketches measured as rank error.
+
+An answer v for quantile phi of a dataset of N elements is correct within e if
+some rank r of v (any position of v in the sorted data) has |r - phi * N| <= e * N.
+Every dataset is sorted once and the ranks of all answers are found with
+`np.searchsorted`, so many phis are evaluated per run at the cost of one sort.
+'''
+from typing import Optional
+
+import numpy as np
+
+import datagen
+from new_algorithm import NewAlgorithm, create_sketch
+from parallel import sharded_sketch, split
+
+PHIS = np.linspace(0.01, 0.99, 99)
+
+
+def rank_errors(sorted_data: np.ndarray, values, phis) -> np.ndarray:
+    '''
+    normalized rank errors of answers
+    @param sorted_data: the dataset in ascending order
+    @param values: answer for every phi
+    @param phis: requested quantiles
+    @return distance between the requested rank and the closest rank of every answer, divided by N
+    '''
+    N = len(sorted_data)
+    # ranks (1-based) of a value are first..last, all of them are correct answers
+    first = np.searchsorted(sorted_data, values, side='left') + 1
+    last = np.searchsorted(sorted_data, values, side='right')
+    targets = np.asarray(phis) * N
+    return np.maximum(np.maximum(first - targets, targets - last), 0) / N
+
+
+def rank_error(sorted_data: np.ndarray, value, phi: float) -> float:
+    '''
+    normalized rank error of one answer
+    '''
+    return float(rank_errors(sorted_data, [value], [phi])[0])
+
+
+def evaluate(nalg: NewAlgorithm, data: np.ndarray, e: float, phis=PHIS) -> dict:
+    '''
+    consumes the input of a sketch and checks its answers for many phis
+    @param nalg: a sketch of `data` (a `NewAlgorithm` or a `kll.KLL`)
+    @param data: the dataset; it is sorted in place once the sketch is built
+    @param e: target error rate
+    @param phis: quantiles to check
+    @return phis, values, rank_errors, max and mean rank error, share of answers within e
+    '''
+    values = nalg.summary().quantiles(phis)
+    data.sort()
+    errors = rank_errors(data, values, phis)
+    return {
+        'phis': np.asarray(phis),
+        'values': values,
+        'rank_errors': errors,
+        'max': float(errors.max()),
+        'mean': float(errors.mean()),
+        'within_e': float(np.mean(errors <= e)),
+    }
+
+
+def evaluate_runs(mrl_type: str, runs: int, d: str, n: int, b: int, k: int, e: float, phis=PHIS,
+                  workers: int = 1, seed: Optional[int] = None) -> 'list[dict]':
+    '''
+    evaluates sketches of `runs` freshly generated datasets
+    @param d: a key of `datagen.possible_streams`
+    @param seed: seed of the datasets and of the MRL99 sampling
+    @return result of `evaluate` for every run
+    '''
+    seeds = np.random.SeedSequence(seed).spawn(runs)
+    results = []
+    for run_seed in seeds:
+        run_seed = int(run_seed.generate_state(1)[0])
+        data = datagen.fill(d, np.empty(n), run_seed)
+        if workers > 1:
+            nalg = sharded_sketch(mrl_type, split(data, workers), b, k, 0, workers=workers, vectorized=True, seed=run_seed)
+        else:
+            nalg = create_sketch(mrl_type, data, b, k, 0, vectorized=True, seed=run_seed)
+        results.append(evaluate(nalg, data, e, phis))
+    return results
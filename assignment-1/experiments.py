@@ -0,0 +1,184 @@
+'''
+Parallel executor of repeated experiments.
+
+Every run of every (e, N) configuration is a job: the parent generates the dataset
+straight into shared memory and a worker process attaches to it by name, so
+datasets are never pickled. Each job gets its own seed spawned from one
+`np.random.SeedSequence`, for the data and for the MRL99 sampling. At most a few
+datasets per worker exist at a time. Results are collected by `ExperimentResults`
+as the jobs finish.
+'''
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import product
+from multiprocessing import shared_memory
+from time import perf_counter
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+
+import datagen
+import sizing
+from evaluation import PHIS, evaluate
+from new_algorithm import create_sketch
+
+DTYPE = np.float64
+
+
+def _share(d: str, n: int, seed: np.random.SeedSequence) -> shared_memory.SharedMemory:
+    '''
+    generates a dataset into a new shared memory block
+    '''
+    shm = shared_memory.SharedMemory(create=True, size=max(n, 1) * np.dtype(DTYPE).itemsize)
+    datagen.fill(d, np.ndarray(n, dtype=DTYPE, buffer=shm.buf), seed)
+    return shm
+
+
+def _run_job(job: dict) -> dict:
+    '''
+    sketches and evaluates one shared dataset; runs in a worker process
+    '''
+    shm = shared_memory.SharedMemory(name=job['shm'])
+    try:
+        data = np.ndarray(job['n'], dtype=DTYPE, buffer=shm.buf)
+        start = perf_counter()
+        nalg = create_sketch(job['mrl_type'], data, job['b'], job['k'], job['phi'], vectorized=True, seed=job['seed'])
+        nalg.ingest()
+        seconds = perf_counter() - start
+        # the dataset belongs to this job only, so it is sorted in place
+        result = evaluate(nalg, data, job['e'], job['phis'])
+        # views of the shared block must be released before it is closed
+        del nalg, data
+    finally:
+        shm.close()
+    return {
+        'e': job['e'],
+        'n': job['n'],
+        'run': job['run'],
+        'b': job['b'],
+        'k': job['k'],
+        'seconds': seconds,
+        'value': float(result['values'][job['phis'].index(job['phi'])]),
+        'max': result['max'],
+        'mean': result['mean'],
+        'within_e': result['within_e'],
+    }
+
+
+class ExperimentResults:
+    '''
+    Collects the results of finished jobs and reports progress
+    '''
+    def __init__(self, total: int, progress: Optional[Callable[[int, int, dict], None]] = None):
+        '''
+        @param total: number of jobs
+        @param progress: called as progress(done, total, result) after every finished job
+        '''
+        self.total = total
+        self.progress = progress
+        self.results = []
+
+    def add(self, result: dict):
+        self.results.append(result)
+        if self.progress is not None:
+            self.progress(len(self.results), self.total, result)
+
+    def configurations(self) -> 'list[tuple]':
+        return sorted({(result['e'], result['n']) for result in self.results})
+
+    def runs(self, e: float, n: int) -> 'list[dict]':
+        '''
+        results of one configuration ordered by run
+        '''
+        return sorted((result for result in self.results if (result['e'], result['n']) == (e, n)), key=lambda result: result['run'])
+
+    def summary(self) -> 'dict[tuple, dict]':
+        '''
+        @return for every (e, N): number of runs, mean time, worst and mean rank error, share of answers within e
+        '''
+        summary = {}
+        for e, n in self.configurations():
+            runs = self.runs(e, n)
+            summary[(e, n)] = {
+                'runs': len(runs),
+                'seconds': float(np.mean([run['seconds'] for run in runs])),
+                'max': max(run['max'] for run in runs),
+                'mean': float(np.mean([run['mean'] for run in runs])),
+                'within_e': float(np.mean([run['within_e'] for run in runs])),
+            }
+        return summary
+
+    def times(self) -> 'dict[tuple, float]':
+        '''
+        mean time per configuration, {(error, size): time_taken}
+        '''
+        return {config: values['seconds'] for config, values in self.summary().items()}
+
+    def plot(self, plot_graph: Callable):
+        '''
+        one graph of time against dataset size per error rate
+        @param plot_graph: plot_graph(x, y, title, xlabel, ylabel), see `main.plot_graph`
+        '''
+        times = self.times()
+        for error in sorted({e for e, _ in times}):
+            sizes = sorted(n for e, n in times if e == error)
+            plot_graph(sizes, [times[(error, n)] for n in sizes], f'At error {error}', 'dataset size', 'time taken (s)')
+
+
+def print_progress(done: int, total: int, result: dict):
+    print(f'[{done}/{total}] e={result["e"]} N={result["n"]} run {result["run"]}: '
+          f'{result["seconds"]:.2f}s, max rank error {result["max"]:.6f}')
+
+
+def run_experiments(mrl_type: str, d: str, configurations: Iterable[tuple], runs: int, phi: float = 0.5, phis=PHIS,
+                    workers: Optional[int] = None, seed: Optional[int] = None,
+                    progress: Optional[Callable[[int, int, dict], None]] = print_progress) -> ExperimentResults:
+    '''
+    runs every configuration `runs` times over a process pool
+    @param mrl_type: 98 or 99
+    @param d: a key of `datagen.possible_streams`
+    @param configurations: (e, N) pairs; b, k (and MRL98 where sampling does not pay off) are chosen by `sizing.solve`
+    @param runs: number of runs (freshly generated datasets) per configuration
+    @param phi: quantile whose value is reported per run; it is always evaluated
+    @param phis: quantiles whose rank errors are evaluated
+    @param workers: number of processes (number of CPUs by default)
+    @param seed: seed every job's data and sampling seeds are spawned from
+    @param progress: called after every finished job, None to stay quiet
+    @return collected results
+    '''
+    phis = sorted(set(np.asarray(phis).tolist()) | {phi})
+    jobs = []
+    for (e, n), run in product(configurations, range(runs)):
+        params = sizing.solve(mrl_type, e, n)
+        jobs.append({'mrl_type': params['mrl_type'], 'e': e, 'n': n, 'run': run, 'b': params['b'], 'k': params['k'], 'phi': phi, 'phis': phis})
+    for job, job_seed in zip(jobs, np.random.SeedSequence(seed).spawn(len(jobs))):
+        job['data_seed'], job['seed'] = job_seed.spawn(2)
+
+    workers = workers or os.cpu_count() or 1
+    # only a couple of datasets per worker are kept in memory
+    max_pending = 2 * workers
+    results = ExperimentResults(len(jobs), progress)
+    pending = {}
+    with ProcessPoolExecutor(workers) as pool:
+        jobs = iter(jobs)
+        try:
+            while True:
+                for job in jobs:
+                    shm = _share(d, job['n'], job.pop('data_seed'))
+                    pending[pool.submit(_run_job, {**job, 'shm': shm.name})] = shm
+                    if len(pending) >= max_pending:
+                        break
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    shm = pending.pop(future)
+                    shm.close()
+                    shm.unlink()
+                    results.add(future.result())
+        finally:
+            for future, shm in pending.items():
+                future.cancel()
+                shm.close()
+                shm.unlink()
+    return results
@@ -0,0 +1,181 @@
+'''
+Quantiles per key (endpoint, host, ...) for many keys at once.
+
+`KeyedSketches` runs the New Algorithm (MRL98) for every key, but a key is not an
+object with its own buffers: all buffers live in one slab of typed arrays,
+
+    data[row, buffer, :]    elements          (float64, rows x b x be)
+    size[row, buffer]       number of elements in the buffer
+    weight[row, buffer]     weight, 0 for an empty buffer
+    level[row, buffer]      level in the collapse tree
+
+and a key only maps to a row. The slab grows by doubling. NEW fills a buffer of
+the row directly from the incoming values, and COLLAPSE uses `weighted_collapse`
+on the row's buffers.
+'''
+from typing import Hashable, Iterable, Optional
+
+import numpy as np
+
+from mrl98 import weighted_collapse
+
+INITIAL_ROWS = 64
+
+
+class KeyedSketches:
+    '''
+    One New Algorithm sketch per key over a shared slab of buffers
+    '''
+    def __init__(self, b: int, be: int, rows: int = INITIAL_ROWS):
+        '''
+        @param b: number of buffers per key
+        @param be: number of elements per buffer
+        @param rows: number of keys to allocate room for; the slab grows when more keys arrive
+        '''
+        assert b >= 2, 'there must be at least 2 buffers per key'
+        assert be >= 1 and rows >= 1, 'be and rows must be positive numbers'
+        self.b = b
+        self.be = be
+        self.rows = {} # key -> row of the slab
+        self.keys = []
+        self.data = np.empty((rows, b, be), dtype=np.float64)
+        self.size = np.zeros((rows, b), dtype=np.int64)
+        self.weight = np.zeros((rows, b), dtype=np.int64)
+        self.level = np.zeros((rows, b), dtype=np.int64)
+        # buffer of every row that NEW is filling, -1 if none
+        self.filling = np.full(rows, -1, dtype=np.int64)
+        self.count = np.zeros(rows, dtype=np.int64) # number of elements per key
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _grow(self, rows: int):
+        capacity = len(self.data)
+        while capacity < rows:
+            capacity *= 2
+        if capacity == len(self.data):
+            return
+        added = capacity - len(self.data)
+        self.data = np.concatenate([self.data, np.empty((added, self.b, self.be), dtype=np.float64)])
+        self.size = np.concatenate([self.size, np.zeros((added, self.b), dtype=np.int64)])
+        self.weight = np.concatenate([self.weight, np.zeros((added, self.b), dtype=np.int64)])
+        self.level = np.concatenate([self.level, np.zeros((added, self.b), dtype=np.int64)])
+        self.filling = np.concatenate([self.filling, np.full(added, -1, dtype=np.int64)])
+        self.count = np.concatenate([self.count, np.zeros(added, dtype=np.int64)])
+
+    def _row(self, key: Hashable) -> int:
+        row = self.rows.get(key)
+        if row is None:
+            row = self.rows[key] = len(self.keys)
+            self.keys.append(key)
+            self._grow(row + 1)
+        return row
+
+    def update(self, keys: Iterable[Hashable], values: Iterable[float]):
+        '''
+        routes a batch of (key, value) pairs to the sketches of their keys
+        @param keys: key of every value
+        @param values: new elements
+        '''
+        keys = np.asarray(keys)
+        values = np.asarray(values, dtype=np.float64)
+        assert keys.shape == values.shape, 'there must be one key per value'
+        unique, inverse = np.unique(keys, return_inverse=True)
+        rows = np.array([self._row(key.item() if isinstance(key, np.generic) else key) for key in unique], dtype=np.int64)
+        # values of every key in their order of arrival
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.searchsorted(inverse[order], np.arange(len(unique) + 1))
+        for row, start, stop in zip(rows, bounds[:-1], bounds[1:]):
+            self._insert(int(row), values[order[start:stop]])
+
+    def _insert(self, row: int, values: np.ndarray):
+        self.count[row] += len(values)
+        position = 0
+        while position < len(values):
+            buffer = self.filling[row]
+            if buffer < 0:
+                buffer = self._new(row)
+            taken = min(self.be - self.size[row, buffer], len(values) - position)
+            start = self.size[row, buffer]
+            self.data[row, buffer, start:start + taken] = values[position:position + taken]
+            self.size[row, buffer] += taken
+            position += taken
+            if self.size[row, buffer] == self.be:
+                # the buffer is full
+                self.data[row, buffer].sort()
+                self.filling[row] = -1
+
+    def _new(self, row: int) -> int:
+        '''
+        starts a NEW operation of a row: collapses if there is no empty buffer and chooses the level
+        @return index of the buffer to fill
+        '''
+        empty = np.flatnonzero(self.weight[row] == 0)
+        if not len(empty):
+            self._collapse(row)
+            empty = np.flatnonzero(self.weight[row] == 0)
+        buffer = int(empty[0])
+        # with one empty buffer it gets the smallest level L of the full buffers, otherwise level 0
+        full = self.weight[row] > 0
+        self.level[row, buffer] = self.level[row][full].min() if len(empty) == 1 else 0
+        self.weight[row, buffer] = 1
+        self.size[row, buffer] = 0
+        self.filling[row] = buffer
+        return buffer
+
+    def _collapse(self, row: int):
+        '''
+        COLLAPSE of the buffers of the smallest level (with the next level if it has only one buffer)
+        '''
+        levels = np.unique(self.level[row])
+        buffers = np.flatnonzero(self.level[row] == levels[0])
+        if len(buffers) < 2:
+            buffers = np.flatnonzero(self.level[row] <= levels[1])
+        weights = self.weight[row, buffers]
+        y = weighted_collapse([self.data[row, buffer] for buffer in buffers], weights.tolist(), self.be)
+        output = buffers[0]
+        self.data[row, output] = y[:self.be]
+        self.weight[row, buffers] = 0
+        self.size[row, buffers] = 0
+        self.weight[row, output] = weights.sum()
+        self.size[row, output] = self.be
+        self.level[row, output] = self.level[row, buffers].max() + 1
+
+    def quantiles(self, phis, keys: Optional[Iterable[Hashable]] = None) -> np.ndarray:
+        '''
+        bulk query: quantiles of every key at once, without modifying the sketches
+        @param phis: quantiles from [0, 1]
+        @param keys: keys to answer for (all keys in the order of their first arrival by default)
+        @return array of shape (number of keys, number of phis); nan for unknown keys
+        '''
+        phis = np.atleast_1d(np.asarray(phis, dtype=np.float64))
+        assert np.all((0 <= phis) & (phis <= 1)), 'phi must be from [0, 1]'
+        keys = self.keys if keys is None else list(keys)
+        rows = np.array([self.rows.get(key, -1) for key in keys], dtype=np.int64)
+        result = np.full((len(rows), len(phis)), np.nan)
+        known = np.flatnonzero(rows >= 0)
+        if not len(known):
+            return result
+        # weighted elements of every buffer of the known rows, sorted by row and then by value
+        data = self.data[rows[known]]
+        mask = np.arange(self.be) < self.size[rows[known]][:, :, None]
+        row_ids = np.broadcast_to(np.arange(len(known))[:, None, None], data.shape)[mask]
+        values = data[mask]
+        weights = np.broadcast_to(self.weight[rows[known]][:, :, None], data.shape)[mask]
+        order = np.lexsort((values, row_ids))
+        row_ids, values, cum_weights = row_ids[order], values[order], np.cumsum(weights[order])
+        # cumulative weight before the first element of every row and the total weight of every row
+        starts = np.searchsorted(row_ids, np.arange(len(known)))
+        ends = np.searchsorted(row_ids, np.arange(len(known)), side='right')
+        before = np.where(starts > 0, cum_weights[np.maximum(starts, 1) - 1], 0)
+        totals = np.where(ends > starts, cum_weights[np.maximum(ends, 1) - 1], 0) - before
+        targets = before[:, None] + phis[None, :] * totals[:, None]
+        indices = np.searchsorted(cum_weights, targets, side='left')
+        # the first element of a row for phi = 0, the last one if rounding runs past the row
+        indices = np.clip(indices, starts[:, None], np.maximum(ends - 1, starts)[:, None])
+        answers = values[np.minimum(indices, len(values) - 1)]
+        result[known] = np.where((totals > 0)[:, None], answers, np.nan)
+        return result
+
+    def quantile(self, key: Hashable, phi: float) -> float:
+        return self.quantiles([phi], [key])[0, 0].item()
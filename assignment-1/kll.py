@@ -0,0 +1,123 @@
+'''
+KLL (Karnin, Lang, Liberty 2016): a hierarchy of randomized compactors.
+
+Level h holds elements of weight 2^h. A compaction sorts a level and promotes
+every other element (starting at a random offset) to the next level, so each
+promoted element stands for two. Capacities decrease geometrically from the top
+level down, k, c*k, c^2*k, ..., so the whole sketch keeps about k / (1 - c)
+elements for any N, with a rank error of O(1/k).
+
+`KLL` has the interface of `NewAlgorithm` (`update`, `ingest`, `run`, `summary`,
+`merge`) and is created for mrl_type 'kll' by `new_algorithm.create_sketch`.
+'''
+from math import ceil
+from typing import Iterable, Optional
+
+import numpy as np
+
+from stream import InputStream
+from summary import WeightedSummary
+
+C = 2 / 3
+MIN_CAPACITY = 2
+
+
+class KLL:
+    '''
+    A KLL sketch with lazy compactions
+    '''
+    def __init__(self, input_sequence: Optional[Iterable], k: int, phi: float, seed=None, c: float = C):
+        '''
+        @param input_sequence: any iterable of numbers or of array chunks (None to feed the data with `update`)
+        @param k: capacity of the top level; the rank error is about 1.5 / k (see `sizing.solve_kll`)
+        @param phi: the quantile that `run` returns
+        @param seed: seed of the random offsets of the compactions
+        @param c: ratio of the capacities of two consecutive levels
+        '''
+        assert k >= MIN_CAPACITY, f'k must be at least {MIN_CAPACITY}'
+        assert 0.5 < c < 1, 'c must be from (0.5, 1)'
+        self.stream = InputStream(input_sequence)
+        self.k = k
+        self.be = k
+        self.c = c
+        self.phi = phi
+        self.rng = np.random.default_rng(seed)
+        self.levels = [np.empty(0)]
+        self.input_seq_len = 0 # number of elements consumed so far
+        self.compactions = 0
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - 1 - level
+        return max(MIN_CAPACITY, int(ceil(self.k * self.c ** depth)))
+
+    def size(self) -> int:
+        '''
+        number of elements kept by the sketch
+        '''
+        return sum(len(level) for level in self.levels)
+
+    def _add(self, elements: np.ndarray):
+        self.levels[0] = np.concatenate([self.levels[0], np.asarray(elements, dtype=np.float64)])
+        self.input_seq_len += len(elements)
+        self._compress()
+
+    def _compress(self):
+        '''
+        compacts the lowest level over its capacity until the sketch fits into the sum of the capacities
+        '''
+        while self.size() >= sum(self._capacity(level) for level in range(len(self.levels))):
+            level = next(level for level in range(len(self.levels)) if len(self.levels[level]) >= self._capacity(level))
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(self.levels[level])
+            # an odd element stays at its level
+            even = len(items) - len(items) % 2
+            offset = self.rng.integers(2)
+            self.levels[level] = items[even:]
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], items[offset:even:2]])
+            self.compactions += 1
+
+    def update(self, values):
+        '''
+        push-style ingestion: the values are added right away
+        @param values: an iterable of numbers or of array chunks
+        '''
+        self.stream.extend(values)
+        self.ingest()
+
+    def ingest(self, limit: Optional[int] = None):
+        '''
+        consumes the rest of the input
+        @param limit: if given, stops as soon as at least `limit` more elements are consumed
+        '''
+        stop = None if limit is None else self.input_seq_len + limit
+        while not self.stream.exhausted and (stop is None or self.input_seq_len < stop):
+            self._add(self.stream.take(self.k))
+
+    def summary(self) -> WeightedSummary:
+        '''
+        consumes the rest of the input and returns a summary of the weighted elements of all levels
+        '''
+        self.ingest()
+        weights = np.concatenate([np.full(len(items), 2 ** level, dtype=np.int64) for level, items in enumerate(self.levels)])
+        return WeightedSummary(np.concatenate(self.levels), weights)
+
+    def run(self):
+        '''
+        consumes the rest of the input and returns the element at `self.phi`
+        '''
+        return self.summary().quantile(self.phi)
+
+    def merge(self, other: 'KLL'):
+        '''
+        merges another sketch (the rest of its input is ingested first) level by level and compacts the result
+        '''
+        other.ingest()
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.input_seq_len += other.input_seq_len
+        self.compactions += other.compactions
+        self._compress()
+        return self
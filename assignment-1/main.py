@@ -1,51 +1,25 @@
+from itertools import product
 from typing import Optional
 import click
-from numpy import dtype, mean
 
-from new_algorithm import NewAlgorithm
+from new_algorithm import NewAlgorithm, create_sketch
+from parallel import sharded_sketch
+from sources import FileSource, open_source
+from stream import CHUNK_SIZE
 from mrl98 import Buffer, MRL98, Element
 import datagen
-import numpy_solver
-
-from scipy.stats import ttest_ind
+import sizing
+from evaluation import PHIS, evaluate_runs
+from metrics import Metrics
+from scheduler import POLICIES
+from summary import BUCKETS
+from experiments import run_experiments
 
 import matplotlib.pyplot as plt
-from time import time
-
-P_VALUE_THRESH = .05
 
 possible_e = [0.001, 0.005, 0.01, 0.05, 0.1]
 possible_N = [10**5, 10**6, 10**7, 10**9]
-possible_d = {
-    'random': datagen.generate_random,
-    'bimodal': datagen.generate_bimodal_normal,
-    'poisson': datagen.generate_poisson,
-    'normal': datagen.generate_normal
-}
-# b = number of buffers, k = number of elements per buffer
-parameters = {
-    # --- e=0.001
-    (0.001, 10**5): {'b': 3, 'k': 2778},
-    (0.001, 10**6): {'b': 5, 'k': 3031},
-    (0.001, 10**7): {'b': 5, 'k': 5495},
-    # --- e=0.005
-    (0.005, 10**5): {'b': 3, 'k': 953},
-    (0.005, 10**6): {'b': 8, 'k': 583},
-    (0.005, 10**7): {'b': 8, 'k': 875},
-    # --- e=0.01
-    (0.01, 10**5): {'b': 7, 'k': 217},
-    (0.01, 10**6): {'b': 12, 'k': 229},
-    (0.01, 10**7): {'b': 9, 'k': 412},
-    # --- e=0.05
-    (0.05, 10**5): {'b': 6, 'k': 78},
-    (0.05, 10**6): {'b': 6, 'k': 117},
-    (0.05, 10**7): {'b': 8, 'k': 129},
-    # --- e=0.1
-    (0.1, 10**5): {'b': 5, 'k': 55},
-    (0.1, 10**6): {'b': 7, 'k': 54},
-    (0.1, 10**7): {'b': 10, 'k': 60},
-    (0.1, 10**8): {'b': 15, 'k': 51},
-}
+possible_d = datagen.possible_d
 
 def get_distribution(name: str, N: int, poisson_lambda: Optional[float], random_start: Optional[int], random_finish: Optional[int]):
     gen_func = possible_d[name]
@@ -55,21 +29,9 @@ def get_distribution(name: str, N: int, poisson_lambda: Optional[float], random_
         return gen_func(N, random_start, random_finish)
     return gen_func(N)
 
-def run_several_times(mrl_type: str, runs: int, d, n, b, k, phi):
-    mrl98_values = []
-    numpy_values = []
-    for _ in range(runs):
-        data = possible_d[d](n).tolist()
-        nalg = NewAlgorithm(mrl_type, data.copy(), b, k, phi)
-        value_at_phi = nalg.run()
-        numpy_value_at_phi = numpy_solver.calculate_quantile(data, phi)
-        mrl98_values.append(value_at_phi)
-        numpy_values.append(numpy_value_at_phi)
-    return mrl98_values, numpy_values
-
 # @profile
 def track_memory_usage(mrl_type: str, d, n, b, k, phi):
-    data = possible_d[d](n).tolist()
+    data = possible_d[d](n)
     nalg = NewAlgorithm(mrl_type, data, b, k, phi)
     # nalg.run()
 
@@ -82,9 +44,24 @@ def plot_graph(x, y, title, xlabel, ylabel):
     plt.ylabel(ylabel)
     plt.show()
 
+def print_metrics(metrics: Optional[Metrics]):
+    if metrics is None:
+        return
+    for phase, values in metrics.as_dict()['phases'].items():
+        print(f'{phase.upper():<9} calls: {values["calls"]:<8} time: {values["seconds"]:.3f}s')
+    print(f'Elements consumed: {metrics.elements_consumed}, merged: {metrics.elements_merged}')
+    print(f'Tree height: {metrics.height}, r: {metrics.r}')
+
+def save_histogram(nalg, path: Optional[str], buckets: int):
+    if path is None:
+        return
+    # before `run`, which collapses the buffers
+    nalg.summary().histogram(buckets).save(path)
+    print(f'Histogram of {buckets} buckets saved to {path}')
+
 
 @click.command()
-@click.argument('mrl_year', type=str, default=98)
+@click.argument('mrl_year', type=str, default=98)  # 98, 99 or kll
 @click.argument('phi', type=float, default=0.2)
 @click.argument('runs', type=int, default=5)
 @click.argument('e', type=float, default=possible_e[0])
@@ -93,53 +70,86 @@ def plot_graph(x, y, title, xlabel, ylabel):
 @click.argument('poisson_lambda', type=int, default=5)
 @click.argument('random_start', type=int, default=0)
 @click.argument('random_finish', type=int, default=10)
-def main(mrl_year, phi, runs, e, n, d, poisson_lambda, random_start, random_finish):
-    assert '98' in mrl_year or '99' in mrl_year, 'MRL year should contain 98 or 99'
+@click.option('--workers', type=int, default=1, help='number of processes; the data is split into one shard per process')
+@click.option('--path', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='compute the quantile of a .npy, raw binary or text file instead of generated data')
+@click.option('--dtype', type=str, default='<f8', help='type of the numbers in a raw binary file')
+@click.option('--chunk-size', type=int, default=CHUNK_SIZE, help='number of elements read from the file at a time')
+@click.option('--seed', type=int, default=None, help='seed of the generated datasets and of the MRL99 sampling')
+@click.option('--jobs', type=int, default=None, help='number of processes the runs are spread over (number of CPUs by default)')
+@click.option('--sweep', is_flag=True, help='time every (e, N) of the grid up to --max-n and plot the times')
+@click.option('--max-n', type=int, default=10**7, help='largest dataset size of the --sweep grid')
+@click.option('--stream', is_flag=True, help='feed n generated elements straight into one sketch in chunks and print the value at phi; '
+              'memory does not depend on n, so n can be 10^9, but the rank error is not evaluated')
+@click.option('--metrics', 'show_metrics', is_flag=True, help='print NEW/COLLAPSE/OUTPUT counts and times of a --stream or --path sketch')
+@click.option('--policy', type=click.Choice(list(POLICIES)), default='new', help='collapse policy of a --stream or --path sketch (of every shard with --workers)')
+@click.option('--histogram', 'histogram_path', type=click.Path(dir_okay=False), default=None,
+              help='save an equi-depth histogram of a --stream or --path sketch to this .npy file (see summary.Histogram)')
+@click.option('--buckets', type=int, default=BUCKETS, help='number of buckets of --histogram')
+def main(mrl_year, phi, runs, e, n, d, poisson_lambda, random_start, random_finish, workers, path, dtype, chunk_size, seed, jobs, sweep, max_n, stream, show_metrics, policy,
+         histogram_path, buckets):
+    assert '98' in mrl_year or '99' in mrl_year or mrl_year == 'kll', 'MRL year should contain 98 or 99, or be kll'
     assert 0 <= phi <= 1, 'phi must be between 0 and 1'
-    assert e in possible_e, f'e must be from {possible_e}'
-    assert n in possible_N, f'n must be from {possible_N}'
+    assert 0 < e < 1, 'e must be between 0 and 1'
+    assert n >= 1, 'n must be a positive number'
     assert d in possible_d.keys(), f'd must be from {list(possible_d.keys())}'
-    params = parameters[(e, n)]
+    # b = number of buffers, k = number of elements per buffer
+    params = sizing.solve(mrl_year, e, n)
     b, k = params['b'], params['k']
-    print(f'The Null Hypothesis (H0): MRL98 is as good as np.quantile() with a p-value threshold of {P_VALUE_THRESH}')
+    if params['mrl_type'] != mrl_year and not sweep:
+        print(f'Sampling needs more memory than MRL98 for e={e} and n={n}, MRL98 is used')
+    # KLL has no NEW, COLLAPSE and OUTPUT to instrument
+    metrics = Metrics() if show_metrics and mrl_year != 'kll' else None
+    if path is not None:
+        source = open_source(path, dtype, chunk_size)
+        if workers > 1 and isinstance(source, FileSource):
+            nalg = sharded_sketch(params['mrl_type'], source.split(workers), b, k, phi, workers=workers, policy=policy)
+            metrics = None # sketches built in other processes are not instrumented
+        else:
+            nalg = create_sketch(params['mrl_type'], source, b, k, phi, metrics=metrics, policy=policy)
+        save_histogram(nalg, histogram_path, buckets)
+        print(f'Value at {phi} in {path}: {nalg.run()}')
+        print_metrics(metrics)
+        return
+    if stream:
+        nalg = create_sketch(params['mrl_type'], datagen.possible_streams[d](n, seed, chunk_size), b, k, phi, vectorized=True, seed=seed, metrics=metrics, policy=policy)
+        save_histogram(nalg, histogram_path, buckets)
+        print(f'Value at {phi} of {n} {d} elements: {nalg.run()}')
+        print_metrics(metrics)
+        return
+    if sweep:
+        run_for_dataset_size_and_error(mrl_year, d, phi, runs, max_n, jobs, seed)
+        return
     print(f'Allowed error rate: {e}')
+    print(f'Buffers: b={b}, k={k}')
     print(f'Number of runs: {runs}\n')
     # track_memory_usage(mrl_year, d, n, b, k, phi)
-    mrl_values, numpy_values = run_several_times(mrl_year, runs, d, n, b, k, phi)
-
-    print('Done. Running 2-sample t-test...\n')
-    print(f'Mean of MRL results of {runs} runs: {mean(mrl_values)}')
-    print(f'Mean of numpy results of {runs} runs: {mean(numpy_values)}')
-    _, p_value = ttest_ind(a=mrl_values, b=numpy_values, equal_var=False)
-    print(f'p_value of 2-sample t-test: {p_value}')
-    print(f'Rejecting H0: {p_value > P_VALUE_THRESH}')
-    # times = run_for_dataset_size_and_error(mrl_year, d, phi) # {(error, size): time_taken}
-    # print(times)
-    # values_per_error = {error: ([], []) for error in possible_e}
-    # for error_size, time_taken in times.items():
-    #     values_per_error[error_size[0]][0].append(error_size[1])
-    #     values_per_error[error_size[0]][1].append(time_taken)
-    # print('\nPlotting graphs...\n')
-    # for error in possible_e:
-    #     plot_graph(values_per_error[error][0], values_per_error[error][1], f'At error {error}', 'dataset size', 'time taken (s)')
-
-
-def run_for_dataset_size_and_error(mrl_type: str, d, phi):
-    times = {}
-    for error_size, params in parameters.items():
-        error, size = error_size
-        print(f'Running for size: {size} and error: {error}')
-        b, k = params['b'], params['k']
-        data = possible_d[d](size).tolist()
-        start = time()
-        nalg = NewAlgorithm(mrl_type, data.copy(), b, k, phi)
-        value_at_phi = nalg.run()
-        end = time()
-        times[error_size] = end - start
-        print(f'Value at {phi}: {value_at_phi}/n')
-        print(times)
-    return times
-
+    # `phi` is checked together with the other phis of every run
+    phis = sorted(set(PHIS.tolist()) | {phi})
+    if workers > 1:
+        # runs are sharded one after the other
+        results = evaluate_runs(params['mrl_type'], runs, d, n, b, k, e, phis, workers, seed)
+        results = [{**result, 'value': result['values'][phis.index(phi)]} for result in results]
+    else:
+        results = run_experiments(mrl_year, d, [(e, n)], runs, phi, phis, jobs, seed, progress=None).runs(e, n)
+
+    print(f'Rank errors over {len(phis)} phis, normalized by the dataset size:')
+    for run, result in enumerate(results):
+        print(f'Run {run}: max {result["max"]:.6f}, mean {result["mean"]:.6f}, within e: {result["within_e"]:.1%}, '
+              f'value at {phi}: {result["value"]}')
+    worst = max(result['max'] for result in results)
+    print(f'\nWorst rank error of {runs} runs: {worst:.6f} ({worst / e:.2f} e)')
+    print(f'Within the allowed error rate: {worst <= e}')
+
+def run_for_dataset_size_and_error(mrl_type: str, d, phi, runs: int = 1, max_n: int = 10**7, jobs: Optional[int] = None, seed: Optional[int] = None):
+    configurations = [(error, size) for error, size in product(possible_e, possible_N) if size <= max_n]
+    results = run_experiments(mrl_type, d, configurations, runs, phi, workers=jobs, seed=seed)
+    print('\nerror  size        time (s)  worst rank error  within e')
+    for (error, size), values in results.summary().items():
+        print(f'{error:<6} {size:<11} {values["seconds"]:<9.3f} {values["max"]:<17.6f} {values["within_e"]:.1%}')
+    print('\nPlotting graphs...\n')
+    results.plot(plot_graph)
+    return results.times()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,93 @@
+'''
+Opt-in instrumentation of the sketches.
+
+A `Metrics` object wraps the NEW, COLLAPSE and OUTPUT methods of one MRL98/MRL99
+instance (and the steps of its `NewAlgorithm`) when it is attached. A sketch
+without metrics is not wrapped at all, so disabled instrumentation costs nothing.
+Instrumented sketches can not be pickled.
+
+    metrics = Metrics()
+    nalg = NewAlgorithm('98', data, b, k, phi, metrics=metrics)
+    nalg.run()
+    print(metrics.as_dict())
+'''
+from time import perf_counter
+from typing import Callable, Optional
+
+PHASES = ['new', 'collapse', 'output']
+
+
+class Metrics:
+    '''
+    Counters and timers of one sketch:
+    - calls and seconds of NEW, COLLAPSE and OUTPUT; a COLLAPSE that runs inside OUTPUT is part of OUTPUT
+    - elements consumed from the input by NEW and elements (with padding) merged by COLLAPSE
+    - height of the collapse tree (highest buffer level) and the current sampling rate `r` of MRL99
+    '''
+    def __init__(self, callback: Optional[Callable[[str, 'Metrics'], None]] = None):
+        '''
+        @param callback: called as callback(phase, metrics) after every NEW, COLLAPSE and OUTPUT
+        '''
+        self.callback = callback
+        self.calls = {phase: 0 for phase in PHASES}
+        self.seconds = {phase: 0.0 for phase in PHASES}
+        self.elements_consumed = 0
+        self.elements_merged = 0
+        self.height = 0
+        self.r = None
+        self._running = None
+
+    def _wrap(self, func: Callable, phase: str, mrl) -> Callable:
+        def instrumented(*args, **kwargs):
+            if phase == 'collapse':
+                self.elements_merged += sum(buffer.len() for buffer in args[0])
+            if self._running is not None:
+                return func(*args, **kwargs)
+            self._running = phase
+            consumed = mrl.input_seq_len
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.seconds[phase] += perf_counter() - start
+                self.calls[phase] += 1
+                self.elements_consumed += mrl.input_seq_len - consumed
+                self._running = None
+                if self.callback is not None:
+                    self.callback(phase, self)
+        return instrumented
+
+    def attach_mrl(self, mrl):
+        '''
+        instruments NEW, COLLAPSE and OUTPUT of a MRL98 or MRL99 instance
+        @return mrl
+        '''
+        mrl.new = self._wrap(mrl.new, 'new', mrl)
+        mrl.collapse = self._wrap(mrl.collapse, 'collapse', mrl)
+        mrl.output = self._wrap(mrl.output, 'output', mrl)
+        return mrl
+
+    def attach(self, nalg):
+        '''
+        instruments a `NewAlgorithm` and its MRL instance; the height and `r` are updated after every step
+        @return nalg
+        '''
+        self.attach_mrl(nalg.mrl)
+        step = nalg._step
+
+        def instrumented_step():
+            step()
+            self.height = max(self.height, max(buffer.level for buffer in nalg.buffers))
+            self.r = nalg.r
+        nalg._step = instrumented_step
+        self.r = nalg.r
+        return nalg
+
+    def as_dict(self) -> dict:
+        return {
+            'phases': {phase: {'calls': self.calls[phase], 'seconds': self.seconds[phase]} for phase in PHASES},
+            'elements_consumed': self.elements_consumed,
+            'elements_merged': self.elements_merged,
+            'height': self.height,
+            'r': self.r,
+        }
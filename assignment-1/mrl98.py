@@ -7,9 +7,16 @@ a chosen subset of full buffers. OUTPUT is invoked on the final set of full
 buffers. Different buffer collapsing policies correspond to different algorithms.
 '''
 from enum import Enum
+from heapq import merge
+from itertools import chain, repeat
 from math import ceil
-from queue import Full
-from typing import Tuple, Optional
+from operator import itemgetter
+from typing import Iterator, Tuple, Optional
+
+import numpy as np
+
+from stream import InputStream
+from summary import QuantileSummary, calculate_phi_tick
 
 Element = int
 Sequence = 'list[Element]'
@@ -102,23 +109,162 @@ class Buffer:
             return None
 
 
+class ArrayBuffer:
+    '''
+    A buffer backed by a preallocated typed array; it has the same interface as `Buffer`
+    and is used by the vectorized COLLAPSE
+    '''
+    __slots__ = ('be', 'data', 'size', 'weight', 'full', 'level')
+
+    def __init__(self, be, elements=None, dtype=np.float64):
+        '''
+        @param be: number of elements per buffer (the capacity of the preallocated array)
+        @param elements: initial elements (for testing)
+        @param dtype: type of the stored elements; must be able to hold +inf and -inf
+        '''
+        self.be = be
+        self.data = np.empty(be, dtype=dtype)
+        self.size = 0
+        self.level = 0
+        self.to_initial()
+        if elements is not None:
+            self._store(elements)
+
+    @property
+    def elements(self) -> np.ndarray:
+        '''
+        a view on the stored elements
+        '''
+        return self.data[:self.size]
+
+    def update_level(self, new_level: int):
+        '''
+        assigns a new level to a buffer, used in new_algorithm.py
+        '''
+        assert new_level >= 0, 'buffer level must be a non-negative number'
+        self.level = new_level
+
+    def populate(self, elements, is_initial:bool=False, weight:int=0, full:Fullness=Fullness.EMPTY, is_mrl98:bool=True):
+        '''
+        populate a buffer by copying `elements` into the preallocated array
+        (see `Buffer.populate` for the meaning of the parameters)
+        '''
+        self._store(elements)
+        if is_initial and is_mrl98:
+            self.weight = 1
+            self.full = Fullness.FULL
+        else:
+            self.weight = weight
+            self.full = full
+
+    def to_initial(self):
+        '''
+        sets all the properties to their initial state
+        '''
+        self.weight = 0
+        self.full = Fullness.EMPTY
+
+    def attach(self, array: np.ndarray):
+        '''
+        uses `array` (e.g. a memory-mapped one) as the storage of the elements, without copying it
+        '''
+        self.data = array
+        self.size = len(array)
+
+    def sort(self):
+        '''
+        sorts the elements of the buffer in ascending order, in place
+        '''
+        self.elements.sort()
+
+    def len(self) -> int:
+        '''
+        returns the length of the elements of the buffer
+        '''
+        return self.size
+
+    def get_elem(self, index) -> Optional[Element]:
+        '''
+        returns an element at `index` position from the buffer if this element exists; returns None otherwise
+        @param index: index to look at
+        '''
+        if index is None:
+            return plus_inf
+        if not -self.size <= index < self.size:
+            return None
+        return self.elements[index].item()
+
+    def _store(self, elements):
+        size = len(elements)
+        # the last NEW step may pad a buffer with one extra infinity
+        if size > len(self.data):
+            self.data = np.empty(size, dtype=self.data.dtype)
+        self.data[:size] = elements
+        self.size = size
+
+
+def weighted_collapse(arrays: 'list[np.ndarray]', weights: 'list[int]', be: int) -> np.ndarray:
+    '''
+    vectorized COLLAPSE: computes the same Y as `MRL98.collapse` from whole arrays
+    @param arrays: sorted elements of each buffer
+    @param weights: weight of each buffer
+    @param be: number of elements per buffer
+    @return Y as an array
+    '''
+    sum_of_weights = sum(weights)
+    min_len = sum_of_weights * be
+    offset = ceil(sum_of_weights / 2)
+    # a stable sort of the concatenation resolves ties in favour of the earlier buffer, as the k-way merge does
+    values = np.concatenate(arrays)
+    order = np.argsort(values, kind='stable')
+    values = values[order]
+    elem_weights = np.repeat(np.asarray(weights, dtype=np.int64), [len(array) for array in arrays])[order]
+    # positions (start, end] every element covers in the weighted sequence; +inf elements are handled below
+    finite = np.searchsorted(values, plus_inf, side='left')
+    ends = np.cumsum(elem_weights[:finite])
+    starts = ends - elem_weights[:finite]
+    taken = np.searchsorted(starts, min_len, side='left')
+    starts, ends = starts[:taken], ends[:taken]
+    # an element is selected if one of the positions offset + j * sum_of_weights falls into its span
+    selected = _count_positions(ends, offset, sum_of_weights) > _count_positions(starts, offset, sum_of_weights)
+    position = int(ends[-1]) if taken else 0
+    # once only +inf remains, the first buffer wins every tie and each of its steps appends +inf
+    infs = -(-(min_len - position) // weights[0]) if position < min_len else 0
+    return np.concatenate([values[:taken][selected], np.full(infs, plus_inf)])
+
+
+def _count_positions(ends: np.ndarray, offset: int, step: int) -> np.ndarray:
+    '''
+    counts the selected positions offset, offset + step, offset + 2*step, ... that are not greater than `ends`
+    '''
+    return np.where(ends >= offset, (ends - offset) // step + 1, 0)
+
+
 class MRL98:
     '''
     A class to describe the steps of MRL99 algorithm
     '''
     y_idx = 0
-    def __init__(self, input_sequence: Sequence, b: int, be:int):
+    # NEW pads the last buffer with equal numbers of +inf and -inf
+    symmetric_padding = True
+    def __init__(self, input_sequence: Sequence, b: int, be:int, vectorized:bool=False, metrics=None):
         '''
-        @param input_sequence: the original dataset of numbers
+        @param input_sequence: the original dataset of numbers: any iterable of numbers or of array chunks
+        (None to feed the data later through `self.stream`)
         @param b: number of buffers to use
         @param be: number of elements per buffer
+        @param vectorized: if True, COLLAPSE works on whole arrays (to be used with `ArrayBuffer`)
+        @param metrics: a `metrics.Metrics` to instrument NEW, COLLAPSE and OUTPUT with (None: no instrumentation)
         '''
-        self.input_sequence = input_sequence
-        self.input_seq_len = len(self.input_sequence)
+        self.stream = InputStream(input_sequence)
+        self.input_seq_len = 0 # number of elements consumed by NEW steps so far
         self.b = b # number of buffers
         self.be = be # number of elements per buffer
         self.buffers = []
         self.infs_added = 0
+        self.vectorized = vectorized
+        if metrics is not None:
+            metrics.attach_mrl(self)
 
 
     def new(self, buffer: Buffer) -> Buffer:
@@ -128,21 +274,23 @@ class MRL98:
         @return buffer: input buffer filled with values
         '''
         assert buffer.full == Fullness.EMPTY, 'the buffer should be empty'
-        assert len(self.input_sequence) >= 1, 'the input sequence must have at least one element'
-        if self.be < len(self.input_sequence):
-            buffer.populate(self.input_sequence[:self.be], is_initial=True, is_mrl98=True)
-            del self.input_sequence[:self.be]
-        else:
-            seq_len = len(self.input_sequence)
+        block = self.stream.take(self.be)
+        assert len(block) >= 1, 'the input sequence must have at least one element'
+        self.input_seq_len += len(block)
+        padding = []
+        if len(block) < self.be:
             # adding an equal number of +inf and -inf elements
-            more_elems = self.be - seq_len
+            more_elems = self.be - len(block)
             if more_elems % 2 == 1:
                 more_elems += 1
             self.infs_added += more_elems
-            infs = [plus_inf] * (more_elems // 2) + [minus_inf] * (more_elems // 2)
-            elems = self.input_sequence[:seq_len] + infs
-            buffer.populate(elems, is_initial=True, is_mrl98=True)
-            del self.input_sequence[:seq_len]
+            padding = [plus_inf] * (more_elems // 2) + [minus_inf] * (more_elems // 2)
+        # an array-backed buffer copies the block as it is
+        if isinstance(buffer, ArrayBuffer):
+            elements = np.concatenate([block, padding]) if padding else block
+        else:
+            elements = block.tolist() + padding
+        buffer.populate(elements, is_initial=True, is_mrl98=True)
         assert buffer.full == Fullness.FULL and buffer.weight == 1, 'after NEW step, resulting buffer must be marked as full and have a weight of 1'
         return buffer
 
@@ -159,21 +307,15 @@ class MRL98:
         else:
             assert all(buffer.full != Fullness.EMPTY for buffer in buffers), f'all buffers must be either full or partially full'
 
-        sequence = [] # new sequence, future Y
         sum_of_weights = 0
 
         for buffer in buffers:
             buffer.sort()
             sum_of_weights += buffer.weight
-        k = sum_of_weights # step (in the original paper's example k=9 - Fig.1)
-        i = 0 # counter
-        min_len = sum_of_weights * self.be
-        offset = ceil(sum_of_weights / 2)
-        while i < min_len:
-            minimum, buffer = self._get_min_from_buffers(buffers)
-            i += buffer.weight
-            if minimum == plus_inf or (i >= offset and self._divides(i-buffer.weight, i, offset+k*len(sequence))):
-                sequence.append(minimum)
+        if self.vectorized:
+            sequence = weighted_collapse([buffer.elements for buffer in buffers], [buffer.weight for buffer in buffers], self.be)
+        else:
+            sequence = self._collapse_merge(buffers, sum_of_weights)
 
         for buffer in buffers:
             buffer.to_initial()
@@ -184,6 +326,27 @@ class MRL98:
         return y
 
 
+    def _collapse_merge(self, buffers: 'list[Buffer]', sum_of_weights: int) -> Sequence:
+        '''
+        selects the elements of Y by merging sorted buffers one element at a time
+        @param buffers: list of sorted buffers
+        @param sum_of_weights: sum of weights of `buffers`
+        @return sequence: Y
+        '''
+        sequence = []
+        k = sum_of_weights # step (in the original paper's example k=9 - Fig.1)
+        i = 0 # counter
+        min_len = sum_of_weights * self.be
+        offset = ceil(sum_of_weights / 2)
+        for minimum, weight in self._merge_buffers(buffers):
+            if i >= min_len:
+                break
+            i += weight
+            if minimum == plus_inf or (i >= offset and self._divides(i-weight, i, offset+k*len(sequence))):
+                sequence.append(minimum)
+        return sequence
+
+
     def output(self, phi: float, buffers: 'list[Buffer]') -> Element:
         '''
         OUTPUT step
@@ -203,26 +366,46 @@ class MRL98:
 
     def _divides(self, start: Element, end: Element, divider: int) -> bool:
         '''
-        checks if any number from range [`start`, `end`] divides by `divider` without a remainder
+        checks if any number from range [`start`, `end`] divides by `divider` without a remainder;
+        the largest multiple of `divider` not exceeding `end` is the only candidate, so this is O(1)
+        '''
+        return end // divider * divider >= start
+
+
+    def _merge_buffers(self, buffers: 'list[Buffer]') -> 'Iterator[Tuple[Element, int]]':
+        '''
+        k-way merge of sorted buffers (heap-driven)
+        @param buffers: a list of sorted buffers
+        @return iterator over (element, weight of its buffer) in ascending order; ties are resolved
+        in favour of the buffer that comes first in `buffers`, and an exhausted buffer keeps yielding +inf
+        '''
+        return merge(*(self._weighted(buffer) for buffer in buffers), key=itemgetter(0))
+
+
+    def _weighted(self, buffer: Buffer) -> 'Iterator[Tuple[Element, int]]':
+        '''
+        returns an iterator over (element, weight) for every element of a buffer and then (+inf, weight) forever
+        '''
+        weight = buffer.weight
+        return chain(zip(buffer.elements, repeat(weight)), repeat((plus_inf, weight)))
+
+
+    def summary(self, buffers: 'list[Buffer]') -> QuantileSummary:
+        '''
+        builds a queryable summary of the buffers; unlike OUTPUT, it does not modify them
+        @param buffers: a list of buffers marked as full or partially full
+        @return summary that answers quantile, rank and CDF queries
         '''
-        for num in range(start, end+1):
-            if num % divider == 0:
-                return True
-        return False
+        assert all(buffer.full != Fullness.EMPTY for buffer in buffers), f'all buffers must be either full or partially full'
+        return QuantileSummary(buffers, self.be, self._calculate_beta(), self.symmetric_padding)
 
 
-    def _get_min_from_buffers(self, buffers: 'list[Buffer]') -> Tuple[Element, Buffer]:
+    def _calculate_beta(self) -> float:
         '''
-        returns the min from all buffers with consideration that that min wasn't returned before
-        @param buffers: a list of buffers
-        @return minimum: the min Element
-        @return buffer: the buffer that minimum was found in
+        calculates beta from the paper: (N + number of added infinities) / N
         '''
-        elements = map(lambda i, buffer: (i, buffer.get_elem(buffer.cursor)), range(len(buffers)), buffers)
-        buffer_number, minimum = min(elements, key=lambda elem: elem[1])
-        buffer = buffers[buffer_number]
-        buffer.incr_cursor()
-        return minimum, buffer
+        # nothing has been consumed when buffers are filled by hand
+        return (self.input_seq_len + self.infs_added) / self.input_seq_len if self.input_seq_len else 1
 
 
     def _calculate_phi_tick(self, phi: float):
@@ -231,10 +414,8 @@ class MRL98:
         @param phi: original percentile
         @return phi_tick: phi'
         '''
-        self.beta = (self.input_seq_len + self.infs_added) / self.input_seq_len
-        assert self.beta >=1, 'beta must be >= 1'
-        phi_tick = (2 * phi + self.beta - 1) / (2 * self.beta)
-        return phi_tick
+        self.beta = self._calculate_beta()
+        return calculate_phi_tick(phi, self.beta, self.symmetric_padding)
 
 if __name__ == '__main__':
     pass
\ No newline at end of file
@@ -10,47 +10,53 @@ variable rate of sampling.
 '''
 
 
-import random
-from typing import Optional
+import numpy as np
 
-from mrl98 import MRL98, Buffer, Element, Sequence, Fullness
+from mrl98 import MRL98, Buffer, Sequence, Fullness
 
 class MRL99(MRL98):
-    def __init__(self, input_sequence: Sequence, b: int, be: int):
-        super().__init__(input_sequence, b, be)
+    # the missing elements of the last (partially full) buffer are taken as +inf by COLLAPSE
+    symmetric_padding = False
 
-    def _choose_one_from_next_r(self, sequence: Sequence, r: int) -> Element:
+    def __init__(self, input_sequence: Sequence, b: int, be: int, vectorized: bool = False, seed=None, metrics=None):
         '''
-        chooses one element from `r` next elements of some sequence; the element will be removed from the sequence
-        @param sequence: sequence to sample from
+        @param seed: seed (or np.random.SeedSequence) of the random generator used for sampling
+        '''
+        super().__init__(input_sequence, b, be, vectorized, metrics)
+        self.rng = np.random.default_rng(seed)
+
+    def _choose_one_from_each_r(self, block: np.ndarray, r: int) -> np.ndarray:
+        '''
+        chooses one element uniformly at random from every `r` consecutive elements of a block
+        (the last group may be shorter)
+        @param block: elements to sample from; it is not modified
         @param r: sampling rate
-        @returns element: chosen element from the sequence
+        @returns sample: ceil(len(block) / r) chosen elements
         '''
-        # randomly generate index
-        index = random.randint(0, min(r, len(sequence)-1))
-        element = sequence[index]
-        del sequence[index]
-        return element
+        starts = np.arange(0, len(block), r)
+        sizes = np.minimum(r, len(block) - starts)
+        return block[starts + self.rng.integers(0, sizes)]
 
     def new(self, buffer: Buffer, r: int) -> Buffer:
         '''
-        NEW step
+        NEW step: samples `self.be` elements out of the next `self.be` * `r` input elements
         @param buffer: an empty buffer to fill with next `self.be` values
         @param r: an integer that represent the sampling rate (see the original paper MRL99)
         @return buffer: input buffer filled with values
         '''
         assert buffer.full == Fullness.EMPTY, 'the buffer should be empty'
-        assert len(self.input_sequence) >= 1, 'the input sequence must have at least one element'
-        # if original sequence still has enough elements
-        if self.be * r < len(self.input_sequence):
-            population = [self._choose_one_from_next_r(self.input_sequence, r) for _ in range(self.be)]
+        block = self.stream.take(self.be * r)
+        assert len(block) >= 1, 'the input sequence must have at least one element'
+        population = self._choose_one_from_each_r(block, r)
+        if not self.vectorized:
+            population = population.tolist()
+        self.input_seq_len += len(block)
+        if len(block) == self.be * r:
             buffer.populate(population, is_mrl98=False, weight=r, full=Fullness.FULL)
         else:
-            population = [self._choose_one_from_next_r(self.input_sequence, r) for _ in range(len(self.input_sequence))]
+            # COLLAPSE and OUTPUT take the positions this buffer does not cover as +inf
+            self.infs_added += self.be * r - len(block)
             buffer.populate(population, is_mrl98=False, weight=r, full=Fullness.PARTIAL)
         assert (buffer.full == Fullness.FULL or buffer.full == Fullness.PARTIAL), 'after NEW step, resulting buffer must be marked as full or partially full'
         assert buffer.weight == r, f'after NEW step, resulting buffer must have weight r={r}'
         return buffer
-
-    def _calculate_phi_tick(self, phi: float) -> float:
-        return phi
\ No newline at end of file
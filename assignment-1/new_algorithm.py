@@ -1,6 +1,13 @@
-from numpy import empty
-from mrl98 import Buffer, Element, Fullness, Sequence, MRL98, plus_inf, Fullness
+from typing import Iterable, Optional
+
+import numpy as np
+
+from kll import KLL
+from mrl98 import ArrayBuffer, Buffer, Element, Fullness, Sequence, MRL98
 from mrl99 import MRL99
+from metrics import Metrics
+from scheduler import BufferPool, get_policy
+from summary import QuantileSummary
 
 '''
 This .py file implements the third (most efficient at 1998) version: New Algorithm:
@@ -15,59 +22,163 @@ Assign the output buffer, level e + 1"
 
 class NewAlgorithm:
     b = 3
-    def __init__(self, mrl_type: str, input_sequence: Sequence, b: int, be: int, phi: float):
+    def __init__(self, mrl_type: str, input_sequence: Optional[Iterable], b: int, be: int, phi: float, vectorized: bool = False, seed=None,
+                 metrics: Optional[Metrics] = None, policy: str = 'new'):
+        '''
+        @param mrl_type: 98 or 99 (with sampling)
+        @param input_sequence: any iterable of numbers or of array chunks (None to feed the data with `update`)
+        @param b: number of buffers to use
+        @param be: number of elements per buffer
+        @param phi: the quantile that `run` returns
+        @param vectorized: use array-backed buffers with the vectorized COLLAPSE
+        @param seed: seed of the sampling of MRL99
+        @param metrics: a `metrics.Metrics` to instrument the sketch with
+        @param policy: collapse policy, a key of `scheduler.POLICIES`
+        '''
         assert '99' in mrl_type or '98' in mrl_type, 'mrl_type must contain 98 or 99'
-        self.mrl = MRL98(input_sequence, b, be) if '98' in mrl_type else MRL99(input_sequence, b, be)
+        # the variant is resolved once: only MRL99 samples (r is not None)
+        self.sampled = '99' in mrl_type
+        self.mrl = MRL99(input_sequence, b, be, vectorized, seed) if self.sampled else MRL98(input_sequence, b, be, vectorized)
         # for MRL98 r is always 1 and not used
-        self.r = 2 if '99' in mrl_type else None
-        self.input_sequence = input_sequence
+        self.r = 1 if self.sampled else None
+        # input is pulled from the stream `self.be` elements at a time, see `run` and `update`
+        self.stream = self.mrl.stream
         self.b = b
         self.mrl_type = mrl_type
         self.be = be
         self.phi = phi
+        # array-backed buffers with the vectorized COLLAPSE
+        self.vectorized = vectorized
         self.buffers: list[Buffer] = []
-        self.l = 0 # at any time, the smallest level among all self.buffers with full==True (!)
         self._create_buffers()
+        self.pool = BufferPool(self.buffers)
+        self.policy = get_policy(policy, b, 1 if self.sampled else 0)
+        # opt-in instrumentation, see metrics.py
+        if metrics is not None:
+            metrics.attach(self)
 
     def _create_buffers(self):
+        buffer_type = ArrayBuffer if self.vectorized else Buffer
         for _ in range(self.b):
-            self.buffers.append(Buffer(self.be))
+            self.buffers.append(buffer_type(self.be))
 
-    def _count_empty_buffers(self) -> 'list[Buffer]':
-        empty_buffers = []
-        for buffer in self.buffers:
-            if not buffer.full == Fullness.FULL:
-                empty_buffers.append(buffer)
-        return empty_buffers, len(empty_buffers)
+    @property
+    def l(self) -> int:
+        '''
+        the smallest level among all self.buffers with full==True (!)
+        '''
+        return self.pool.lowest_full_level()
 
-    def _update_l(self):
-        self.l = min(self.buffers, key=lambda buffer: buffer.level if buffer.full == Fullness.FULL else plus_inf).level
+    def _new(self, buffer: Buffer):
+        self.mrl.new(buffer) if self.r is None else self.mrl.new(buffer, self.r)
 
     def _step(self):
-        empty_buffers, empty_buffers_amount = self._count_empty_buffers()
-        if empty_buffers_amount == 1:
-            # invoke NEW on the empty buffer and assign it level `self.l`
-            buffer = empty_buffers[0]
-            self.mrl.new(buffer) if '98' in self.mrl_type else self.mrl.new(buffer, self.r)
-            buffer.update_level(self.l)
-        elif empty_buffers_amount >= 2:
-            # invoke NEW on each and assign level 0 to each one
-            for buffer in empty_buffers:
-                self.mrl.new(buffer) if '98' in self.mrl_type else self.mrl.new(buffer, self.r)
-                buffer.update_level(0 if '98' in self.mrl_type else 1)
+        levels = self.policy.new_levels(self.pool)
+        if levels:
+            # invoke NEW on empty buffers and assign them the levels chosen by the policy
+            for level in levels:
+                # the input may end before every empty buffer is filled
+                if self.stream.exhausted:
+                    break
+                buffer = self.pool.empty[0]
+                self._new(buffer)
+                self.pool.filled(buffer, level)
         else:
-            # invoke COLLAPSE on the set of buffers with level `self.l` and assign level `self.l`+1 to the output buffer
-            min_buffers = list(filter(lambda buffer: buffer.level == self.l, self.buffers))
-            output_buffer = self.mrl.collapse(min_buffers)
-            output_buffer.update_level(self.l + 1)
+            # invoke COLLAPSE on the buffers chosen by the policy (for the New Algorithm: level `self.l`)
+            buffers = self.policy.collapse_buffers(self.pool)
+            # a partially full buffer can only come from a merged sketch, it is collapsed like in OUTPUT
+            output_buffer = self.mrl.collapse(buffers, for_output=any(buffer.full != Fullness.FULL for buffer in buffers))
+            level = self.policy.collapsed_level(buffers)
+            height = max(self.pool.levels)
+            self.pool.collapsed(buffers, output_buffer, level)
             # tree height increases
-            if '99' in self.mrl_type:
+            if self.sampled and level > height:
                 self.r *= 2
-        self._update_l()
 
-    def run(self):
-        while len(self.input_sequence) > 0:
+    def _has_input_for_step(self) -> bool:
+        '''
+        checks if the next step can run without reaching the end of the input seen so far
+        '''
+        new_amount = len(self.policy.new_levels(self.pool))
+        sampling_rate = self.r if self.sampled else 1
+        return new_amount == 0 or self.stream.has_more_than(new_amount * self.be * sampling_rate)
+
+    def update(self, values):
+        '''
+        push-style ingestion for live feeds: steps run only while they do not reach the end of the
+        values received so far, the last (padded or partial) buffer is filled by `run`
+        @param values: an iterable of numbers or of array chunks
+        '''
+        self.stream.extend(values)
+        while self._has_input_for_step():
             self._step()
-        
-        result = self.mrl.output(self.phi, self.buffers)
-        return result
\ No newline at end of file
+
+    def ingest(self, limit: Optional[int] = None):
+        '''
+        consumes the rest of the input
+        @param limit: if given, stops as soon as at least `limit` more elements are consumed
+        '''
+        stop = None if limit is None else self.mrl.input_seq_len + limit
+        while not self.stream.exhausted and (stop is None or self.mrl.input_seq_len < stop):
+            self._step()
+
+    def summary(self) -> QuantileSummary:
+        '''
+        consumes the rest of the input and returns a summary that answers any number of
+        quantile, rank and CDF queries without modifying the buffers
+        '''
+        self.ingest()
+        return self.mrl.summary(self._filled_buffers())
+
+    def run(self):
+        '''
+        consumes the rest of the input and returns the element at `self.phi`
+        '''
+        self.ingest()
+        result = self.mrl.output(self.phi, self._filled_buffers())
+        return result
+
+    def merge(self, other: 'NewAlgorithm'):
+        '''
+        merges the state of another sketch into this one. The rest of the other sketch's input is
+        ingested first; its buffers are copied, and buffers of the lowest levels are collapsed
+        (as in the New Algorithm) until at most `self.b` buffers are full
+        @param other: a sketch of the same type with the same number of elements per buffer
+        '''
+        assert self.sampled == other.sampled, 'only sketches of the same type can be merged'
+        assert self.be == other.be, 'sketches must have the same number of elements per buffer'
+        other.ingest()
+        pool = BufferPool(self.buffers + [self._copy_buffer(buffer) for buffer in other._filled_buffers()])
+        while pool.filled_count() > self.b:
+            # only the excess is collapsed (the lowest buffers first), so OUTPUT still gets b >= 2 buffers
+            buffers = self.policy.collapse_buffers(pool)[:pool.filled_count() - self.b + 1]
+            output_buffer = self.mrl.collapse(buffers, for_output=True)
+            pool.collapsed(buffers, output_buffer, self.policy.collapsed_level(buffers))
+        filled_buffers = [buffer for buffer in pool.buffers if buffer.full != Fullness.EMPTY]
+        self.buffers[:] = filled_buffers + pool.empty[:self.b - len(filled_buffers)]
+        self.pool.reindex()
+        self.mrl.input_seq_len += other.mrl.input_seq_len
+        self.mrl.infs_added += other.mrl.infs_added
+        if self.sampled:
+            self.r = max(self.r, other.r)
+        return self
+
+    def _copy_buffer(self, buffer: Buffer) -> Buffer:
+        copy = ArrayBuffer(self.be) if self.vectorized else Buffer(self.be)
+        elements = buffer.elements.tolist() if isinstance(buffer.elements, np.ndarray) else list(buffer.elements)
+        copy.populate(elements, weight=buffer.weight, full=buffer.full)
+        copy.update_level(buffer.level)
+        return copy
+
+    def _filled_buffers(self) -> 'list[Buffer]':
+        return [buffer for buffer in self.buffers if buffer.full != Fullness.EMPTY]
+
+def create_sketch(mrl_type: str, input_sequence: Optional[Iterable], b: Optional[int], be: int, phi: float,
+                  vectorized: bool = False, seed=None, metrics: Optional[Metrics] = None, policy: str = 'new'):
+    '''
+    a `NewAlgorithm` for mrl_type 98 or 99, a `kll.KLL` with k = `be` for mrl_type 'kll' (b, vectorized,
+    metrics and policy only apply to the New Algorithm)
+    '''
+    if mrl_type == 'kll':
+        return KLL(input_sequence, be, phi, seed)
+    return NewAlgorithm(mrl_type, input_sequence, b, be, phi, vectorized, seed, metrics, policy)
@@ -0,0 +1,55 @@
+'''
+Sharded quantile engine: every shard of the input is summarized by its own
+New Algorithm sketch in a separate process, then the sketches are merged.
+'''
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Optional
+
+import numpy as np
+
+from new_algorithm import NewAlgorithm, create_sketch
+
+
+def split(data: np.ndarray, shards: int) -> 'list[np.ndarray]':
+    '''
+    splits an array into `shards` contiguous parts of (almost) equal size
+    '''
+    assert shards >= 1, 'there must be at least one shard'
+    return np.array_split(data, shards)
+
+
+def _build_sketch(args) -> NewAlgorithm:
+    '''
+    ingests one shard; runs in a worker process
+    '''
+    mrl_type, source, b, be, phi, vectorized, seed, policy = args
+    nalg = create_sketch(mrl_type, source, b, be, phi, vectorized, seed, policy=policy)
+    nalg.ingest()
+    return nalg
+
+
+def sharded_sketch(mrl_type: str, shards: 'list[Iterable]', b: int, be: int, phi: float,
+                   workers: Optional[int] = None, vectorized: bool = False, seed: Optional[int] = None,
+                   policy: str = 'new') -> NewAlgorithm:
+    '''
+    builds one sketch per shard over a process pool and merges them
+    @param mrl_type: 98, 99 or kll
+    @param shards: picklable input sources, one per sketch (see `split`)
+    @param b: number of buffers to use
+    @param be: number of elements per buffer
+    @param phi: the quantile that `run` of the merged sketch returns
+    @param workers: number of processes (number of CPUs by default)
+    @param vectorized: use array-backed buffers with the vectorized COLLAPSE
+    @param seed: seed for MRL99 sampling; every shard gets an independent stream spawned from it
+    @param policy: collapse policy of every shard and of the merges, a key of `scheduler.POLICIES`
+    @return merged sketch; call `run`, `summary` or keep updating it
+    '''
+    assert len(shards) >= 1, 'there must be at least one shard'
+    seeds = np.random.SeedSequence(seed).spawn(len(shards))
+    jobs = [(mrl_type, shard, b, be, phi, vectorized, shard_seed, policy) for shard, shard_seed in zip(shards, seeds)]
+    with ProcessPoolExecutor(workers) as pool:
+        sketches = pool.map(_build_sketch, jobs)
+        merged = next(sketches)
+        for sketch in sketches:
+            merged.merge(sketch)
+    return merged
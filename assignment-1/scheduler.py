@@ -0,0 +1,162 @@
+'''
+Buffer scheduling for `NewAlgorithm`.
+
+`BufferPool` indexes the buffers of a sketch: a stack of the empty ones and, for
+every level, the list of filled ones, so a step does not rescan all buffers.
+
+A collapse policy decides what the next step is: which NEW operations to run
+(and the levels of the filled buffers) or which buffers to COLLAPSE. The policies
+of MRL98 (section 3) share the same buffer pool, so they can be compared on
+memory and throughput:
+- `NewAlgorithmPolicy`: the New Algorithm of MRL98 (section 4)
+- `MunroPatersonPolicy`: binary merges of two buffers of the same level
+- `AlsabtiRankaSinghPolicy`: half of the buffers take leaves that are collapsed all at once
+'''
+from mrl98 import Buffer, Fullness
+
+
+class BufferPool:
+    '''
+    Empty buffers and filled (full or partially full) buffers by level
+    '''
+    def __init__(self, buffers: 'list[Buffer]'):
+        self.buffers = buffers
+        self.reindex()
+
+    def reindex(self):
+        '''
+        rebuilds the index after the buffers were changed from the outside (merge, load)
+        '''
+        self.empty = [buffer for buffer in self.buffers if buffer.full == Fullness.EMPTY]
+        self.levels = {}
+        for buffer in self.buffers:
+            if buffer.full != Fullness.EMPTY:
+                self.levels.setdefault(buffer.level, []).append(buffer)
+
+    def filled(self, buffer: Buffer, level: int):
+        '''
+        moves a buffer filled by NEW from the empty ones to `level`
+        '''
+        self.empty.remove(buffer)
+        buffer.update_level(level)
+        self.levels.setdefault(level, []).append(buffer)
+
+    def collapsed(self, buffers: 'list[Buffer]', output: Buffer, level: int):
+        '''
+        the COLLAPSE of `buffers` stored its output in `output` and emptied the others
+        '''
+        for buffer in buffers:
+            at_level = self.levels[buffer.level]
+            at_level.remove(buffer)
+            if not at_level:
+                del self.levels[buffer.level]
+            if buffer is not output:
+                self.empty.append(buffer)
+        output.update_level(level)
+        self.levels.setdefault(level, []).append(output)
+
+    def sorted_levels(self) -> 'list[int]':
+        # there are at most b levels
+        return sorted(self.levels)
+
+    def lowest_full_level(self) -> int:
+        '''
+        the smallest level among the full buffers (0 if there are none)
+        '''
+        for level in self.sorted_levels():
+            if any(buffer.full == Fullness.FULL for buffer in self.levels[level]):
+                return level
+        return 0
+
+    def filled_count(self) -> int:
+        return len(self.buffers) - len(self.empty)
+
+
+def _lowest_pair(pool: BufferPool) -> 'list[Buffer]':
+    '''
+    two buffers of the lowest level that has two of them, the two lowest buffers otherwise
+    '''
+    levels = pool.sorted_levels()
+    for level in levels:
+        if len(pool.levels[level]) >= 2:
+            return pool.levels[level][:2]
+    return [buffer for level in levels for buffer in pool.levels[level]][:2]
+
+
+class NewAlgorithmPolicy:
+    '''
+    If there is exactly one empty buffer, NEW fills it at the smallest level L of the full buffers.
+    If there are more, NEW fills each at level `base_level`. Otherwise the buffers of level L are
+    collapsed (with the next level if L has only one buffer) into level max + 1.
+    '''
+    name = 'new'
+
+    def __init__(self, b: int, base_level: int = 0):
+        self.b = b
+        self.base_level = base_level
+
+    def new_levels(self, pool: BufferPool) -> 'list[int]':
+        '''
+        @return levels of the NEW operations of the next step; empty if the next step is a COLLAPSE
+        '''
+        if len(pool.empty) == 1:
+            return [pool.lowest_full_level()]
+        return [self.base_level] * len(pool.empty)
+
+    def collapse_buffers(self, pool: BufferPool) -> 'list[Buffer]':
+        '''
+        @return buffers to collapse (at least two)
+        '''
+        levels = pool.sorted_levels()
+        buffers = list(pool.levels[levels[0]])
+        if len(buffers) < 2 and len(levels) > 1:
+            buffers += pool.levels[levels[1]]
+        return buffers
+
+    def collapsed_level(self, buffers: 'list[Buffer]') -> int:
+        return max(buffer.level for buffer in buffers) + 1
+
+
+class MunroPatersonPolicy(NewAlgorithmPolicy):
+    '''
+    Munro-Paterson: every NEW fills a buffer at level 0 and COLLAPSE always merges two buffers of the same level
+    '''
+    name = 'munro-paterson'
+
+    def new_levels(self, pool: BufferPool) -> 'list[int]':
+        return [self.base_level] * len(pool.empty)
+
+    def collapse_buffers(self, pool: BufferPool) -> 'list[Buffer]':
+        return _lowest_pair(pool)
+
+
+class AlsabtiRankaSinghPolicy(NewAlgorithmPolicy):
+    '''
+    Alsabti-Ranka-Singh: NEW fills b/2 buffers at level 0, which are collapsed all at once into the other half
+    of the buffers. When that half is full too, its lowest level is collapsed (the original algorithm
+    knows N and outputs at this point).
+    '''
+    name = 'alsabti-ranka-singh'
+
+    def __init__(self, b: int, base_level: int = 0):
+        super().__init__(b, base_level)
+        self.leaves = max(2, b // 2)
+
+    def new_levels(self, pool: BufferPool) -> 'list[int]':
+        leaves = len(pool.levels.get(self.base_level, []))
+        return [self.base_level] * min(len(pool.empty), max(0, self.leaves - leaves))
+
+    def collapse_buffers(self, pool: BufferPool) -> 'list[Buffer]':
+        leaves = pool.levels.get(self.base_level, [])
+        if len(leaves) >= 2:
+            return list(leaves)
+        levels = [level for level in pool.sorted_levels() if len(pool.levels[level]) >= 2]
+        return list(pool.levels[levels[0]]) if levels else _lowest_pair(pool)
+
+
+POLICIES = {policy.name: policy for policy in [NewAlgorithmPolicy, MunroPatersonPolicy, AlsabtiRankaSinghPolicy]}
+
+
+def get_policy(name: str, b: int, base_level: int = 0) -> NewAlgorithmPolicy:
+    assert name in POLICIES, f'policy must be from {list(POLICIES)}'
+    return POLICIES[name](b, base_level)
@@ -0,0 +1,209 @@
+'''
+Choosing the number of buffers b and the number of elements per buffer k.
+
+New Algorithm (MRL98, section 4): with b buffers the collapse tree of height h
+has L = C(b + h - 2, h - 1) leaves, so it summarizes at most k * L elements.
+By Lemma 1 the rank error is at most (W - C - 1) / 2 + w_max, where W is the
+total weight of all COLLAPSE outputs, C their number and w_max the weight of
+the OUTPUT. Every leaf is under at most h - 2 COLLAPSEs before OUTPUT, so
+W - C - 1 <= (h - 2) * L and w_max <= L, and the error is at most h * L / 2.
+An eps-approximate answer for N = k * L elements therefore needs k >= h / (2 * eps).
+
+MRL99 (as `NewAlgorithm` runs it) streams all N elements: NEW keeps one random
+element out of every r, and r doubles whenever the collapse tree grows higher.
+`mrl99_phases` replays that schedule on buffer levels only, which gives the
+final tree height and the final rate r_max for (b, k, N). The weighted form of
+Lemma 1 bounds the error of the buffers by h / (2k), as for MRL98, with h the
+number of COLLAPSEs above a leaf plus 2. Every group of r elements contributes
+one independent term of range r to the rank of any value. By Hoeffding, the
+sampling error is within eps2 with probability at least 1 - delta if
+r_max * ln(2 / delta) / (2 * eps2^2) <= N. So eps splits into eps1 = h / (2k)
+and eps2 = eps - eps1, and N (an upper bound is enough) must be known.
+
+KLL (kll.py) needs no N either: its largest rank error over all quantiles is
+about 1.5 / k (measured on 2e5 normal elements for k from 50 to 800), so
+k = 2 / eps leaves a margin.
+
+Both solvers minimize the memory b * k and memoize their results. For small N
+(or small eps) the sample is not much smaller than the input and MRL99 needs
+more memory than MRL98; `solve` then returns the MRL98 configuration.
+'''
+from functools import lru_cache
+from math import ceil, comb, log
+from typing import Iterator, Optional, Tuple
+
+B_MAX = 64
+DELTA = 1e-4
+KLL_ERROR = 2
+
+
+@lru_cache(maxsize=None)
+def solve_new_algorithm(e: float, N: int, b_max: int = B_MAX) -> Tuple[int, int]:
+    '''
+    memory-minimizing parameters of the New Algorithm without sampling
+    @param e: allowed error rate (rank error / N)
+    @param N: number of elements, or an upper bound on it
+    @param b_max: largest number of buffers to consider
+    @return b: number of buffers
+    @return k: number of elements per buffer
+    '''
+    assert 0 < e < 1, 'e must be from (0, 1)'
+    assert N >= 1, 'N must be a positive number'
+    best = None
+    for b in range(2, b_max + 1):
+        h = 1
+        while True:
+            k_capacity = ceil(N / comb(b + h - 2, h - 1))
+            k_error = ceil(h / (2 * e))
+            k = max(k_capacity, k_error)
+            if best is None or (b * k, b) < (best[0] * best[1], best[0]):
+                best = (b, k)
+            # a higher tree only needs larger k from here on
+            if k_error >= k_capacity:
+                break
+            h += 1
+    return best
+
+
+def sample_size(e: float, delta: float = DELTA) -> int:
+    '''
+    size of a uniform sample whose quantiles are within `e` of the true ones with probability 1 - `delta`
+    '''
+    assert 0 < e < 1 and 0 < delta < 1, 'e and delta must be from (0, 1)'
+    return ceil(log(2 / delta) / (2 * e ** 2))
+
+
+def mrl99_phases(b: int, base_level: int = 1) -> Iterator[Tuple[int, int, int]]:
+    '''
+    replays the steps of `scheduler.NewAlgorithmPolicy` for MRL99 on the levels of the buffers only;
+    the steps do not depend on k, so one replay serves every k
+    @yield h: number of COLLAPSEs above a leaf plus 2 (OUTPUT and the leaf) while the rate is r
+    @yield r: sampling rate of NEW, doubled whenever the tree grows higher
+    @yield units: k * units elements are consumed by the end of the phase
+    '''
+    counts = {} # number of full buffers per level
+    units, r, top, full = 0, 1, base_level, 0
+    while True:
+        empty = b - full
+        if empty:
+            # one empty buffer gets the smallest level, more of them the base level
+            level, n = (min(counts), 1) if empty == 1 else (base_level, empty)
+            counts[level] = counts.get(level, 0) + n
+            full += n
+            units += n * r
+            continue
+        lowest = sorted(counts)[:2]
+        taken = lowest[:1] if counts[lowest[0]] >= 2 else lowest
+        level = taken[-1] + 1
+        if level > top:
+            yield top - base_level + 2, r, units
+            top, r = level, r * 2
+        full -= sum(counts.pop(taken_level) for taken_level in taken) - 1
+        counts[level] = counts.get(level, 0) + 1
+
+
+def mrl99_schedule(b: int, k: int, N: int) -> Tuple[int, int]:
+    '''
+    @return h and r of MRL99 with b buffers of k elements after N elements (see `mrl99_phases`)
+    '''
+    for h, r, units in mrl99_phases(b):
+        if k * units >= N:
+            return h, r
+
+
+def _mrl99_feasible(e: float, N: int, delta: float, k: int, phases: list, replay: Iterator) -> bool:
+    '''
+    whether b buffers of k elements meet both bounds
+    @param phases: the phases of `replay` (`mrl99_phases` of b) so far, extended as needed
+    '''
+    index = 0
+    while True:
+        if index == len(phases):
+            phases.append(next(replay))
+        h, r, units = phases[index]
+        if h > 2 * e * k:
+            # the buffers alone exceed e, and the tree only grows higher
+            return False
+        if k * units >= N:
+            break
+        index += 1
+    e1 = h / (2 * k)
+    if r == 1:
+        # nothing was sampled
+        return True
+    return e1 < e and r * sample_size(e - e1, delta) <= N
+
+
+@lru_cache(maxsize=None)
+def solve_mrl99(e: float, N: int, delta: float = DELTA, b_max: int = B_MAX) -> Tuple[int, int]:
+    '''
+    memory-minimizing parameters of the New Algorithm with sampling (MRL99) for its rate-doubling schedule
+    @param e: allowed error rate (rank error / N)
+    @param N: number of elements, or an upper bound on it
+    @param delta: allowed probability to exceed the error rate
+    @param b_max: largest number of buffers to consider
+    @return b: number of buffers
+    @return k: number of elements per buffer
+    '''
+    assert 0 < e < 1, 'e must be from (0, 1)'
+    assert N is not None and N >= 1, 'MRL99 needs an upper bound on the number of elements'
+    best = None
+    for b in range(2, b_max + 1):
+        # h >= 2, so k >= 1 / e
+        low = ceil(1 / e)
+        # a larger k than this needs more memory than the best so far
+        limit = None if best is None else (best[0] * best[1]) // b
+        if limit is not None and limit < low:
+            break
+        phases, replay = [], mrl99_phases(b)
+        high = low
+        while not _mrl99_feasible(e, N, delta, high, phases, replay):
+            if limit is not None and high >= limit:
+                high = None
+                break
+            high = high * 2 if limit is None else min(high * 2, limit)
+        if high is None:
+            continue
+        # feasibility only gets easier with larger k: a lower tree and a smaller rate
+        while low < high:
+            middle = (low + high) // 2
+            if _mrl99_feasible(e, N, delta, middle, phases, replay):
+                high = middle
+            else:
+                low = middle + 1
+        if best is None or (b * high, b) < (best[0] * best[1], best[0]):
+            best = (b, high)
+    return best
+
+
+def solve_kll(e: float) -> int:
+    '''
+    capacity k of the top compactor of a KLL sketch for the error rate `e`
+    '''
+    assert 0 < e < 1, 'e must be from (0, 1)'
+    return ceil(KLL_ERROR / e)
+
+
+def solve(mrl_type: str, e: float, N: Optional[int] = None, delta: float = DELTA) -> dict:
+    '''
+    parameters for `new_algorithm.create_sketch`
+    @param mrl_type: 98, 99 or kll
+    @param e: allowed error rate
+    @param N: the number of elements or an upper bound on it (required for MRL98 and MRL99)
+    @param delta: allowed probability to exceed the error rate (MRL99 only)
+    @return {'b': number of buffers, 'k': number of elements per buffer, 'mrl_type': the variant to run};
+    for KLL b is None and k the capacity of the top compactor. For MRL99 the variant is 98 when sampling
+    cannot beat the memory of the deterministic New Algorithm (small N or small e)
+    '''
+    assert '99' in mrl_type or '98' in mrl_type or mrl_type == 'kll', 'mrl_type must contain 98 or 99, or be kll'
+    if mrl_type == 'kll':
+        b, k = None, solve_kll(e)
+    elif '98' in mrl_type:
+        assert N is not None, 'MRL98 needs an upper bound on the number of elements'
+        b, k = solve_new_algorithm(e, N)
+    else:
+        b, k = solve_mrl99(e, N, delta)
+        deterministic = solve_new_algorithm(e, N)
+        if deterministic[0] * deterministic[1] <= b * k:
+            (b, k), mrl_type = deterministic, '98'
+    return {'b': b, 'k': k, 'mrl_type': mrl_type}
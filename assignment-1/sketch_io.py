@@ -0,0 +1,141 @@
+'''
+Compact on-disk format of a `NewAlgorithm` sketch, used to checkpoint long ingests
+and to move partial sketches between machines.
+
+Layout (little-endian):
+    8 bytes     magic b'MRLSKTCH'
+    uint32      format version
+    uint32      length of the header
+    header      JSON: parameters, counters, the state of the MRL99 random generator
+                and per-buffer level/weight/fullness/size
+    padding     zeros up to a multiple of 8 bytes
+    payload     float64 elements of every buffer, then the elements that were
+                read from the input but not consumed by NEW yet
+
+The payload is a raw typed array, so it can be memory-mapped on load.
+'''
+import json
+import os
+import struct
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+import numpy as np
+
+from mrl98 import ArrayBuffer, Fullness
+from new_algorithm import NewAlgorithm
+
+MAGIC = b'MRLSKTCH'
+VERSION = 1
+DTYPE = '<f8'
+PREFIX = struct.Struct('<II')
+
+
+def save_sketch(nalg: NewAlgorithm, path: Union[str, Path]):
+    '''
+    writes the full state of a sketch; the file is replaced atomically
+    @param nalg: a sketch (it is not modified)
+    @param path: file to write
+    '''
+    arrays = [np.asarray(buffer.elements if buffer.full != Fullness.EMPTY else [], dtype=DTYPE) for buffer in nalg.buffers]
+    pending = nalg.stream.buffered().astype(DTYPE)
+    header = {
+        'mrl_type': nalg.mrl_type,
+        'b': nalg.b,
+        'be': nalg.be,
+        'phi': nalg.phi,
+        'vectorized': nalg.vectorized,
+        'l': nalg.l,
+        'policy': nalg.policy.name,
+        'r': nalg.r,
+        # the sampling of MRL99 goes on with the same random numbers after `load_sketch`
+        'rng': nalg.mrl.rng.bit_generator.state if nalg.sampled else None,
+        'infs_added': nalg.mrl.infs_added,
+        'input_seq_len': nalg.mrl.input_seq_len,
+        'pending': len(pending),
+        'buffers': [
+            {'level': buffer.level, 'weight': buffer.weight, 'full': buffer.full.name, 'size': len(array)}
+            for buffer, array in zip(nalg.buffers, arrays)
+        ],
+    }
+    header_bytes = json.dumps(header).encode()
+    prefix = MAGIC + PREFIX.pack(VERSION, len(header_bytes)) + header_bytes
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(prefix + b'\0' * (-len(prefix) % 8))
+        for array in arrays + [pending]:
+            file.write(array.tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_header(path: Union[str, Path]) -> 'tuple[dict, int]':
+    '''
+    reads the header of a saved sketch
+    @return header: parameters and counters of the sketch
+    @return offset: position of the payload in the file
+    '''
+    with open(path, 'rb') as file:
+        assert file.read(len(MAGIC)) == MAGIC, f'{path} is not a saved sketch'
+        version, header_len = PREFIX.unpack(file.read(PREFIX.size))
+        assert version == VERSION, f'unsupported sketch format version {version}'
+        header = json.loads(file.read(header_len))
+    prefix_len = len(MAGIC) + PREFIX.size + header_len
+    return header, prefix_len + (-prefix_len % 8)
+
+
+def load_sketch(path: Union[str, Path], input_sequence: Optional[Iterable] = None, mmap: bool = True) -> NewAlgorithm:
+    '''
+    restores a sketch saved by `save_sketch`
+    @param path: file to read
+    @param input_sequence: the rest of the input to continue with; the saved sketch has read
+    `input_seq_len + pending` elements of its input (see `read_header`)
+    @param mmap: memory-map the payload (copy-on-write) instead of reading it; array-backed buffers use it without copying
+    @return sketch ready to `update`, `run` or `merge`
+    '''
+    header, offset = read_header(path)
+    sizes = [buffer['size'] for buffer in header['buffers']]
+    total = sum(sizes) + header['pending']
+    if mmap and total:
+        payload = np.memmap(path, dtype=DTYPE, mode='c', offset=offset, shape=(total,))
+    else:
+        payload = np.fromfile(path, dtype=DTYPE, count=total, offset=offset)
+
+    nalg = NewAlgorithm(header['mrl_type'], None, header['b'], header['be'], header['phi'], header['vectorized'],
+                        policy=header.get('policy', 'new'))
+    start = 0
+    for buffer, state in zip(nalg.buffers, header['buffers']):
+        elements = payload[start:start + state['size']]
+        start += state['size']
+        if state['full'] == Fullness.EMPTY.name:
+            continue
+        if isinstance(buffer, ArrayBuffer):
+            buffer.attach(elements)
+            buffer.weight, buffer.full = state['weight'], Fullness[state['full']]
+        else:
+            buffer.populate(elements.tolist(), weight=state['weight'], full=Fullness[state['full']])
+        buffer.update_level(state['level'])
+    nalg.pool.reindex()
+    nalg.r = header['r']
+    if header.get('rng') is not None:
+        nalg.mrl.rng.bit_generator.state = header['rng']
+    nalg.mrl.infs_added = header['infs_added']
+    nalg.mrl.input_seq_len = header['input_seq_len']
+    nalg.stream.extend(payload[start:])
+    if input_sequence is not None:
+        nalg.stream.extend(input_sequence)
+    return nalg
+
+
+def ingest_with_checkpoints(nalg: NewAlgorithm, path: Union[str, Path], every: int):
+    '''
+    consumes the rest of the input of a sketch and saves it after every `every` consumed elements
+    @param nalg: a sketch
+    @param path: checkpoint file
+    @param every: number of input elements between two checkpoints
+    '''
+    assert every >= 1, 'checkpoints must be at least one element apart'
+    while True:
+        nalg.ingest(limit=every)
+        save_sketch(nalg, path)
+        if nalg.stream.exhausted:
+            break
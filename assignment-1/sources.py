@@ -0,0 +1,100 @@
+'''
+Input sources that read datasets from files in chunks, so quantiles of multi-GB
+dumps can be computed with constant memory.
+
+Every source is an iterable of array chunks and can be passed anywhere an input
+sequence is expected (`NewAlgorithm`, `InputStream`, `sharded_sketch`). Sources
+only keep the path and offsets, so they are cheap to pickle to worker processes.
+'''
+from itertools import islice
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+import numpy as np
+
+from stream import CHUNK_SIZE
+
+TEXT_SUFFIXES = {'.txt', '.csv', '.log'}
+
+
+class FileSource:
+    '''
+    A .npy file or a raw binary file of fixed-size numbers, read through np.memmap
+    '''
+    def __init__(self, path: Union[str, Path], dtype: str = '<f8', chunk_size: int = CHUNK_SIZE,
+                 start: int = 0, stop: Optional[int] = None):
+        '''
+        @param path: a .npy file or a raw binary file
+        @param dtype: type of the numbers in a raw file, e.g. '<f8' (little-endian float64) or '<i8' (int64); ignored for .npy
+        @param chunk_size: number of elements read at a time
+        @param start: index of the first element to read
+        @param stop: index after the last element to read (the end of the file by default)
+        '''
+        assert chunk_size >= 1, 'chunk_size must be a positive number'
+        self.path = Path(path)
+        self.dtype = dtype
+        self.chunk_size = chunk_size
+        self.start = start
+        self.stop = stop
+
+    def _open(self) -> np.ndarray:
+        if self.path.suffix == '.npy':
+            return np.load(self.path, mmap_mode='r').reshape(-1)
+        if self.path.stat().st_size == 0:
+            return np.empty(0, dtype=self.dtype)
+        return np.memmap(self.path, dtype=self.dtype, mode='r')
+
+    def _bounds(self, data: np.ndarray) -> 'tuple[int, int]':
+        stop = len(data) if self.stop is None else min(self.stop, len(data))
+        return min(self.start, stop), stop
+
+    def __len__(self) -> int:
+        start, stop = self._bounds(self._open())
+        return stop - start
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        data = self._open()
+        start, stop = self._bounds(data)
+        for position in range(start, stop, self.chunk_size):
+            # a copy, so pages of the mapping are not kept referenced by the buffers
+            yield np.array(data[position:min(position + self.chunk_size, stop)])
+
+    def split(self, shards: int) -> 'list[FileSource]':
+        '''
+        splits the source into `shards` contiguous ranges of (almost) equal size, e.g. for `sharded_sketch`
+        '''
+        assert shards >= 1, 'there must be at least one shard'
+        start, stop = self._bounds(self._open())
+        bounds = np.linspace(start, stop, shards + 1).astype(int)
+        return [FileSource(self.path, self.dtype, self.chunk_size, int(first), int(last)) for first, last in zip(bounds[:-1], bounds[1:])]
+
+
+class TextSource:
+    '''
+    A text file with one number per line, read in buffered chunks of lines
+    '''
+    def __init__(self, path: Union[str, Path], chunk_size: int = CHUNK_SIZE):
+        '''
+        @param path: a newline-delimited text file; empty lines are skipped
+        @param chunk_size: number of lines read at a time
+        '''
+        assert chunk_size >= 1, 'chunk_size must be a positive number'
+        self.path = Path(path)
+        self.chunk_size = chunk_size
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        with open(self.path) as file:
+            while True:
+                lines = list(islice(file, self.chunk_size))
+                if not lines:
+                    return
+                yield np.array([float(line) for line in lines if line.strip()])
+
+
+def open_source(path: Union[str, Path], dtype: str = '<f8', chunk_size: int = CHUNK_SIZE) -> Union[FileSource, TextSource]:
+    '''
+    picks a source by the file extension: .npy, text (.txt, .csv, .log) or raw binary of `dtype`
+    '''
+    if Path(path).suffix in TEXT_SUFFIXES:
+        return TextSource(path, chunk_size)
+    return FileSource(path, dtype, chunk_size)
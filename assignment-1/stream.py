@@ -0,0 +1,143 @@
+'''
+Input for the NEW step.
+
+`InputStream` pulls elements on demand from any iterable: a list, a numpy array,
+a generator of numbers or a generator of array chunks. Only the elements that
+have been read ahead and not yet consumed by NEW are kept in memory, so the whole
+dataset never has to be materialized.
+'''
+from collections import deque
+from typing import Iterable, Iterator
+
+import numpy as np
+
+CHUNK_SIZE = 2**16
+
+
+def _chunks(source: Iterable, chunk_size: int) -> Iterator[np.ndarray]:
+    '''
+    turns an iterable of numbers and/or array chunks into an iterator of 1-d arrays
+    @param source: any iterable
+    @param chunk_size: how many single numbers to batch into one array
+    '''
+    if isinstance(source, np.ndarray):
+        yield source.ravel()
+        return
+    if isinstance(source, (list, tuple)):
+        for start in range(0, len(source), chunk_size):
+            yield np.asarray(source[start:start + chunk_size])
+        return
+    batch = []
+    for item in source:
+        if isinstance(item, (np.ndarray, list, tuple)):
+            if batch:
+                yield np.asarray(batch)
+                batch = []
+            yield np.asarray(item).ravel()
+            continue
+        batch.append(item)
+        if len(batch) == chunk_size:
+            yield np.asarray(batch)
+            batch = []
+    if batch:
+        yield np.asarray(batch)
+
+
+class InputStream:
+    '''
+    A forward-only stream of elements that are read in chunks from one or several sources
+    '''
+    def __init__(self, source: Iterable = None, chunk_size: int = CHUNK_SIZE):
+        '''
+        @param source: an iterable of numbers or of array chunks; None to start empty (push mode)
+        @param chunk_size: number of single numbers read from a non-array source at a time
+        '''
+        assert chunk_size >= 1, 'chunk_size must be a positive number'
+        self.chunk_size = chunk_size
+        self._sources: 'deque[Iterator[np.ndarray]]' = deque()
+        self._chunks: 'deque[np.ndarray]' = deque()
+        self._head = 0 # position in the first chunk
+        self._available = 0 # number of elements read ahead and not consumed yet
+        if source is not None:
+            self.extend(source)
+
+    def extend(self, source: Iterable):
+        '''
+        appends a source to the end of the stream (used for push-style updates)
+        @param source: an iterable of numbers or of array chunks
+        '''
+        self._sources.append(_chunks(source, self.chunk_size))
+
+    def unread(self, elements: 'list'):
+        '''
+        puts elements back to the front of the stream
+        @param elements: elements to be returned by the next `take`
+        '''
+        if len(elements) == 0:
+            return
+        self._drop_consumed()
+        self._chunks.appendleft(np.asarray(elements))
+        self._available += len(elements)
+
+    def buffered(self) -> np.ndarray:
+        '''
+        returns a copy of the elements that were read ahead and not consumed yet, without consuming them
+        '''
+        self._drop_consumed()
+        return np.concatenate(self._chunks) if self._chunks else np.empty(0)
+
+    def has_more_than(self, n: int) -> bool:
+        '''
+        checks if the stream still has more than `n` elements, reading ahead if needed
+        '''
+        return self._fill(n + 1)
+
+    @property
+    def exhausted(self) -> bool:
+        '''
+        True if there are no elements left
+        '''
+        return not self._fill(1)
+
+    def take(self, n: int) -> np.ndarray:
+        '''
+        removes up to `n` next elements from the stream
+        @param n: number of elements to take
+        @return an array of at most `n` elements (fewer only at the end of the stream)
+        '''
+        self._fill(n)
+        pieces = []
+        while n > 0 and self._chunks:
+            chunk = self._chunks[0]
+            piece = chunk[self._head:self._head + n]
+            pieces.append(piece)
+            n -= len(piece)
+            self._available -= len(piece)
+            self._head += len(piece)
+            if self._head == len(chunk):
+                self._chunks.popleft()
+                self._head = 0
+        if len(pieces) == 1:
+            return pieces[0]
+        return np.concatenate(pieces) if pieces else np.empty(0)
+
+    def _fill(self, n: int) -> bool:
+        '''
+        reads chunks from the sources until at least `n` elements are available
+        @return True if `n` elements are available
+        '''
+        while self._available < n and self._sources:
+            try:
+                chunk = next(self._sources[0])
+            except StopIteration:
+                self._sources.popleft()
+                continue
+            if len(chunk):
+                self._chunks.append(chunk)
+                self._available += len(chunk)
+        return self._available >= n
+
+    def _drop_consumed(self):
+        if self._head:
+            self._chunks[0] = self._chunks[0][self._head:]
+            self._head = 0
@@ -0,0 +1,236 @@
+'''
+A queryable summary of a finished sketch.
+
+OUTPUT collapses the final buffers in place and answers one phi. `QuantileSummary`
+merges the same buffers once, without modifying them, and answers any number of
+quantile, rank and CDF queries. Quantiles are exactly the elements OUTPUT would return.
+
+`histogram` exports an equi-depth histogram (a piecewise CDF) of a summary in one
+pass over its weighted elements instead of one run per bucket.
+'''
+from math import ceil
+from pathlib import Path
+from typing import Iterable, Union
+
+import numpy as np
+
+
+def calculate_phi_tick(phi, beta: float, symmetric: bool = True):
+    '''
+    calculates phi' from the paper (works on numbers and on arrays)
+    @param phi: original percentile
+    @param beta: (N + number of added infinities) / N
+    @param symmetric: True if equal numbers of +inf and -inf were added (MRL98),
+    False if all of them are +inf (the missing elements of a partially full buffer in MRL99)
+    @return phi_tick: phi'
+    '''
+    assert beta >= 1, 'beta must be >= 1'
+    if not symmetric:
+        return phi / beta
+    return (2 * phi + beta - 1) / (2 * beta)
+
+
+BUCKETS = 100
+
+
+class Histogram:
+    '''
+    Equi-depth buckets: bucket i holds the elements from (boundaries[i], boundaries[i + 1]] (the first one
+    also boundaries[0], the smallest element), ranks[i] is the estimated number of elements <= boundaries[i]
+    '''
+    def __init__(self, boundaries: np.ndarray, ranks: np.ndarray):
+        '''
+        @param boundaries: non-decreasing bucket boundaries, one more than buckets
+        @param ranks: cumulative rank at every boundary; ranks[0] is 0 and ranks[-1] the number of elements
+        '''
+        assert len(boundaries) == len(ranks) >= 2, 'there must be a rank for every boundary and at least one bucket'
+        self.boundaries = np.asarray(boundaries, dtype=np.float64)
+        self.ranks = np.asarray(ranks, dtype=np.float64)
+
+    @property
+    def counts(self) -> np.ndarray:
+        '''
+        estimated number of elements in every bucket
+        '''
+        return np.diff(self.ranks)
+
+    @property
+    def total(self) -> float:
+        return float(self.ranks[-1])
+
+    def cdf(self, x: Union[float, Iterable[float]]) -> np.ndarray:
+        '''
+        piecewise linear CDF through the boundaries
+        @param x: one or more values
+        '''
+        return np.interp(np.asarray(x, dtype=np.float64), self.boundaries, self.ranks / self.total)
+
+    def to_array(self) -> np.ndarray:
+        '''
+        compact form: a float64 array of shape (2, buckets + 1) with the boundaries and the ranks
+        '''
+        return np.stack([self.boundaries, self.ranks])
+
+    @classmethod
+    def from_array(cls, array: np.ndarray) -> 'Histogram':
+        return cls(array[0], array[1])
+
+    def save(self, path: Union[str, Path]):
+        np.save(path, self.to_array())
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'Histogram':
+        return cls.from_array(np.load(path))
+
+
+def histogram(summary: Union['QuantileSummary', 'WeightedSummary'], buckets: int = BUCKETS) -> Histogram:
+    '''
+    equi-depth histogram of a summary: the inner boundaries are its quantiles at i / buckets
+    (for `QuantileSummary` the elements OUTPUT returns), the outer ones the smallest and the largest
+    element; the +inf and -inf padding is not counted
+    @param summary: a `QuantileSummary` or a `WeightedSummary`
+    @param buckets: number of buckets
+    '''
+    assert buckets >= 1, 'there must be at least one bucket'
+    lowest, highest = summary.finite_range()
+    boundaries = np.clip(summary.quantiles(np.linspace(0, 1, buckets + 1)), lowest, highest)
+    boundaries[0], boundaries[-1] = lowest, highest
+    ranks = summary.rank(boundaries)
+    ranks[0] = 0
+    return Histogram(boundaries, ranks)
+
+
+class QuantileSummary:
+    '''
+    Weighted elements of the final buffers, sorted once
+    '''
+    def __init__(self, buffers: 'list', be: int, beta: float = 1, symmetric: bool = True):
+        '''
+        @param buffers: non-empty buffers of a sketch (they are not modified)
+        @param be: number of elements per buffer
+        @param beta: see `calculate_phi_tick`; 1 if no infinities were added
+        @param symmetric: see `calculate_phi_tick`
+        '''
+        assert len(buffers) >= 1, 'should be 1 or more buffers'
+        self.be = be
+        self.beta = beta
+        self.symmetric = symmetric
+        weights = [buffer.weight for buffer in buffers]
+        self.sum_of_weights = sum(weights)
+        self.offset = ceil(self.sum_of_weights / 2)
+        values = np.concatenate([np.asarray(buffer.elements, dtype=np.float64) for buffer in buffers])
+        # stable: equal elements keep the order of their buffers, as in COLLAPSE
+        order = np.argsort(values, kind='stable')
+        self.values = values[order]
+        self.weights = np.repeat(np.asarray(weights, dtype=np.int64), [len(buffer.elements) for buffer in buffers])[order]
+        self.cum_weights = np.cumsum(self.weights)
+        # the +inf and -inf padding added by NEW is not a part of the data
+        self._first_finite = np.searchsorted(self.values, -np.inf, side='right')
+        self._end_finite = np.searchsorted(self.values, np.inf, side='left')
+        self._weight_below = int(self._cum_weight(self._first_finite))
+        self.total_weight = int(self._cum_weight(self._end_finite)) - self._weight_below
+
+    def quantiles(self, phis: Union[float, Iterable[float]]) -> np.ndarray:
+        '''
+        elements at the given quantiles, the same that OUTPUT returns for each of them
+        @param phis: one or more quantiles from [0, 1]
+        '''
+        phis = np.asarray(phis, dtype=np.float64)
+        assert np.all((0 <= phis) & (phis <= 1)), 'phi must be from [0, 1]'
+        phi_tick = calculate_phi_tick(phis, self.beta, self.symmetric)
+        # OUTPUT takes Y[position], and Y[j] covers the weighted position offset + j * sum_of_weights
+        position = np.maximum(0, np.ceil(phi_tick * self.be - 1)).astype(np.int64)
+        targets = self.offset + self.sum_of_weights * position
+        # targets behind the last element that is not +inf fall on the +inf part of Y
+        indices = np.searchsorted(self.cum_weights[:self._end_finite], targets, side='left')
+        return np.where(indices < self._end_finite, self.values[np.minimum(indices, len(self.values) - 1)], np.inf)
+
+    def quantile(self, phi: float) -> float:
+        '''
+        element at the `phi` quantile
+        '''
+        return self.quantiles(phi).item()
+
+    def rank(self, x: Union[float, Iterable[float]]) -> np.ndarray:
+        '''
+        estimated number of elements of the data that are not greater than `x`
+        @param x: one or more values
+        '''
+        x = np.asarray(x, dtype=np.float64)
+        indices = np.clip(np.searchsorted(self.values, x, side='right'), self._first_finite, self._end_finite)
+        return self._cum_weight(indices) - self._weight_below
+
+    def cdf(self, x: Union[float, Iterable[float]]) -> np.ndarray:
+        '''
+        estimated fraction of elements of the data that are not greater than `x`
+        @param x: one or more values
+        '''
+        return self.rank(x) / self.total_weight
+
+    def finite_range(self) -> 'tuple[float, float]':
+        '''
+        the smallest and the largest element that is not padding
+        '''
+        assert self.total_weight > 0, 'the summary has no elements besides the padding'
+        return self.values[self._first_finite], self.values[self._end_finite - 1]
+
+    def histogram(self, buckets: int = BUCKETS) -> Histogram:
+        return histogram(self, buckets)
+
+    def _cum_weight(self, indices):
+        '''
+        total weight of the first `indices` elements
+        '''
+        return np.where(indices > 0, self.cum_weights[np.maximum(indices, 1) - 1], 0)
+
+
+class WeightedSummary:
+    '''
+    Plain weighted elements: the quantile phi is the first element whose cumulative weight reaches phi * total
+    (used by sketches without the Y positions of OUTPUT, see kll.py)
+    '''
+    def __init__(self, values: np.ndarray, weights: np.ndarray):
+        '''
+        @param values: elements (any order, no padding)
+        @param weights: weight of every element
+        '''
+        assert len(values) == len(weights), 'there must be one weight per element'
+        assert len(values) >= 1, 'should be 1 or more elements'
+        values = np.asarray(values, dtype=np.float64)
+        order = np.argsort(values, kind='stable')
+        self.values = values[order]
+        self.weights = np.asarray(weights, dtype=np.int64)[order]
+        self.cum_weights = np.cumsum(self.weights)
+        self.total_weight = int(self.cum_weights[-1])
+
+    def quantiles(self, phis: Union[float, Iterable[float]]) -> np.ndarray:
+        '''
+        elements at the given quantiles
+        @param phis: one or more quantiles from [0, 1]
+        '''
+        phis = np.asarray(phis, dtype=np.float64)
+        assert np.all((0 <= phis) & (phis <= 1)), 'phi must be from [0, 1]'
+        indices = np.searchsorted(self.cum_weights, phis * self.total_weight, side='left')
+        return self.values[np.minimum(indices, len(self.values) - 1)]
+
+    def quantile(self, phi: float) -> float:
+        return self.quantiles(phi).item()
+
+    def rank(self, x: Union[float, Iterable[float]]) -> np.ndarray:
+        '''
+        estimated number of elements of the data that are not greater than `x`
+        '''
+        indices = np.searchsorted(self.values, np.asarray(x, dtype=np.float64), side='right')
+        return np.where(indices > 0, self.cum_weights[np.maximum(indices, 1) - 1], 0)
+
+    def cdf(self, x: Union[float, Iterable[float]]) -> np.ndarray:
+        '''
+        estimated fraction of elements of the data that are not greater than `x`
+        '''
+        return self.rank(x) / self.total_weight
+
+    def finite_range(self) -> 'tuple[float, float]':
+        return self.values[0], self.values[-1]
+
+    def histogram(self, buckets: int = BUCKETS) -> Histogram:
+        return histogram(self, buckets)
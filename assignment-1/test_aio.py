@@ -0,0 +1,83 @@
+import asyncio
+
+import numpy as np
+
+from aio import AsyncIngestor
+from evaluation import PHIS, rank_errors
+from new_algorithm import NewAlgorithm
+
+async def _send(open_connection, values: np.ndarray):
+    _, writer = await open_connection
+    for chunk in np.array_split(values, 10):
+        writer.write(''.join(f'{value!r}\n' for value in chunk.tolist()).encode())
+        await writer.drain()
+    writer.close()
+    await writer.wait_closed()
+
+def test_queue_source_matches_list_input():
+    '''
+    values that arrive through a queue give the same answer as the whole list
+    '''
+    data = np.random.default_rng(7).normal(size=20000)
+
+    async def ingest():
+        queue = asyncio.Queue(4)
+        async with AsyncIngestor(NewAlgorithm('98', None, 5, 300, 0.3, vectorized=True), max_blocks=2) as ingestor:
+            reader = asyncio.create_task(ingestor.consume_queue(queue))
+            for chunk in np.array_split(data, 37):
+                await queue.put(chunk)
+            await queue.put(None)
+            await reader
+        return ingestor.sketch
+
+    sketch = asyncio.run(ingest())
+    assert sketch.run() == NewAlgorithm('98', data, 5, 300, 0.3, vectorized=True).run()
+
+def test_socket_sources(tmp_path):
+    '''
+    concurrent TCP and Unix socket senders end up in one sketch
+    '''
+    rng = np.random.default_rng(8)
+    parts = [rng.uniform(size=5000) for _ in range(3)]
+
+    async def ingest():
+        ingestor = AsyncIngestor(NewAlgorithm('98', None, 5, 200, 0.5, vectorized=True), max_blocks=1).start()
+        tcp = await ingestor.serve_tcp()
+        unix = await ingestor.serve_unix(tmp_path / 'sketch.sock')
+        host, port = tcp.sockets[0].getsockname()[:2]
+        await asyncio.gather(_send(asyncio.open_connection(host, port), parts[0]),
+                             _send(asyncio.open_connection(host, port), parts[1]),
+                             _send(asyncio.open_unix_connection(str(tmp_path / 'sketch.sock')), parts[2]))
+        for server in (tcp, unix):
+            server.close()
+            await server.wait_closed()
+        # the handlers may still be reading the last lines
+        while ingestor.received < 15000:
+            await asyncio.sleep(0.01)
+        return await ingestor.close()
+
+    sketch = asyncio.run(ingest())
+    data = np.sort(np.concatenate(parts))
+    assert sketch.summary().total_weight == len(data)
+    assert np.max(rank_errors(data, sketch.summary().quantiles(PHIS), PHIS)) < 0.05
+
+def test_backpressure():
+    '''
+    a producer waits while the queue is full and continues once the consumer runs
+    '''
+    async def ingest():
+        ingestor = AsyncIngestor(NewAlgorithm('98', None, 3, 100, 0.5), max_blocks=2)
+        await ingestor.put(np.arange(200.0))
+        try:
+            await asyncio.wait_for(ingestor.put(np.arange(100.0)), 0.1)
+            blocked = False
+        except asyncio.TimeoutError:
+            blocked = True
+        ingestor.start()
+        await ingestor.put(np.arange(50.0))
+        await ingestor.join()
+        return blocked, ingestor.queue.qsize(), await ingestor.close()
+
+    blocked, queued, sketch = asyncio.run(ingest())
+    assert blocked and queued == 0
+    assert sketch.summary().total_weight == 350
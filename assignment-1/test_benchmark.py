@@ -0,0 +1,19 @@
+from benchmark import benchmark_one, compare, load_results, run_benchmark
+
+def test_benchmark(tmp_path):
+    '''
+    the same seed gives the same record, results are written as JSON lines and can be compared
+    '''
+    record = benchmark_one('99', 'normal', 0.05, 20000, seed=3)
+    assert record == {**benchmark_one('99', 'normal', 0.05, 20000, seed=3), 'seconds': record['seconds'],
+                      'throughput': record['throughput'], 'metrics': record['metrics'],
+                      'peak_memory': record['peak_memory']}
+    assert record['rank_error'] <= record['e']
+    assert record['metrics']['phases']['new']['calls'] >= 1 and record['metrics']['phases']['output']['calls'] == 1
+    assert record['peak_memory'] > 0
+
+    path = tmp_path / 'results.jsonl'
+    records = run_benchmark(path, ['98', 'numpy'], ['poisson'], [0.05], [10000], memory=False)
+    assert load_results(path) == records
+    rows = compare(records, records)
+    assert len(rows) == 2 and all(row['speedup'] == 1 and not row['regression'] for row in rows)
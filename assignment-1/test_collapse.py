@@ -1,20 +1,43 @@
-from mrl98 import MRL98, Buffer
+from mrl98 import MRL98, ArrayBuffer, Buffer, Fullness
 
-buffers = [
-    Buffer(5, [12, 52, 72, 102, 132]),
-    Buffer(5, [23, 33, 83, 143, 153]),
-    Buffer(5, [44, 64, 94, 114, 124]),
-    ]
-# artifitical
-buffers[0].weight = 2
-buffers[0].full = True
-buffers[1].weight = 3
-buffers[1].full = True
-buffers[2].weight = 4
-buffers[2].full = True
+def imitate_buffers(buffer_type=Buffer):
+    '''
+    buffers from Fig. 1 of the original paper
+    '''
+    buffers = [
+        buffer_type(5, [12, 52, 72, 102, 132]),
+        buffer_type(5, [23, 33, 83, 143, 153]),
+        buffer_type(5, [44, 64, 94, 114, 124]),
+        ]
+    # artifitical
+    buffers[0].weight = 2
+    buffers[0].full = Fullness.FULL
+    buffers[1].weight = 3
+    buffers[1].full = Fullness.FULL
+    buffers[2].weight = 4
+    buffers[2].full = Fullness.FULL
+    return buffers
 
-mrl98 = MRL98([0]*15, 3, 5)
-res = mrl98.collapse(buffers)
+def test_collapse():
+    buffers = imitate_buffers()
+    mrl98 = MRL98([0]*15, 3, 5)
+    res = mrl98.collapse(buffers)
 
-for buffer in buffers:
-    print(buffer.__dict__)
\ No newline at end of file
+    for buffer in buffers:
+        print(buffer.__dict__)
+    assert res.elements == [23, 52, 83, 114, 143]
+    assert res.weight == 9
+
+def test_collapse_vectorized():
+    buffers = imitate_buffers(ArrayBuffer)
+    mrl98 = MRL98([0]*15, 3, 5, vectorized=True)
+    res = mrl98.collapse(buffers)
+    assert res.elements.tolist() == [23, 52, 83, 114, 143]
+    assert res.weight == 9
+    # unsorted buffers with duplicates and a partially full buffer give the same Y as the merge
+    for buffer_type, vectorized in [(Buffer, False), (ArrayBuffer, True)]:
+        buffers = [buffer_type(4, [3, 1, 3, 7]), buffer_type(4, [3, 5])]
+        buffers[0].weight, buffers[0].full = 2, Fullness.FULL
+        buffers[1].weight, buffers[1].full = 1, Fullness.PARTIAL
+        res = MRL98([0], 2, 4, vectorized=vectorized).collapse(buffers, for_output=True)
+        assert list(res.elements) == [1, 3, 5, float('inf')]
@@ -0,0 +1,19 @@
+from itertools import islice
+
+import numpy as np
+
+import datagen
+
+def test_streams():
+    '''
+    streams are seeded, chunked and can be unbounded; `fill` writes the same data into an array
+    '''
+    for name, stream in datagen.possible_streams.items():
+        chunks = list(stream(2500, seed=4, chunk_size=1000))
+        assert [len(chunk) for chunk in chunks] == [1000, 1000, 500], name
+        data = np.concatenate(chunks)
+        assert data.tolist() == np.concatenate(list(stream(2500, seed=4, chunk_size=1000))).tolist()
+        assert data.tolist() == datagen.fill(name, np.empty(2500), seed=4, chunk_size=1000).tolist()
+        assert len(list(islice(stream(None, seed=4, chunk_size=10), 1000))) == 1000
+    values = np.concatenate(list(datagen.stream_random(10**5, seed=0, start=2, end=3)))
+    assert values.min() >= 2 and values.max() <= 3
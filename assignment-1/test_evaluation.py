@@ -0,0 +1,25 @@
+import numpy as np
+
+from evaluation import evaluate, evaluate_runs, rank_error, rank_errors
+from new_algorithm import NewAlgorithm
+
+def test_rank_errors():
+    '''
+    every rank of a repeated value is a correct answer
+    '''
+    data = np.array([1, 2, 2, 2, 3, 4, 5, 6, 7, 8], dtype=float)
+    assert rank_error(data, 2, 0.3) == 0
+    assert rank_error(data, 5, 0.3) == 0.4
+    assert rank_error(data, 1, 0.3) == 0.2
+    assert rank_errors(data, [1, 2, 8], [0.1, 0.1, 0.5]).tolist() == [0, 0.1, 0.5]
+
+def test_evaluate():
+    data = np.random.default_rng(2).normal(0, 1, 50000)
+    expected = NewAlgorithm('98', data.copy(), 5, 200, 0).summary().quantiles([0.25, 0.5])
+    result = evaluate(NewAlgorithm('98', data, 5, 200, 0), data, 0.01, [0.25, 0.5])
+    assert result['values'].tolist() == expected.tolist()
+    assert np.all(np.diff(data) >= 0), 'the data is sorted in place'
+    assert result['max'] <= 0.01 and result['within_e'] == 1
+    # the same seed gives the same datasets and samples
+    first, second = [evaluate_runs('99', 2, 'poisson', 20000, 4, 300, 0.02, seed=5) for _ in range(2)]
+    assert [result['values'].tolist() for result in first] == [result['values'].tolist() for result in second]
@@ -0,0 +1,18 @@
+from experiments import run_experiments
+
+def test_experiments():
+    '''
+    runs of a seeded experiment do not depend on the number of workers, shared datasets are freed
+    '''
+    configurations = [(0.05, 10000), (0.02, 20000)]
+    progress = []
+    results = run_experiments('99', 'normal', configurations, 3, phi=0.3, workers=2, seed=7,
+                              progress=lambda done, total, result: progress.append((done, total)))
+    assert progress == [(done, 6) for done in range(1, 7)]
+    assert results.configurations() == sorted(configurations)
+    single = run_experiments('99', 'normal', configurations, 3, phi=0.3, workers=1, seed=7, progress=None)
+    for e, n in configurations:
+        assert [run['value'] for run in results.runs(e, n)] == [run['value'] for run in single.runs(e, n)]
+        # different runs get different datasets
+        assert len({run['value'] for run in results.runs(e, n)}) == 3
+    assert set(results.times()) == set(configurations)
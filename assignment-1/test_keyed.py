@@ -0,0 +1,38 @@
+import numpy as np
+
+from evaluation import rank_errors
+from keyed import KeyedSketches
+from new_algorithm import NewAlgorithm
+
+def test_keyed():
+    '''
+    every key gets the accuracy of its own sketch, the slab grows with the number of keys
+    '''
+    rng = np.random.default_rng(8)
+    keys = rng.choice(['api', 'db', 'cache'] + [f'host{i}' for i in range(100)], 200000, p=[0.3, 0.3, 0.3] + [0.001] * 100)
+    values = rng.exponential(1, len(keys)) + np.char.str_len(keys)
+    sketches = KeyedSketches(4, 100, rows=2)
+    for start in range(0, len(keys), 9999):
+        sketches.update(keys[start:start + 9999], values[start:start + 9999])
+    assert len(sketches) == 103 and len(sketches.data) == 128
+    phis = np.array([0, 0.1, 0.5, 0.9, 0.99, 1])
+    answers = sketches.quantiles(phis)
+    for key, row in zip(sketches.keys, answers):
+        exact = np.sort(values[keys == key])
+        assert np.all(rank_errors(exact, row, phis) < 0.02), key
+    assert np.all(np.isnan(sketches.quantiles([0.5], ['unknown'])))
+    assert sketches.quantile('api', 0.5) == answers[sketches.keys.index('api'), 2]
+
+def test_keyed_collapse():
+    '''
+    a key's buffers are collapsed like the ones of `NewAlgorithm`
+    '''
+    data = np.random.default_rng(9).normal(0, 1, 4000)
+    sketches = KeyedSketches(3, 100)
+    sketches.update(np.zeros(len(data), dtype=int), data)
+    nalg = NewAlgorithm('98', data, 3, 100, 0.5, vectorized=True)
+    nalg.ingest()
+    # NEW of `NewAlgorithm` sorts a buffer only when it is collapsed
+    expected = sorted((buffer.level, buffer.weight, sorted(buffer.elements.tolist())) for buffer in nalg.buffers if buffer.weight)
+    assert sorted((level, weight, elements[:size].tolist()) for level, weight, size, elements
+                  in zip(sketches.level[0], sketches.weight[0], sketches.size[0], sketches.data[0]) if weight) == expected
@@ -0,0 +1,45 @@
+import numpy as np
+
+import sizing
+from evaluation import PHIS, evaluate, rank_errors
+from kll import KLL
+from new_algorithm import create_sketch
+
+def test_kll_accuracy():
+    '''
+    every quantile is within e with the k of `sizing.solve`, and the seed makes runs reproducible
+    '''
+    data = np.random.default_rng(2).exponential(size=100000)
+    k = sizing.solve('kll', 0.01)['k']
+    result = evaluate(create_sketch('kll', data.copy(), None, k, 0.5, seed=3), data.copy(), 0.01)
+    assert result['max'] <= 0.01
+    first, second = KLL(data, k, 0.5, seed=3), KLL(data, k, 0.5, seed=3)
+    assert first.run() == second.run()
+    assert first.summary().total_weight == len(data)
+
+def test_kll_memory():
+    '''
+    the sketch keeps fewer elements than the MRL98 buffers of the same error rate
+    '''
+    e, n = 0.005, 200000
+    kll = KLL(np.random.default_rng(4).normal(size=n), sizing.solve('kll', e)['k'], 0.5, seed=1)
+    kll.ingest()
+    params = sizing.solve('98', e, n)
+    assert kll.size() < params['b'] * params['k']
+
+def test_kll_update_and_merge():
+    '''
+    pushed chunks and merged sketches answer like one sketch of all the data
+    '''
+    rng = np.random.default_rng(5)
+    parts = [rng.uniform(size=30000) for _ in range(3)]
+    sketches = []
+    for seed, part in enumerate(parts):
+        kll = KLL(None, 400, 0.5, seed=seed)
+        for chunk in np.array_split(part, 7):
+            kll.update(chunk)
+        sketches.append(kll)
+    merged = sketches[0].merge(sketches[1]).merge(sketches[2])
+    data = np.sort(np.concatenate(parts))
+    assert merged.summary().total_weight == len(data)
+    assert np.max(rank_errors(data, merged.summary().quantiles(PHIS), PHIS)) < 0.01
@@ -0,0 +1,48 @@
+import numpy as np
+
+from new_algorithm import NewAlgorithm
+from parallel import sharded_sketch, split
+
+def test_merge():
+    data = np.random.default_rng(0).normal(0, 1, 50000)
+    phis = [0.01, 0.1, 0.5, 0.9, 0.99]
+    merged = NewAlgorithm('98', data[:20000], 5, 300, 0.5)
+    merged.merge(NewAlgorithm('98', data[20000:], 5, 300, 0.5))
+    assert len(merged.buffers) == 5
+    summary = merged.summary()
+    assert summary.total_weight == len(data)
+    ranks = np.searchsorted(np.sort(data), summary.quantiles(phis)) / len(data)
+    assert np.all(np.abs(ranks - phis) < 0.01)
+    # a merged sketch keeps ingesting
+    merged.update(data[:1000])
+    assert abs(merged.summary().total_weight - len(data) - 1000) < 0.001 * len(data)
+
+def test_sharded_sketch():
+    data = np.random.default_rng(1).normal(0, 1, 40000)
+    shards = split(data, 4)
+    expected = NewAlgorithm('98', shards[0], 4, 200, 0.3)
+    expected.ingest()
+    for shard in shards[1:]:
+        expected.merge(NewAlgorithm('98', shard, 4, 200, 0.3))
+    assert sharded_sketch('98', shards, 4, 200, 0.3, workers=2).run() == expected.run()
+    # the policy reaches every shard and the merges
+    expected = NewAlgorithm('98', shards[0], 4, 200, 0.3, policy='munro-paterson')
+    expected.ingest()
+    for shard in shards[1:]:
+        expected.merge(NewAlgorithm('98', shard, 4, 200, 0.3, policy='munro-paterson'))
+    sharded = sharded_sketch('98', shards, 4, 200, 0.3, workers=2, policy='munro-paterson')
+    assert sharded.policy.name == 'munro-paterson' and sharded.run() == expected.run()
+
+def test_merge_equal_shards():
+    '''
+    two full shards of the same size: the merge still leaves enough buffers for OUTPUT
+    '''
+    data = np.random.default_rng(2).normal(0, 1, 1000)
+    for mrl_type in ('98', '99'):
+        merged = NewAlgorithm(mrl_type, data[:500], 5, 100, 0.5, seed=1)
+        merged.ingest()
+        merged.merge(NewAlgorithm(mrl_type, data[500:], 5, 100, 0.5, seed=2))
+        summary = merged.summary()
+        assert summary.total_weight == len(data)
+        assert abs(np.searchsorted(np.sort(data), merged.run()) / len(data) - 0.5) < 0.05
+    assert abs(sharded_sketch('98', split(data, 2), 5, 100, 0.5, workers=2).run() - np.median(data)) < 0.2
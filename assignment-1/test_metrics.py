@@ -0,0 +1,25 @@
+import numpy as np
+
+from metrics import Metrics
+from mrl98 import MRL98
+from new_algorithm import NewAlgorithm
+
+def test_metrics():
+    '''
+    instrumentation does not change the answer and is not installed when disabled
+    '''
+    data = np.random.default_rng(3).normal(0, 1, 10000)
+    events = []
+    metrics = Metrics(callback=lambda phase, metrics: events.append(phase))
+    expected = NewAlgorithm('98', data, 4, 100, 0.4).run()
+    assert NewAlgorithm('98', data, 4, 100, 0.4, metrics=metrics).run() == expected
+    assert metrics.calls['new'] == 100 and metrics.elements_consumed == 10000
+    assert metrics.calls['output'] == 1 and events[-1] == 'output'
+    assert events.count('collapse') == metrics.calls['collapse'] > 0
+    # COLLAPSE merges full buffers of `be` elements, OUTPUT merges the remaining ones
+    assert metrics.elements_merged % 100 == 0 and metrics.height >= 2 and metrics.r is None
+
+    metrics = Metrics()
+    NewAlgorithm('99', data, 4, 100, 0.4, seed=1, metrics=metrics).run()
+    assert metrics.elements_consumed == 10000 and metrics.r >= 2
+    assert 'new' not in vars(MRL98(data, 4, 100)) and 'new' in vars(MRL98(data, 4, 100, metrics=Metrics()))
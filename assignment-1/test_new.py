@@ -1,4 +1,9 @@
-from mrl98 import Buffer, MRL98
+import numpy as np
+
+from mrl98 import ArrayBuffer, Buffer, MRL98, Fullness, plus_inf, minus_inf
+from mrl99 import MRL99
+from new_algorithm import NewAlgorithm
+from sources import FileSource, open_source
 
 def test_case1():
     '''
@@ -8,8 +13,13 @@ def test_case1():
     mrl98 = MRL98(input_sequence=sequence, b=2, be=3)
     print(f'sequence: {sequence}')
     print(f'# of elements per buffer: {mrl98.be}')
-    buffer = Buffer()
-    return mrl98.new(buffer)
+    buffer = mrl98.new(Buffer(mrl98.be))
+    print(buffer.__dict__)
+    assert buffer.elements == [1, 2, 3]
+    assert buffer.full == Fullness.FULL and buffer.weight == 1
+    # the input is not modified, the next NEW continues where the previous one stopped
+    assert sequence == [1, 2, 3, 4, 5]
+    assert mrl98.new(Buffer(mrl98.be)).elements == [4, 5, plus_inf, minus_inf]
 
 def test_case2():
     '''
@@ -20,10 +30,87 @@ def test_case2():
     mrl98.be = 4 # artificial
     print(f'sequence: {sequence}')
     print(f'# of elements per buffer: {mrl98.be}')
-    buffer = Buffer()
-    return mrl98.new(buffer)
+    buffer = mrl98.new(Buffer(mrl98.be))
+    print(buffer.__dict__)
+    assert buffer.elements == [1, 2, 3, plus_inf, minus_inf]
+    assert mrl98.infs_added == 2 and mrl98.input_seq_len == 3
+
+def test_sources():
+    '''
+    a list, an array, a generator of numbers, a generator of chunks and push-style updates give the same answer
+    '''
+    data = np.random.default_rng(0).normal(0, 1, 10001)
+    expected = NewAlgorithm('98', data.tolist(), 4, 100, 0.3).run()
+    assert NewAlgorithm('98', data, 4, 100, 0.3).run() == expected
+    assert NewAlgorithm('98', (x for x in data.tolist()), 4, 100, 0.3).run() == expected
+    assert NewAlgorithm('98', iter(np.array_split(data, 7)), 4, 100, 0.3).run() == expected
+    nalg = NewAlgorithm('98', None, 4, 100, 0.3)
+    for start in range(0, len(data), 333):
+        nalg.update(data[start:start + 333])
+        # only the values that are not in buffers yet are kept
+        assert not nalg.stream.has_more_than(nalg.b * nalg.be + 333)
+    assert nalg.run() == expected
+
+def test_file_sources(tmp_path):
+    '''
+    .npy, raw binary and text files are streamed in chunks and give the same answer as the array
+    '''
+    data = np.random.default_rng(1).normal(0, 1, 5000)
+    expected = NewAlgorithm('98', data, 4, 100, 0.7).run()
+    np.save(tmp_path / 'data.npy', data)
+    data.astype('<f8').tofile(tmp_path / 'data.bin')
+    np.savetxt(tmp_path / 'data.txt', data, fmt='%.17g')
+    for path in ['data.npy', 'data.bin', 'data.txt']:
+        assert NewAlgorithm('98', open_source(tmp_path / path, chunk_size=999), 4, 100, 0.7).run() == expected
+    shards = FileSource(tmp_path / 'data.bin').split(3)
+    assert [len(shard) for shard in shards] == [1666, 1667, 1667]
+    assert np.concatenate([chunk for shard in shards for chunk in shard]).tolist() == data.tolist()
+
+def test_mrl99_new_seed():
+    '''
+    the same seed samples the same elements, another seed different ones
+    '''
+    sequence = np.arange(1000.0)
+
+    def sampled(seed):
+        mrl99 = MRL99(input_sequence=sequence, b=3, be=10, seed=seed)
+        return [mrl99.new(Buffer(mrl99.be), r).elements for r in (1, 4, 16)]
+
+    assert sampled(5) == sampled(5)
+    assert sampled(5) != sampled(6)
+    # r = 1 takes the elements as they are
+    assert sampled(5)[0] == list(range(10))
 
+def test_mrl99_new_one_per_block():
+    '''
+    NEW keeps exactly one element of every r consecutive ones; the shorter last group also gives one
+    '''
+    for r in (2, 3, 8):
+        for vectorized in (False, True):
+            mrl99 = MRL99(input_sequence=np.arange(100.0), b=3, be=7, vectorized=vectorized, seed=r)
+            buffer = mrl99.new(Buffer(mrl99.be), r)
+            assert buffer.weight == r and buffer.full == Fullness.FULL
+            assert [element // r for element in buffer.elements] == list(range(7))
+        # 100 - 7 * 8 = 44 elements left: ceil(44 / 8) = 6 groups, the last one of 4
+        if r == 8:
+            buffer = mrl99.new(Buffer(mrl99.be), r)
+            assert buffer.full == Fullness.PARTIAL and mrl99.infs_added == 7 * 8 - 44
+            assert [element // r for element in buffer.elements] == list(range(7, 13))
+    # the vectorized sampler on its own: one index per group, in every position of the group
+    mrl99 = MRL99(input_sequence=[], b=3, be=7, seed=0)
+    block = np.arange(10**4)
+    chosen = mrl99._choose_one_from_each_r(block, 10)
+    assert np.array_equal(chosen // 10, np.arange(10**3))
+    assert set(chosen % 10) == set(range(10))
 
-print('test case 1'), print(test_case1().__dict__)
-print()
-print('test case 2'), print(test_case2().__dict__)
\ No newline at end of file
+def test_new_array_buffer():
+    '''
+    NEW of an array-backed buffer gives the same elements as NEW of a list buffer, padding included
+    '''
+    for sequence in [np.arange(7.0), np.arange(4.0)]:
+        lists, arrays = MRL98(sequence, b=2, be=5), MRL98(sequence, b=2, be=5, vectorized=True)
+        for _ in range(2 if len(sequence) > 5 else 1):
+            expected = lists.new(Buffer(5)).elements
+            buffer = arrays.new(ArrayBuffer(5))
+            assert isinstance(buffer.elements, np.ndarray) and buffer.elements.tolist() == expected
+        assert arrays.infs_added == lists.infs_added
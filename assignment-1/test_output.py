@@ -1,24 +1,61 @@
-from mrl98 import Buffer, MRL98
+import numpy as np
+
+from mrl98 import Buffer, MRL98, Fullness
+from new_algorithm import NewAlgorithm
+from summary import Histogram
 
 def imitate_buffers():
     buffers = [
-        Buffer([12, 52, 72, 102, 132]),
-        Buffer([23, 33, 83, 143, 153]),
-        Buffer([44, 64, 94, 114, 124]),
+        Buffer(5, [12, 52, 72, 102, 132]),
+        Buffer(5, [23, 33, 83, 143, 153]),
+        Buffer(5, [44, 64, 94, 114, 124]),
         ]
     # artifitical
     buffers[0].weight = 1
-    buffers[0].full = True
+    buffers[0].full = Fullness.FULL
     buffers[1].weight = 1
-    buffers[1].full = True
+    buffers[1].full = Fullness.FULL
     buffers[2].weight = 1
-    buffers[2].full = True
+    buffers[2].full = Fullness.FULL
     return buffers
 
-mrl98 = MRL98([0]*15, 3, 5)
-mrl98.beta = 1
-print(f'Y: [52, 83, 114, 143, inf]')
-for phi in [0, 0.05, 0.2, 0.5, 0.7, 0.95, 1]:
-    res = mrl98.output(phi, imitate_buffers())
-    phi_tick = round(mrl98._calculate_phi_tick(phi), 5)
-    print(f'at {phi}: phi\': {phi_tick}, {res}')
\ No newline at end of file
+def test_output():
+    mrl98 = MRL98([0]*15, 3, 5)
+    mrl98.beta = 1
+    print(f'Y: [23, 44, 72, 102, 132]')
+    buffers = imitate_buffers()
+    summary = mrl98.summary(buffers)
+    for phi in [0, 0.05, 0.2, 0.5, 0.7, 0.95, 1]:
+        res = mrl98.output(phi, imitate_buffers())
+        phi_tick = round(mrl98._calculate_phi_tick(phi), 5)
+        print(f'at {phi}: phi\': {phi_tick}, {res}')
+        assert summary.quantile(phi) == res
+    # the summary does not touch the buffers
+    assert [buffer.elements for buffer in buffers] == [buffer.elements for buffer in imitate_buffers()]
+    assert summary.rank(72) == 7 and summary.cdf(153) == 1
+
+def test_summary():
+    '''
+    one summary answers every quantile the same way OUTPUT does, including the +inf/-inf padding
+    '''
+    data = np.random.default_rng(0).normal(0, 1, 10001)
+    phis = [0, 0.01, 0.25, 0.5, 0.9, 0.99, 1]
+    summary = NewAlgorithm('98', data, 4, 100, 0).summary()
+    assert summary.quantiles(phis).tolist() == [NewAlgorithm('98', data, 4, 100, phi).run() for phi in phis]
+    assert summary.total_weight == len(data)
+    assert abs(summary.cdf(0) - np.mean(data <= 0)) < 0.01
+
+def test_histogram(tmp_path):
+    '''
+    an equi-depth histogram of a padded sketch: no infinite boundaries, OUTPUT's answers inside, all elements counted
+    '''
+    data = np.random.default_rng(1).uniform(0, 1, 10001)
+    summary = NewAlgorithm('98', data, 4, 100, 0).summary()
+    histogram = summary.histogram(20)
+    assert np.all(np.isfinite(histogram.boundaries)) and np.all(np.diff(histogram.boundaries) >= 0)
+    assert histogram.boundaries[10] == NewAlgorithm('98', data, 4, 100, 0.5).run()
+    assert histogram.total == len(data) and np.all(np.abs(histogram.counts - len(data) / 20) < 0.02 * len(data))
+    assert abs(histogram.cdf(0.3) - 0.3) < 0.02
+    histogram.save(tmp_path / 'histogram.npy')
+    loaded = Histogram.load(tmp_path / 'histogram.npy')
+    assert loaded.to_array().shape == (2, 21) and np.array_equal(loaded.ranks, histogram.ranks)
@@ -0,0 +1,47 @@
+import numpy as np
+
+from mrl98 import Fullness
+from new_algorithm import NewAlgorithm
+from scheduler import POLICIES
+
+def test_policies():
+    '''
+    every policy keeps the buffer index consistent and answers within the error of its tree
+    '''
+    data = np.random.default_rng(5).normal(0, 1, 30000)
+    sorted_data = np.sort(data)
+    phis = np.array([0.05, 0.25, 0.5, 0.75, 0.95])
+    for policy in POLICIES:
+        for vectorized in [False, True]:
+            nalg = NewAlgorithm('98', None, 6, 100, 0.5, vectorized, policy=policy)
+            for start in range(0, len(data), 1000):
+                nalg.update(data[start:start + 1000])
+                pool = nalg.pool
+                assert sorted(map(id, pool.empty)) == sorted(id(buffer) for buffer in nalg.buffers if buffer.full == Fullness.EMPTY)
+                assert all(buffer.level == level for level, buffers in pool.levels.items() for buffer in buffers)
+                assert pool.filled_count() == sum(len(buffers) for buffers in pool.levels.values())
+            ranks = np.searchsorted(sorted_data, nalg.summary().quantiles(phis)) / len(data)
+            assert np.all(np.abs(ranks - phis) < 0.02), policy
+
+def test_munro_paterson():
+    '''
+    Munro-Paterson collapses pairs of buffers of the same level (while there are enough buffers): weights are powers of two
+    '''
+    nalg = NewAlgorithm('98', np.arange(1600.0), 5, 100, 0.5, policy='munro-paterson')
+    nalg.ingest()
+    assert all(buffer.weight & (buffer.weight - 1) == 0 for buffer in nalg.buffers if buffer.full != Fullness.EMPTY)
+
+def test_mrl99_rate():
+    '''
+    MRL99 starts without sampling (r = 1) and doubles r only when the tree gets higher
+    '''
+    data = np.random.default_rng(6).normal(0, 1, 200000)
+    nalg = NewAlgorithm('99', None, 6, 500, 0.5, vectorized=True, seed=1)
+    nalg.update(data[:1000])
+    assert nalg.r == 1 and all(buffer.weight == 1 for buffer in nalg.buffers if buffer.full != Fullness.EMPTY)
+    for start in range(1000, len(data), 5000):
+        nalg.update(data[start:start + 5000])
+        # leaves are at level 1
+        assert nalg.r == 2 ** (max(nalg.pool.levels) - 1)
+    ranks = np.searchsorted(np.sort(data), nalg.summary().quantiles(np.linspace(0.01, 0.99, 99))) / len(data)
+    assert np.max(np.abs(ranks - np.linspace(0.01, 0.99, 99))) < 0.01
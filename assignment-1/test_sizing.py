@@ -0,0 +1,58 @@
+from math import comb
+
+import numpy as np
+
+import sizing
+from evaluation import PHIS, rank_errors
+from new_algorithm import NewAlgorithm
+
+def test_solve_new_algorithm():
+    for e, N in [(0.001, 10**5), (0.01, 10**7), (0.001, 10**9)]:
+        b, k = sizing.solve_new_algorithm(e, N)
+        # some tree height satisfies both the capacity and the error constraint
+        assert any(k * comb(b + h - 2, h - 1) >= N and h / (2 * k) <= e for h in range(1, 100))
+    # more data never needs less memory
+    memory = [b * k for b, k in map(lambda N: sizing.solve_new_algorithm(0.01, N), [10**5, 10**6, 10**7, 10**9])]
+    assert memory == sorted(memory)
+
+def test_mrl99_schedule():
+    '''
+    the replayed schedule has the tree height and the rate of a real run
+    '''
+    for b, k, N in [(5, 100, 10**5), (4, 300, 10**6), (8, 50, 3 * 10**5)]:
+        sketch = NewAlgorithm('99', np.random.default_rng(1).uniform(size=N), b, k, 0.5, vectorized=True, seed=1)
+        sketch.run()
+        top = max(buffer.level for buffer in sketch.buffers)
+        assert sizing.mrl99_schedule(b, k, N) == (top + 1, sketch.r)
+
+def test_solve_mrl99():
+    for e, N in [(0.01, 10**5), (0.01, 10**9), (0.001, 10**7)]:
+        b, k = sizing.solve_mrl99(e, N)
+        # both the buffers and the sampling at the final rate stay within e
+        h, r = sizing.mrl99_schedule(b, k, N)
+        assert h / (2 * k) <= e
+        assert r == 1 or r * sizing.sample_size(e - h / (2 * k)) <= N
+    mrl99, mrl98 = sizing.solve('99', 0.01, 10**9), sizing.solve('98', 0.01, 10**9)
+    assert mrl99['mrl_type'] == '99' and mrl99['b'] * mrl99['k'] < mrl98['b'] * mrl98['k']
+    # the answer of a real run is within e
+    e, N = 0.05, 10**6
+    data = np.random.default_rng(2).normal(size=N)
+    params = sizing.solve('99', e, N)
+    assert params['mrl_type'] == '99'
+    summary = NewAlgorithm('99', data, params['b'], params['k'], 0.5, vectorized=True, seed=3).summary()
+    assert np.max(rank_errors(np.sort(data), summary.quantiles(PHIS), PHIS)) <= e
+
+def test_solve_mrl99_fallback():
+    '''
+    where sampling needs more memory than the deterministic New Algorithm, solve returns MRL98
+    '''
+    for e, N in [(0.001, 10**5), (0.001, 10**6), (0.001, 10**7), (0.01, 10**5), (0.1, 10**5), (0.01, 10**9)]:
+        mrl99, mrl98 = sizing.solve('99', e, N), sizing.solve('98', e, N)
+        sampled = sizing.solve_mrl99(e, N)
+        assert mrl99['b'] * mrl99['k'] == min(sampled[0] * sampled[1], mrl98['b'] * mrl98['k'])
+        if mrl99['mrl_type'] == '98':
+            assert (mrl99['b'], mrl99['k']) == (mrl98['b'], mrl98['k'])
+        # never more memory than MRL98, and never the whole dataset
+        assert mrl99['b'] * mrl99['k'] <= mrl98['b'] * mrl98['k'] < N
+    assert sizing.solve('99', 0.001, 10**5)['mrl_type'] == '98'
+    assert sizing.solve('99', 0.1, 10**5)['mrl_type'] == '99'
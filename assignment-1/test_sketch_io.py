@@ -0,0 +1,44 @@
+import numpy as np
+
+from new_algorithm import NewAlgorithm
+from sketch_io import ingest_with_checkpoints, load_sketch, read_header, save_sketch
+
+def test_save_load(tmp_path):
+    data = np.random.default_rng(0).normal(0, 1, 30000)
+    phis = [0, 0.1, 0.5, 0.9, 1]
+    for vectorized in [False, True]:
+        expected = NewAlgorithm('98', data, 5, 250, 0.5, vectorized).summary().quantiles(phis)
+        nalg = NewAlgorithm('98', None, 5, 250, 0.5, vectorized)
+        nalg.update(data[:12345])
+        save_sketch(nalg, tmp_path / 'sketch')
+        header, _ = read_header(tmp_path / 'sketch')
+        read = header['input_seq_len'] + header['pending']
+        assert read == 12345
+        # resume from where the saved sketch stopped reading
+        for mmap in [False, True]:
+            resumed = load_sketch(tmp_path / 'sketch', data[read:], mmap=mmap)
+            assert resumed.summary().quantiles(phis).tolist() == expected.tolist()
+
+def test_save_load_mrl99(tmp_path):
+    '''
+    a resumed MRL99 sketch draws the same samples as an uninterrupted one
+    '''
+    data = np.random.default_rng(2).normal(0, 1, 30000)
+    phis = [0, 0.1, 0.5, 0.9, 1]
+    for vectorized in [False, True]:
+        expected = NewAlgorithm('99', data, 5, 100, 0.5, vectorized, seed=3).summary().quantiles(phis)
+        nalg = NewAlgorithm('99', None, 5, 100, 0.5, vectorized, seed=3)
+        nalg.update(data[:12345])
+        assert nalg.r > 1
+        save_sketch(nalg, tmp_path / 'sketch')
+        header, _ = read_header(tmp_path / 'sketch')
+        read = header['input_seq_len'] + header['pending']
+        resumed = load_sketch(tmp_path / 'sketch', data[read:])
+        assert resumed.r == nalg.r
+        assert resumed.summary().quantiles(phis).tolist() == expected.tolist()
+
+def test_checkpoints(tmp_path):
+    data = np.random.default_rng(1).normal(0, 1, 20000)
+    nalg = NewAlgorithm('98', data, 4, 300, 0.3, vectorized=True)
+    ingest_with_checkpoints(nalg, tmp_path / 'checkpoint', every=5000)
+    assert load_sketch(tmp_path / 'checkpoint').run() == NewAlgorithm('98', data, 4, 300, 0.3).run()
@@ -0,0 +1,36 @@
+import numpy as np
+
+from evaluation import rank_errors
+from window import SlidingWindow
+
+def test_count_window():
+    '''
+    quantiles follow the last `window` elements of a drifting stream, old buckets are dropped
+    '''
+    rng = np.random.default_rng(6)
+    data = np.concatenate([rng.normal(0, 1, 30000), rng.normal(10, 1, 30000)])
+    window = SlidingWindow(10000, 1000, '98', 5, 200, by='count')
+    phis = np.array([0.01, 0.5, 0.99])
+    for start in range(0, len(data), 700):
+        window.update(data[start:start + 700])
+        last = np.sort(data[max(0, start + 700 - 10000):start + 700])
+        # the window covers up to one extra bucket
+        assert np.all(rank_errors(last, window.quantiles(phis), phis) < 0.12)
+        assert len(window.buckets) <= 11
+    assert abs(window.quantile(0.5) - 10) < 0.1
+    assert 10000 <= window.size() <= 11000
+
+def test_time_window():
+    '''
+    timestamps decide the bucket of every element and the clock expires the window
+    '''
+    now = [100.0]
+    window = SlidingWindow(60, 10, '99', 4, 100, seed=1, clock=lambda: now[0])
+    window.update(np.arange(1000.0), timestamps=np.linspace(40, 99, 1000))
+    window.update(np.full(500, 5000.0))
+    assert window.quantile(1) == 5000 and window.size() == 1500
+    now[0] = 150
+    # the elements before t=90 have expired
+    assert window.quantile(0) >= 800
+    now[0] = 200
+    assert np.isnan(window.quantile(0.5)) and window.size() == 0
@@ -0,0 +1,155 @@
+'''
+Sliding-window quantiles, e.g. "p99 over the last 5 minutes".
+
+The window is split into buckets of a fixed span of time (or of a fixed number of
+elements). Every bucket is summarized by its own `NewAlgorithm` fed through
+`update`, so an inserted element costs the same amortized work as in one sketch.
+When a bucket is closed the rest of its input is ingested, so it keeps only its
+b buffers, and whole buckets are dropped once they are older than the window.
+A query combines the weighted elements of the live buckets; it covers the window
+plus at most one partly expired bucket.
+'''
+from collections import deque
+from time import monotonic
+from typing import Callable, Iterable, Optional, Union
+
+import numpy as np
+
+from mrl98 import Fullness
+from new_algorithm import NewAlgorithm
+
+BY = ['time', 'count']
+
+
+class SlidingWindow:
+    '''
+    Quantiles of the elements of the last `window` seconds (or elements)
+    '''
+    def __init__(self, window: float, bucket: float, mrl_type: str, b: int, be: int, by: str = 'time',
+                 vectorized: bool = True, seed=None, clock: Callable[[], float] = monotonic):
+        '''
+        @param window: length of the window, in seconds (by='time') or in elements (by='count')
+        @param bucket: span of one bucket in the same unit; memory grows with window / bucket,
+        the precision of the window boundary with bucket
+        @param mrl_type: 98 or 99, the sketch of every bucket
+        @param b: number of buffers per bucket
+        @param be: number of elements per buffer
+        @param by: 'time' or 'count'
+        @param vectorized: use array-backed buffers with the vectorized COLLAPSE
+        @param seed: seed of the MRL99 sampling
+        @param clock: current time when timestamps are not given (by='time')
+        '''
+        assert by in BY, f'by must be from {BY}'
+        assert 0 < bucket <= window, 'bucket must be positive and not longer than the window'
+        self.window = window
+        self.bucket = bucket
+        self.mrl_type = mrl_type
+        self.b = b
+        self.be = be
+        self.by = by
+        self.vectorized = vectorized
+        self.clock = clock
+        self._seeds = np.random.SeedSequence(seed)
+        # (bucket index, sketch), oldest first
+        self.buckets = deque()
+        self.count = 0 # number of elements inserted so far
+
+    def _now(self) -> float:
+        return self.count if self.by == 'count' else self.clock()
+
+    def _open_bucket(self, index: int) -> NewAlgorithm:
+        if self.buckets:
+            # a closed bucket keeps only its buffers
+            self.buckets[-1][1].ingest()
+        nalg = NewAlgorithm(self.mrl_type, None, self.b, self.be, 0.5, self.vectorized, self._seeds.spawn(1)[0])
+        self.buckets.append((index, nalg))
+        return nalg
+
+    def update(self, values: Union[Iterable, np.ndarray], timestamps: Optional[Iterable] = None):
+        '''
+        inserts elements
+        @param values: new elements
+        @param timestamps: time of every element (by='time' only), non-decreasing; the current time of
+        `clock` by default. Elements older than the newest bucket are counted in the newest bucket.
+        '''
+        values = np.asarray(values, dtype=np.float64).reshape(-1)
+        if self.by == 'count':
+            assert timestamps is None, 'elements of a count-based window have no timestamps'
+            positions = self.count + np.arange(len(values))
+        elif timestamps is None:
+            positions = np.full(len(values), self.clock())
+        else:
+            positions = np.asarray(timestamps, dtype=np.float64).reshape(-1)
+            assert len(positions) == len(values), 'there must be one timestamp per element'
+        indices = np.floor_divide(positions, self.bucket).astype(np.int64)
+        if self.buckets:
+            indices = np.maximum(indices, self.buckets[-1][0])
+        indices = np.maximum.accumulate(indices) if len(indices) else indices
+        # runs of elements that belong to the same bucket
+        bounds = [0, *(np.flatnonzero(np.diff(indices)) + 1), len(values)]
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            if start == stop:
+                continue
+            index = int(indices[start])
+            nalg = self.buckets[-1][1] if self.buckets and self.buckets[-1][0] == index else self._open_bucket(index)
+            nalg.update(values[start:stop])
+        self.count += len(values)
+        if len(values):
+            self.expire(positions[-1] + (1 if self.by == 'count' else 0))
+
+    def expire(self, now: Optional[float] = None):
+        '''
+        drops the buckets that ended before the window that ends at `now` starts
+        '''
+        now = self._now() if now is None else now
+        while self.buckets and (self.buckets[0][0] + 1) * self.bucket <= now - self.window:
+            self.buckets.popleft()
+
+    def _weighted_elements(self) -> 'tuple[np.ndarray, np.ndarray]':
+        '''
+        sorted elements of the live buckets and their cumulative weights
+        '''
+        values, weights = [], []
+        for _, nalg in self.buckets:
+            for buffer in nalg.buffers:
+                if buffer.full != Fullness.EMPTY:
+                    values.append(np.asarray(buffer.elements, dtype=np.float64))
+                    weights.append(np.full(len(values[-1]), buffer.weight, dtype=np.int64))
+            # elements of the open bucket that are not in buffers yet
+            pending = nalg.stream.buffered().astype(np.float64)
+            values.append(pending)
+            weights.append(np.ones(len(pending), dtype=np.int64))
+        if not values:
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        values, weights = np.concatenate(values), np.concatenate(weights)
+        # the +inf and -inf padding of closed buckets is not a part of the data
+        finite = np.isfinite(values)
+        values, weights = values[finite], weights[finite]
+        order = np.argsort(values, kind='stable')
+        return values[order], np.cumsum(weights[order])
+
+    def quantiles(self, phis: Union[float, Iterable[float]], now: Optional[float] = None) -> np.ndarray:
+        '''
+        elements at the given quantiles of the current window; nan if the window is empty
+        @param phis: one or more quantiles from [0, 1]
+        @param now: end of the window (the current time or count by default)
+        '''
+        phis = np.asarray(phis, dtype=np.float64)
+        assert np.all((0 <= phis) & (phis <= 1)), 'phi must be from [0, 1]'
+        self.expire(now)
+        values, cum_weights = self._weighted_elements()
+        if not len(values):
+            return np.full(phis.shape, np.nan)
+        indices = np.searchsorted(cum_weights, phis * cum_weights[-1], side='left')
+        return values[np.minimum(indices, len(values) - 1)]
+
+    def quantile(self, phi: float, now: Optional[float] = None) -> float:
+        return self.quantiles(phi, now).item()
+
+    def size(self, now: Optional[float] = None) -> int:
+        '''
+        estimated number of elements in the current window
+        '''
+        self.expire(now)
+        _, cum_weights = self._weighted_elements()
+        return int(cum_weights[-1]) if len(cum_weights) else 0
@@ -1,4 +1,7 @@
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
 import pandas as pd
 import numpy as np
 from math import sin, cos, pi, sqrt, exp
@@ -8,9 +11,19 @@ import plotly.graph_objects as go
 from geopy.distance import geodesic
 from tqdm import tqdm
 from visualizer import animate_me
+from trajectory import TrajectoryRecorder
 
 PATH = Path('russian_cities.csv')
+CACHE_DIR = Path('.distance_cache')
 EARTHR = 6371
+# WGS-84 ellipsoid
+EARTH_A = 6378.137
+EARTH_F = 1 / 298.257223563
+# largest relative error of each method against the geodesic on WGS-84
+HAVERSINE_ERROR = 5e-3
+LAMBERT_ERROR = 1e-5
+# size of the candidate lists of the moves
+K_NEIGHBOURS = 8
 
 # ------ PREPROCESSING -------
 
@@ -28,19 +41,213 @@ def read_csv(path: Path, sort_by='population', take_sorted_n=30) -> pd.DataFrame
     df.index = range(len(df))
     return df
 
-def create_distance_matrix(cities_df: pd.DataFrame) -> 'tuple[list, dict[str, dict[str, float]]]':
+def _central_angle(lat, lon) -> np.ndarray:
+    '''
+    angles (radians) between all pairs of points on a sphere, haversine formula
+    '''
+    dlat = lat[:, None] - lat[None, :]
+    dlon = lon[:, None] - lon[None, :]
+    h = np.sin(dlat / 2) ** 2 + np.cos(lat[:, None]) * np.cos(lat[None, :]) * np.sin(dlon / 2) ** 2
+    return 2 * np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+
+def haversine_matrix(lat, lon) -> np.ndarray:
+    '''
+    all pairwise distances (km) on a sphere of radius EARTHR
+    @param lat, lon: coordinates in degrees
+    '''
+    return EARTHR * _central_angle(np.radians(lat), np.radians(lon))
+
+def lambert_matrix(lat, lon) -> np.ndarray:
+    '''
+    all pairwise distances (km) on the WGS-84 ellipsoid, Lambert's formula for long lines
+    @param lat, lon: coordinates in degrees
+    '''
+    # reduced latitudes
+    beta = np.arctan((1 - EARTH_F) * np.tan(np.radians(lat)))
+    sigma = _central_angle(beta, np.radians(lon))
+    p = (beta[:, None] + beta[None, :]) / 2
+    q = (beta[None, :] - beta[:, None]) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = (sigma - np.sin(sigma)) * np.sin(p) ** 2 * np.cos(q) ** 2 / np.cos(sigma / 2) ** 2
+        y = (sigma + np.sin(sigma)) * np.cos(p) ** 2 * np.sin(q) ** 2 / np.sin(sigma / 2) ** 2
+        distances = EARTH_A * (sigma - EARTH_F / 2 * (x + y))
+    return np.where(sigma > 0, distances, 0)
+
+def geodesic_matrix(lat, lon) -> np.ndarray:
+    '''
+    all pairwise geodesic distances (km) of geopy, one pair at a time
+    '''
+    points = list(zip(lat, lon))
+    distances = np.zeros((len(points), len(points)))
+    for i in range(len(points)):
+        for j in range(i + 1, len(points)):
+            distances[i, j] = distances[j, i] = geodesic(points[i], points[j]).km
+    return distances
+
+def distance_method(tolerance: float):
+    '''
+    the fastest method whose relative error is within `tolerance`
+    '''
+    if tolerance >= HAVERSINE_ERROR:
+        return haversine_matrix
+    if tolerance >= LAMBERT_ERROR:
+        return lambert_matrix
+    return geodesic_matrix
+
+def _cache_path(cities: 'list[str]', lat, lon, method, cache_dir: Path) -> Path:
+    '''
+    cache file of a set of cities (in any order) and a method
+    '''
+    key = hashlib.sha1(method.__name__.encode())
+    for city, city_lat, city_lon in sorted(zip(cities, lat, lon)):
+        key.update(f'{city}|{city_lat!r}|{city_lon!r}\n'.encode())
+    return cache_dir / f'{key.hexdigest()}.npy'
+
+def create_distance_matrix(cities_df: pd.DataFrame, tolerance: float = LAMBERT_ERROR, cache_dir: 'Path | None' = CACHE_DIR):
+    '''
+    @param cities_df: cities of `read_csv`
+    @param tolerance: allowed relative error of the distances, see `distance_method`
+    @param cache_dir: where matrices are kept between runs; None disables the cache
+    @return cities, the (n, n) matrix of distances in km in the order of `cities`, coordinates of every city
+    '''
     cities = cities_df['address'].to_list()
-    num_cities = len(cities_df)
-    distance_dict = {city: {city_: 0 for city_ in cities} for city in cities}
-    coordinates_dict = {}
-    for i in range(num_cities):
-        coord1 = cities_df.iloc[[i]][['geo_lat', 'geo_lon']].values[0]
-        for j in range(num_cities):
-            coord2 = cities_df.iloc[[j]][['geo_lat', 'geo_lon']].values[0]
-            dist = geodesic(coord1, coord2).km
-            distance_dict[cities[i]][cities[j]] = dist
-        coordinates_dict[cities[i]] = GeoCoordinate(coord1)
-    return cities, distance_dict, coordinates_dict
+    lat = cities_df['geo_lat'].to_numpy(dtype=np.float64)
+    lon = cities_df['geo_lon'].to_numpy(dtype=np.float64)
+    coordinates_dict = {city: GeoCoordinate(coord) for city, coord in zip(cities, zip(lat, lon))}
+    method = distance_method(tolerance)
+    # the cached matrix is in the sorted order of the cities
+    order = np.argsort(cities, kind='stable')
+    path = None if cache_dir is None else _cache_path(cities, lat, lon, method, Path(cache_dir))
+    if path is not None and path.exists():
+        distances = np.empty((len(cities), len(cities)))
+        distances[np.ix_(order, order)] = np.load(path)
+        return cities, distances, coordinates_dict
+    distances = method(lat, lon)
+    if path is not None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.save(path, distances[np.ix_(order, order)])
+    return cities, distances, coordinates_dict
+
+# ------ MOVES -------
+# Every move proposes a change of the open path together with the change of its length,
+# computed from the edges it replaces only, and applies it in place if it is accepted.
+
+def nearest_neighbours(distances: np.ndarray, k: int = K_NEIGHBOURS) -> np.ndarray:
+    '''
+    candidate lists: the k nearest other cities of every city, the nearest first
+    '''
+    k = min(k, len(distances) - 1)
+    assert k >= 1, 'there must be at least two cities'
+    masked = distances + np.diag(np.full(len(distances), np.inf))
+    nearest = np.argpartition(masked, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(masked, nearest, axis=1).argsort(axis=1)
+    return np.take_along_axis(nearest, order, axis=1)
+
+def _candidate(sa):
+    '''
+    positions of a random city and of one of its nearest neighbours
+    '''
+    city = sa.random.randrange(len(sa.tour))
+    neighbour = sa.neighbours[city, sa.random.randrange(sa.neighbours.shape[1])]
+    return sa.positions[city], sa.positions[neighbour]
+
+class SwapMove:
+    '''
+    swaps the cities at two random positions
+    '''
+    name = 'swap'
+
+    def propose(self, sa):
+        i, j = sa.random.sample(range(len(sa.tour)), k=2)
+        tour, distances = sa.tour, sa.cities_distances
+        swapped = {i: tour[j], j: tour[i]}
+        delta = 0.0
+        # only the edges that start at i - 1, i, j - 1 and j change
+        for start in {i - 1, i, j - 1, j}:
+            if 0 <= start < len(tour) - 1:
+                delta += distances[swapped.get(start, tour[start]), swapped.get(start + 1, tour[start + 1])]
+                delta -= distances[tour[start], tour[start + 1]]
+        return delta, (i, j)
+
+    def apply(self, sa, args):
+        i, j = args
+        sa.tour[i], sa.tour[j] = sa.tour[j], sa.tour[i]
+        sa.positions[sa.tour[[i, j]]] = [i, j]
+
+class TwoOptMove:
+    '''
+    reverses the part of the path between a city and one of its nearest neighbours, so they become adjacent
+    '''
+    name = '2-opt'
+
+    def propose(self, sa):
+        p, q = _candidate(sa)
+        # the part i + 1..j is reversed, i = -1 is the start of the path
+        i, j = (p, q) if p < q else (q - 1, p - 1)
+        if j - i < 2:
+            # already adjacent
+            return None
+        tour, distances = sa.tour, sa.cities_distances
+        delta = 0.0
+        if i >= 0:
+            delta += distances[tour[i], tour[j]] - distances[tour[i], tour[i + 1]]
+        if j + 1 < len(tour):
+            delta += distances[tour[i + 1], tour[j + 1]] - distances[tour[j], tour[j + 1]]
+        return delta, (i, j)
+
+    def apply(self, sa, args):
+        i, j = args
+        sa.tour[i + 1:j + 1] = sa.tour[i + 1:j + 1][::-1].copy()
+        sa.positions[sa.tour[i + 1:j + 1]] = np.arange(i + 1, j + 1)
+
+class OrOptMove:
+    '''
+    moves 1 to `max_length` cities that start at a random city right after one of its nearest neighbours
+    '''
+    name = 'or-opt'
+    max_length = 3
+
+    def propose(self, sa):
+        p, q = _candidate(sa)
+        n = len(sa.tour)
+        length = sa.random.randint(1, self.max_length)
+        if p + length > n or p <= q < p + length or q == p - 1:
+            return None
+        tour, distances = sa.tour, sa.cities_distances
+        first, last = tour[p], tour[p + length - 1]
+        delta = 0.0
+        # the gap of the segment is closed
+        if p > 0:
+            delta -= distances[tour[p - 1], first]
+        if p + length < n:
+            delta -= distances[last, tour[p + length]]
+        if p > 0 and p + length < n:
+            delta += distances[tour[p - 1], tour[p + length]]
+        # and the segment goes between q and q + 1
+        delta += distances[tour[q], first]
+        if q + 1 < n:
+            delta += distances[last, tour[q + 1]] - distances[tour[q], tour[q + 1]]
+        return delta, (p, length, q)
+
+    def apply(self, sa, args):
+        p, length, q = args
+        tour = sa.tour
+        segment = tour[p:p + length].copy()
+        if q > p:
+            start, stop = p, q + 1
+            tour[p:q + 1 - length] = tour[p + length:q + 1].copy()
+            tour[q + 1 - length:q + 1] = segment
+        else:
+            start, stop = q + 1, p + length
+            tour[q + 1 + length:p + length] = tour[q + 1:p].copy()
+            tour[q + 1:q + 1 + length] = segment
+        sa.positions[tour[start:stop]] = np.arange(start, stop)
+
+MOVES = {move.name: move for move in [TwoOptMove, OrOptMove, SwapMove]}
+
+def get_move(name: str):
+    assert name in MOVES, f'move must be from {list(MOVES)}'
+    return MOVES[name]()
 
 # -------------------------------------------------------------------------
 # Annealing Rate
@@ -51,82 +258,208 @@ class Cooling(Enum):
 
 class SimulatedAnnealing:
     T = 10000
-    def __init__(self, cities_distances, cities_coords, cooling_type: Cooling, decr_T_every_n_iters: int, T_lower: int):
-        self.state = {}
-        self.all_states = []
+    def __init__(self, cities_distances: np.ndarray, cities_coords, cooling_type: Cooling, decr_T_every_n_iters: int, T_lower: int,
+                 moves=tuple(MOVES), neighbours: int = K_NEIGHBOURS, seed=None, save_states: bool = True, verbose: bool = True,
+                 recorder: 'TrajectoryRecorder | None' = None):
+        '''
+        @param cities_distances: matrix of `create_distance_matrix`
+        @param cities_coords: coordinates of the cities in the order of the matrix
+        @param moves: names of the moves (keys of `MOVES`); every iteration picks one of them at random
+        @param neighbours: size of the candidate lists of 2-opt and Or-opt
+        @param seed: seed of the chain's own random generator
+        @param save_states: record the trajectory, see `all_states`
+        @param verbose: print the temperature
+        @param recorder: where the trajectory is recorded (a default in-memory `TrajectoryRecorder` if not given)
+        '''
+        self.random = random.Random(seed)
+        self.verbose = verbose
 
         self.cities_distances = cities_distances
         self.cities_coords = cities_coords
+        # city names in the order of the rows of the matrix
+        self.cities = list(cities_coords)
+        if recorder is None and save_states:
+            recorder = TrajectoryRecorder(len(self.cities))
+        self.recorder = recorder
+        # the state: an open path given as indices into `self.cities`, and its length
+        self.tour = np.empty(0, dtype=np.int64)
+        # position of every city in the tour
+        self.positions = np.empty(0, dtype=np.int64)
+        self.distance = 0.0
+        self.moves = [get_move(name) for name in moves]
+        self.neighbours = nearest_neighbours(cities_distances, neighbours)
         self.annealing_rate = cooling_type.value
         self.T_lower = T_lower
         self.decr_T_every_n_iters = decr_T_every_n_iters
         self._generate_initial_state()
+        # the shortest path seen so far
+        self.best_tour = self.tour.copy()
+        self.best_distance = self.distance
 
-    def _p_star(self, distance):
-        return exp(- distance / self.T)
+    @property
+    def state(self):
+        return {'cities': [self.cities[city] for city in self.tour], 'distance': self.distance}
 
-    def _alpha(self, new_state_distance):
-        print(self.state['distance'], self._p_star(self.state['distance']))
-        return self._p_star(new_state_distance) / self._p_star(self.state['distance'])
+    @property
+    def all_states(self):
+        '''
+        frames of the recorded tours for `animate_me`
+        '''
+        return [] if self.recorder is None else self.recorder.states(self.cities)
 
-    def _accept_new_state(self, new_state):
-        alpha = self._alpha(new_state['distance'])
-        u = random.uniform(0, 1)
-        return True if u <= alpha else False
+    def _accept(self, delta):
+        '''
+        Metropolis rule: p*(new) / p*(old) = exp(-delta / T), so a shorter path is always accepted
+        '''
+        return delta <= 0 or self.random.uniform(0, 1) <= exp(- delta / self.T)
 
     def _generate_initial_state(self):
-        cities = random.sample(self.cities_distances.keys(), k=len(self.cities_distances))
-        distance = self._calculate_distance(cities)
-        self.state = {'cities': cities, 'distance': distance}
+        self.tour = np.array(self.random.sample(range(len(self.cities)), k=len(self.cities)), dtype=np.int64)
+        self.positions = np.argsort(self.tour)
+        self.distance = self._calculate_distance(self.tour)
 
     def _update_state(self):
-        i, j = random.sample(range(len(self.state['cities'])), k=2)
-        new_cities = self.state['cities'].copy()
-        new_cities[i], new_cities[j] = new_cities[j], new_cities[i]
-        new_distance = self._calculate_distance(new_cities)
-        new_state = {'cities': new_cities, 'distance': new_distance}
-        # if the new solution is better, update the state
-        if self._accept_new_state(new_state):
-            self.state = new_state
-
-    def _calculate_distance(self, cities):
-        distance = 0
-        for i in range(len(cities[:-1])):
-            a = cities[i]
-            b = cities[i + 1]
-            try:
-                distance += self.cities_distances[a][b]
-            except:
-                distance += self.cities_distances[b][a]
-        return distance
+        '''
+        @return True if the proposed move was accepted
+        '''
+        move = self.random.choice(self.moves)
+        proposal = move.propose(self)
+        if proposal is None:
+            return False
+        delta, args = proposal
+        # if the new solution is accepted, the move is applied in place
+        if not self._accept(delta):
+            return False
+        move.apply(self, args)
+        self.distance += delta
+        if self.distance < self.best_distance:
+            self.best_tour[:] = self.tour
+            self.best_distance = self.distance
+        return True
+
+    def set_tour(self, tour, distance):
+        '''
+        replaces the state, e.g. by the state of another chain
+        '''
+        self.tour = tour
+        self.positions = np.argsort(tour)
+        self.distance = distance
+
+    def anneal(self, iterations: int):
+        '''
+        runs `iterations` iterations at the current temperature
+        '''
+        for _ in range(iterations):
+            self._update_state()
+
+    def _calculate_distance(self, tour):
+        return float(self.cities_distances[tour[:-1], tour[1:]].sum())
 
     def _continue_running(self):
         return self.T_lower < self.T
 
     def _update_T(self):
         if self.current_iteration % self.decr_T_every_n_iters == 0:
-            print(f'T={self.T}')
+            if self.verbose:
+                print(f'T={self.T}')
             self.T = self.T * self.annealing_rate
 
     def run(self):
         self.current_iteration = 0
         while self._continue_running():
-            self._update_state()
+            self.current_iteration += 1
+            accepted = self._update_state()
             self._update_T()
-            self._save_state()
-
-    def _save_state(self):
-        cities = self.state['cities']
-        distance = self.state['distance']
-        title = f'Iteration: {self.current_iteration}; Distance: {distance} km'
-        self.all_states.append(
-            {
-                'title': title,
-                'cities': cities,
-                'distance': round(distance, 2),
-                'temp': round(self.T, 2),
-            }
-        )
+            if self.recorder is not None:
+                self.recorder.record(self.current_iteration, self.distance, self.T, accepted, self.tour)
+        if self.recorder is not None:
+            self.recorder.close()
+        # the deltas add up rounding errors
+        self.distance = self._calculate_distance(self.tour)
+        self.best_distance = self._calculate_distance(self.best_tour)
+
+
+# ------ MULTIPLE CHAINS -------
+
+# the matrix and the coordinates of a worker process, set once by `_init_worker` instead of being sent with every job
+_worker = {}
+
+def _init_worker(cities_distances, cities_coords):
+    _worker['distances'] = cities_distances
+    _worker['coords'] = cities_coords
+
+def _run_chain(job):
+    '''
+    one independent annealing chain, or one parallel-tempering ensemble; runs in a worker process
+    @return the shortest path found and its length
+    '''
+    distances, coords = _worker['distances'], _worker['coords']
+    if job['temperatures'] is not None:
+        return parallel_tempering(distances, coords, job['temperatures'], job['sweeps'], job['steps'], job['seed'], job['moves'])
+    sa = SimulatedAnnealing(distances, coords, job['cooling'], job['decr_T_every_n_iters'], job['T_lower'],
+                            moves=job['moves'], seed=job['seed'], save_states=False, verbose=False)
+    sa.run()
+    return sa.best_tour, sa.best_distance
+
+def parallel_tempering(cities_distances, cities_coords, temperatures, sweeps: int, steps: int, seed=None, moves=tuple(MOVES)):
+    '''
+    replicas at fixed temperatures; after every sweep of `steps` iterations neighbouring replicas
+    exchange their states with probability min(1, exp((1 / T_i - 1 / T_j) * (d_i - d_j)))
+    @param temperatures: temperature of every replica
+    @param sweeps: number of exchange rounds
+    @return the shortest path found by any replica and its length
+    '''
+    generator = random.Random(seed)
+    replicas = []
+    for T in temperatures:
+        replica = SimulatedAnnealing(cities_distances, cities_coords, Cooling.Slow, 1, 0, moves=moves,
+                                     seed=generator.getrandbits(64), save_states=False, verbose=False)
+        replica.T = T
+        replicas.append(replica)
+    for sweep in range(sweeps):
+        for replica in replicas:
+            replica.anneal(steps)
+        # even and odd pairs take turns
+        for i in range(sweep % 2, len(replicas) - 1, 2):
+            a, b = replicas[i], replicas[i + 1]
+            exponent = (1 / a.T - 1 / b.T) * (a.distance - b.distance)
+            if exponent >= 0 or generator.random() < exp(exponent):
+                a_tour, a_distance = a.tour, a.distance
+                a.set_tour(b.tour, b.distance)
+                b.set_tour(a_tour, a_distance)
+    best = min(replicas, key=lambda replica: replica.best_distance)
+    return best.best_tour, best._calculate_distance(best.best_tour)
+
+def geometric_temperatures(T_high: float, T_low: float, replicas: int):
+    return list(np.geomspace(T_high, T_low, replicas))
+
+def run_chains(cities_distances, cities_coords, cooling_type: Cooling = Cooling.Slow, decr_T_every_n_iters: int = 1,
+               T_lower: int = 60, chains: 'int | None' = None, workers: 'int | None' = None, seed=None, moves=tuple(MOVES),
+               temperatures=None, sweeps: int = 100, steps: int = 100):
+    '''
+    runs independent chains over a process pool
+    @param chains: number of chains (the number of CPUs by default)
+    @param workers: number of processes (the number of CPUs by default)
+    @param seed: every chain gets its own seed spawned from it
+    @param temperatures: if given, every chain is a parallel-tempering ensemble at these temperatures
+    (see `parallel_tempering`, `sweeps` and `steps`) instead of one cooling schedule
+    @return {'cities': the shortest path, 'distance': its length, 'chains': length found by every chain}
+    '''
+    chains = chains or os.cpu_count() or 1
+    seeds = [int(chain_seed.generate_state(1)[0]) for chain_seed in np.random.SeedSequence(seed).spawn(chains)]
+    jobs = [{
+        'cooling': cooling_type, 'decr_T_every_n_iters': decr_T_every_n_iters, 'T_lower': T_lower, 'moves': moves,
+        'seed': chain_seed, 'temperatures': temperatures, 'sweeps': sweeps, 'steps': steps,
+    } for chain_seed in seeds]
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(cities_distances, cities_coords)) as pool:
+        results = list(pool.map(_run_chain, jobs))
+    best_tour, best_distance = min(results, key=lambda result: result[1])
+    cities = list(cities_coords)
+    return {
+        'cities': [cities[city] for city in best_tour],
+        'distance': best_distance,
+        'chains': [distance for _, distance in results],
+    }
 
 
 if __name__ == '__main__':
@@ -134,16 +467,26 @@ if __name__ == '__main__':
     Path(dirname).mkdir(exist_ok=True)
     coolings = [Cooling.Slow, Cooling.Mild, Cooling.Fast]
     decr_T_every_n_iters = 1
+    # the matrix is built once (and cached on disk for the next runs)
+    # the animations show the largest cities only
+    take_sorted_n = 30
+    cities_df = read_csv(PATH, take_sorted_n=take_sorted_n)
+    cities, distances, coordinates_dict = create_distance_matrix(cities_df)
     for cooling in coolings:
         # try:
-        cities_df = read_csv(PATH, take_sorted_n=30)
-        cities, distance_dict, coordinates_dict = create_distance_matrix(cities_df)
-        sa = SimulatedAnnealing(distance_dict, coordinates_dict, Cooling.Slow, T_lower=60, decr_T_every_n_iters=decr_T_every_n_iters)
+        sa = SimulatedAnnealing(distances, coordinates_dict, cooling, T_lower=60, decr_T_every_n_iters=decr_T_every_n_iters)
         sa.run()
         all_states = sa.all_states
-        last_dist = all_states[-1]['distance']
+        last_dist = round(sa.distance, 2)
         name = f'cool={cooling.value}_dist={last_dist}_decr={decr_T_every_n_iters}'
         print(last_dist, sa.T)
         animate_me(cities, all_states, coordinates_dict, dirname, name)
         # except:
-        #     print('didnt work:', cooling.value)
\ No newline at end of file
+        #     print('didnt work:', cooling.value)
+    # many chains over all CPUs on every city of the file, the candidate lists keep them fast:
+    # independent Slow coolings (with more iterations per temperature) and parallel-tempering ensembles
+    cities, distances, coordinates_dict = create_distance_matrix(read_csv(PATH, take_sorted_n=None))
+    result = run_chains(distances, coordinates_dict, Cooling.Slow, decr_T_every_n_iters=100, T_lower=60, seed=0)
+    print(f'Best of {len(result["chains"])} chains: {result["distance"]:.2f} km')
+    result = run_chains(distances, coordinates_dict, temperatures=geometric_temperatures(SimulatedAnnealing.T, 60, 8), seed=0)
+    print(f'Best of {len(result["chains"])} tempering ensembles: {result["distance"]:.2f} km')
\ No newline at end of file
@@ -0,0 +1,205 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import sa
+from sa import Cooling, OrOptMove, SimulatedAnnealing, SwapMove, TwoOptMove, nearest_neighbours
+from trajectory import TrajectoryRecorder
+
+SIZES = [2, 3, 4, 5, 10, 40]
+# Moscow, Saint Petersburg, Novosibirsk, Vladivostok, Yekaterinburg, Sochi, Murmansk, Arkhangelsk
+LAT = np.array([55.7558, 59.9343, 55.0084, 43.1155, 56.8389, 43.6028, 68.9585, 64.5401])
+LON = np.array([37.6173, 30.3351, 82.9357, 131.8855, 60.6057, 39.7342, 33.0827, 40.5433])
+
+def _annealer(n: int, seed: int = 0, recorder: 'TrajectoryRecorder | None' = None, moves=tuple(sa.MOVES)) -> SimulatedAnnealing:
+    '''
+    an annealer on n random points of the unit square
+    '''
+    points = np.random.default_rng(seed).uniform(size=(n, 2))
+    distances = np.sqrt(((points[:, None] - points[None]) ** 2).sum(axis=-1))
+    coords = {f'c{i}': tuple(point) for i, point in enumerate(points)}
+    return SimulatedAnnealing(distances, coords, Cooling.Slow, 1, 60, moves=moves, seed=seed, save_states=recorder is not None,
+                              verbose=False, recorder=recorder)
+
+def _check(annealer: SimulatedAnnealing, move, proposal):
+    '''
+    applies a proposal and checks its delta and the state after it
+    @return the state before the move
+    '''
+    tour = annealer.tour.copy()
+    delta, args = proposal
+    move.apply(annealer, args)
+    n = len(tour)
+    assert delta == pytest.approx(annealer._calculate_distance(annealer.tour) - annealer._calculate_distance(tour), abs=1e-12)
+    assert np.array_equal(np.sort(annealer.tour), np.arange(n))
+    assert np.array_equal(annealer.positions[annealer.tour], np.arange(n))
+    return tour
+
+def _restore(annealer: SimulatedAnnealing, tour: np.ndarray):
+    annealer.set_tour(tour, annealer._calculate_distance(tour))
+
+@pytest.mark.parametrize('method, tolerance', [(sa.haversine_matrix, 4e-3), (sa.lambert_matrix, 2e-6)])
+def test_distance_methods(method, tolerance):
+    '''
+    relative error of every pair against the geodesic of geopy
+    '''
+    expected = sa.geodesic_matrix(LAT, LON)
+    distances = method(LAT, LON)
+    assert np.array_equal(distances, distances.T) and np.all(np.diag(distances) == 0)
+    off_diagonal = ~np.eye(len(LAT), dtype=bool)
+    assert np.max(np.abs(distances - expected)[off_diagonal] / expected[off_diagonal]) < tolerance
+
+def test_distance_method():
+    assert sa.distance_method(sa.HAVERSINE_ERROR) is sa.haversine_matrix
+    assert sa.distance_method(1e-3) is sa.lambert_matrix
+    assert sa.distance_method(sa.LAMBERT_ERROR) is sa.lambert_matrix
+    assert sa.distance_method(1e-7) is sa.geodesic_matrix
+
+def test_distance_cache(tmp_path, monkeypatch):
+    '''
+    the cache returns the computed matrix, for the cities in any order
+    '''
+    cities = pd.DataFrame({'address': [f'c{i}' for i in range(len(LAT))], 'geo_lat': LAT, 'geo_lon': LON})
+    names, computed, _ = sa.create_distance_matrix(cities, cache_dir=tmp_path)
+    assert len(list(tmp_path.iterdir())) == 1
+
+    def lambert_matrix(lat, lon):
+        raise AssertionError('the matrix must come from the cache')
+
+    monkeypatch.setattr(sa, 'lambert_matrix', lambert_matrix)
+    assert np.array_equal(sa.create_distance_matrix(cities, cache_dir=tmp_path)[1], computed)
+    order = np.random.default_rng(0).permutation(len(LAT))
+    shuffled_names, shuffled, _ = sa.create_distance_matrix(cities.iloc[order], cache_dir=tmp_path)
+    assert shuffled_names == [names[i] for i in order]
+    assert np.array_equal(shuffled, computed[np.ix_(order, order)])
+    assert len(list(tmp_path.iterdir())) == 1
+    # other coordinates are another entry
+    moved = cities.assign(geo_lat=LAT + 0.01)
+    with pytest.raises(AssertionError):
+        sa.create_distance_matrix(moved, cache_dir=tmp_path)
+
+@pytest.mark.parametrize('n', SIZES)
+def test_two_opt(n, monkeypatch):
+    annealer = _annealer(n)
+    move = TwoOptMove()
+    for p in range(n):
+        for q in range(n):
+            if p == q:
+                continue
+            monkeypatch.setattr(sa, '_candidate', lambda _: (p, q))
+            first, second = annealer.tour[p], annealer.tour[q]
+            proposal = move.propose(annealer)
+            # j - i < 2: the cities are adjacent already
+            assert (proposal is None) == (abs(p - q) == 1)
+            if proposal is not None:
+                tour = _check(annealer, move, proposal)
+                assert abs(annealer.positions[first] - annealer.positions[second]) == 1
+                _restore(annealer, tour)
+
+@pytest.mark.parametrize('n', SIZES)
+def test_or_opt(n, monkeypatch):
+    annealer = _annealer(n)
+    move = OrOptMove()
+    for length in range(1, move.max_length + 1):
+        monkeypatch.setattr(annealer.random, 'randint', lambda a, b: length)
+        for p in range(n):
+            for q in range(n):
+                if p == q:
+                    continue
+                monkeypatch.setattr(sa, '_candidate', lambda _: (p, q))
+                segment, after = annealer.tour[p:p + length].copy(), annealer.tour[q]
+                proposal = move.propose(annealer)
+                assert (proposal is None) == (p + length > n or p <= q < p + length or q == p - 1)
+                if proposal is not None:
+                    tour = _check(annealer, move, proposal)
+                    # the segment follows the city at q
+                    start = annealer.positions[after] + 1
+                    assert np.array_equal(annealer.tour[start:start + length], segment)
+                    _restore(annealer, tour)
+
+@pytest.mark.parametrize('n', SIZES)
+def test_swap(n, monkeypatch):
+    annealer = _annealer(n)
+    move = SwapMove()
+    for i in range(n):
+        for j in range(n):
+            if i != j:
+                monkeypatch.setattr(annealer.random, 'sample', lambda population, k: [i, j])
+                tour = _check(annealer, move, move.propose(annealer))
+                _restore(annealer, tour)
+
+@pytest.mark.parametrize('n', SIZES)
+def test_swap_anneal(n):
+    '''
+    with swaps only, the length after every step equals a full recomputation and the best path is tracked
+    '''
+    annealer = _annealer(n, seed=n, moves=('swap',))
+    annealer.T = 1.0
+    shortest = annealer.distance
+    for _ in range(500):
+        annealer._update_state()
+        assert annealer.distance == pytest.approx(annealer._calculate_distance(annealer.tour), abs=1e-9)
+        shortest = min(shortest, annealer.distance)
+    assert annealer.best_distance == shortest
+    assert annealer._calculate_distance(annealer.best_tour) == pytest.approx(shortest, abs=1e-9)
+
+@pytest.mark.parametrize('n', SIZES)
+def test_anneal_keeps_distance(n):
+    '''
+    the deltas of random moves add up to the length of the path
+    '''
+    annealer = _annealer(n, seed=n)
+    annealer.T = 1.0
+    annealer.anneal(2000)
+    assert annealer.distance == pytest.approx(annealer._calculate_distance(annealer.tour))
+    assert np.array_equal(annealer.positions[annealer.tour], np.arange(n))
+
+def test_run_records_the_final_state():
+    '''
+    a Slow run keeps the tour of every step, the last one is the final path
+    '''
+    annealer = _annealer(10, recorder=TrajectoryRecorder(10))
+    annealer.run()
+    states = annealer.all_states
+    assert len(states) == annealer.current_iteration
+    assert states[-1]['cities'] == annealer.state['cities']
+    assert states[-1]['distance'] == round(annealer.distance, 2)
+    steps = annealer.recorder.steps[:annealer.recorder.n_steps]
+    assert steps['step'][-1] == annealer.current_iteration
+
+def test_nearest_neighbours():
+    distances = _annealer(40).cities_distances
+    neighbours = nearest_neighbours(distances, 5)
+    assert neighbours.shape == (40, 5)
+    for city, row in enumerate(neighbours):
+        assert city not in row
+        expected = np.argsort(np.where(np.arange(40) == city, np.inf, distances[city]))[:5]
+        assert np.array_equal(row, expected)
+    # at most n - 1 neighbours
+    assert nearest_neighbours(distances[:3, :3], 8).shape == (3, 2)
+    assert np.array_equal(nearest_neighbours(distances[:2, :2]), [[1], [0]])
+
+def test_run_chains_seed():
+    '''
+    the same seed gives the same chains, whatever the number of workers
+    '''
+    annealer = _annealer(12)
+    first = sa.run_chains(annealer.cities_distances, annealer.cities_coords, Cooling.Fast, T_lower=60, chains=3, workers=2, seed=7)
+    second = sa.run_chains(annealer.cities_distances, annealer.cities_coords, Cooling.Fast, T_lower=60, chains=3, workers=1, seed=7)
+    assert first['chains'] == second['chains']
+    assert first['distance'] == min(first['chains'])
+
+def test_parallel_tempering():
+    '''
+    the ensemble returns a permutation of the cities and its true length
+    '''
+    annealer = _annealer(15)
+    temperatures = sa.geometric_temperatures(1.0, 0.01, 4)
+    tour, distance = sa.parallel_tempering(annealer.cities_distances, annealer.cities_coords, temperatures, 20, 50, seed=3)
+    assert np.array_equal(np.sort(tour), np.arange(15))
+    assert distance == pytest.approx(annealer._calculate_distance(tour))
+    result = sa.run_chains(annealer.cities_distances, annealer.cities_coords, chains=2, workers=1, seed=3,
+                           temperatures=temperatures, sweeps=20, steps=50)
+    assert sorted(result['cities']) == sorted(annealer.cities)
+    cities = [annealer.cities.index(city) for city in result['cities']]
+    assert result['distance'] == pytest.approx(annealer._calculate_distance(np.array(cities)))
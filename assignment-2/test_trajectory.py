@@ -0,0 +1,94 @@
+import numpy as np
+
+from trajectory import TrajectoryRecorder, load_trajectory, tours_to_states
+
+def _feed(recorder: TrajectoryRecorder, distances, accepted=None, n_cities: int = 5):
+    '''
+    records one step per distance; the tour of step s is the cities rolled by s
+    '''
+    accepted = np.ones(len(distances), dtype=bool) if accepted is None else accepted
+    for step, (distance, is_accepted) in enumerate(zip(distances, accepted), 1):
+        recorder.record(step, distance, 1000.0 / step, bool(is_accepted), np.roll(np.arange(n_cities), step))
+    recorder.close()
+
+def test_keeps_every_tour_until_full():
+    '''
+    a short run keeps all its tours, the last frame is the final step
+    '''
+    recorder = TrajectoryRecorder(5, max_tours=16)
+    distances = np.random.default_rng(0).uniform(10, 20, size=12)
+    _feed(recorder, distances)
+    assert recorder.n_tours == 12 and recorder.n_steps == 12
+    assert np.array_equal(recorder.tours['step'][:12], np.arange(1, 13))
+    last = recorder.tours[recorder.n_tours - 1]
+    assert last['step'] == 12 and last['distance'] == distances[-1]
+    assert np.array_equal(last['tour'], np.roll(np.arange(5), 12))
+    states = recorder.states(['a', 'b', 'c', 'd', 'e'])
+    assert states[-1]['cities'] == ['d', 'e', 'a', 'b', 'c']
+
+def test_decimation_keeps_best_and_final():
+    '''
+    after the array of tours is full only improvements and every `tour_every`-th tour are kept,
+    the best tour survives every decimation and the final tour is recorded by `close`
+    '''
+    for best_step in (1, 2, 50, 99, 299):
+        distances = np.linspace(100, 50, 300)
+        distances[best_step - 1] = 1.0
+        recorder = TrajectoryRecorder(5, capacity=16, max_tours=8, tour_every=25)
+        _feed(recorder, distances)
+        tours = recorder.tours[:recorder.n_tours]
+        assert recorder.n_tours <= 8
+        assert best_step in tours['step']
+        assert tours['distance'].min() == 1.0
+        assert tours['step'][-1] == 300
+        assert np.all(np.diff(tours['step']) > 0)
+
+def test_stride_and_accepted():
+    '''
+    decimated steps keep the latest step of every pair, and the accepted moves of all steps add up
+    '''
+    n = 1001
+    accepted = np.random.default_rng(1).uniform(size=n) < 0.3
+    recorder = TrajectoryRecorder(5, capacity=64, max_tours=4)
+    _feed(recorder, np.linspace(100, 50, n), accepted)
+    steps = recorder.steps[:recorder.n_steps]
+    # 64 records cover 64 * stride steps: 1001 steps need a stride of 16
+    assert recorder.n_steps <= 64 and recorder.stride == 16
+    assert steps['step'][-1] == n
+    # windows of `stride` steps, except the last one that `close` records
+    assert np.all(np.diff(steps['step'][:-1]) == recorder.stride)
+    assert steps['accepted'].sum() == accepted.sum()
+
+def test_streaming_round_trip(tmp_path):
+    '''
+    the files of a streaming recorder hold every step and every kept tour, in order
+    '''
+    n = 500
+    rng = np.random.default_rng(2)
+    distances = rng.uniform(10, 20, size=n)
+    accepted = rng.uniform(size=n) < 0.5
+    recorder = TrajectoryRecorder(5, capacity=32, max_tours=4, tour_every=100, path=tmp_path / 'run')
+    _feed(recorder, distances, accepted)
+    steps, tours = load_trajectory(tmp_path / 'run')
+    assert recorder.stride == 1
+    assert np.array_equal(steps['step'], np.arange(1, n + 1))
+    assert np.array_equal(steps['distance'], distances)
+    assert np.array_equal(steps['accepted'], accepted)
+    improvements = [step for step in range(1, n + 1) if distances[step - 1] < distances[:step - 1].min(initial=np.inf)]
+    assert list(tours['step']) == sorted(set(improvements) | {100, 200, 300, 400, 500})
+    assert np.array_equal(tours['tour'][-1], np.roll(np.arange(5), n))
+    assert len(tours_to_states(tours, list('abcde'))) == len(tours)
+
+def test_close_records_the_final_step():
+    '''
+    a last step that did not fill its window is written by `close`, and `close` twice changes nothing
+    '''
+    recorder = TrajectoryRecorder(5, capacity=4, max_tours=4, tour_every=1000)
+    distances = np.linspace(100, 50, 11)
+    _feed(recorder, distances)
+    steps = recorder.steps[:recorder.n_steps]
+    assert steps['step'][-1] == 11 and steps['distance'][-1] == 50
+    assert steps['accepted'].sum() == 11
+    n_steps, n_tours = recorder.n_steps, recorder.n_tours
+    recorder.close()
+    assert (recorder.n_steps, recorder.n_tours) == (n_steps, n_tours)
@@ -0,0 +1,170 @@
+'''
+Bounded trajectory of an annealing run.
+
+Every step records its distance, temperature and number of accepted moves into
+preallocated arrays. In memory every tour is kept until `max_tours` of them are;
+from then on (and always when streaming) a tour is kept only when the path
+improves on the best recorded one, or every `tour_every` steps. When an array is
+full it is either appended to files (`path` given) or decimated: every other
+record is dropped (never the best tour) and the steps are recorded half as often
+from then on. `close` records the last step and the final tour. Memory never
+exceeds `capacity` steps and `max_tours` tours, however long the schedule is.
+`states` turns the kept tours into the frames `visualizer.animate_me` expects.
+'''
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+CAPACITY = 2 ** 16
+MAX_TOURS = 1024
+TOUR_EVERY = 1000
+STEP_DTYPE = np.dtype([('step', '<i8'), ('distance', '<f8'), ('temp', '<f8'), ('accepted', '<i4')])
+
+
+def _tour_dtype(n_cities: int) -> np.dtype:
+    return np.dtype([('step', '<i8'), ('distance', '<f8'), ('temp', '<f8'), ('tour', '<i4', (n_cities,))])
+
+
+class TrajectoryRecorder:
+    '''
+    Steps and tours of one annealing run in arrays of a fixed size
+    '''
+    def __init__(self, n_cities: int, capacity: int = CAPACITY, max_tours: int = MAX_TOURS, tour_every: int = TOUR_EVERY,
+                 path: Optional[Union[str, Path]] = None):
+        '''
+        @param n_cities: length of a tour
+        @param capacity: number of steps kept in memory (even)
+        @param max_tours: number of tours kept in memory (even)
+        @param tour_every: once the tours do not all fit, a tour is also kept every `tour_every` steps, not only on improvements
+        @param path: if given, full arrays are appended to path.steps and path.tours instead of being decimated
+        '''
+        assert capacity >= 2 and capacity % 2 == 0 and max_tours >= 4 and max_tours % 2 == 0, \
+            'capacity must be even and at least 2, max_tours even and at least 4'
+        self.steps = np.zeros(capacity, dtype=STEP_DTYPE)
+        self.tours = np.zeros(max_tours, dtype=_tour_dtype(n_cities))
+        self.n_steps = 0
+        self.n_tours = 0
+        self.tour_every = tour_every
+        # every `stride`-th step is recorded; doubled by every decimation
+        self.stride = 1
+        self._skipped = 0
+        self._accepted = 0
+        self.best = np.inf
+        # every tour is kept until the array of tours is full for the first time
+        self._keep_all = path is None
+        # the latest step (with a reference to its tour) and the step of the latest kept tour, for `close`
+        self._last = None
+        self._tour_step = None
+        self.path = None if path is None else Path(path)
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.with_suffix('.steps').write_bytes(b'')
+            # the tours file starts with the length of a tour
+            np.array([n_cities], dtype='<i8').tofile(self.path.with_suffix('.tours'))
+
+    def record(self, step: int, distance: float, temp: float, accepted: bool, tour: np.ndarray):
+        '''
+        records one step; the tour is only copied when it is kept
+        '''
+        self._accepted += accepted
+        self._last = (step, distance, temp, tour)
+        if self._keep_all or distance < self.best or step % self.tour_every == 0:
+            self._record_tour(step, distance, temp, tour)
+        self.best = min(self.best, distance)
+        self._skipped += 1
+        if self._skipped == self.stride:
+            self._record_step(step, distance, temp)
+
+    def _record_step(self, step: int, distance: float, temp: float):
+        self.steps[self.n_steps] = (step, distance, temp, self._accepted)
+        self.n_steps += 1
+        self._skipped = 0
+        self._accepted = 0
+        # a full array is emptied right away, so the next window is of the new stride
+        if self.n_steps == len(self.steps):
+            self._flush_steps() if self.path is not None else self._decimate_steps()
+
+    def _record_tour(self, step: int, distance: float, temp: float, tour: np.ndarray):
+        if self.n_tours == len(self.tours):
+            self._flush_tours() if self.path is not None else self._decimate_tours()
+        self.tours[self.n_tours] = (step, distance, temp, tour)
+        self.n_tours += 1
+        self._tour_step = step
+
+    def _decimate_tours(self):
+        # the latest tour is among the kept ones
+        kept = np.arange(1, self.n_tours, 2)
+        best = int(np.argmin(self.tours['distance'][:self.n_tours]))
+        if best % 2 == 0:
+            # the best tour takes the place of a neighbour, never of the latest one
+            kept[best // 2 if best + 1 < self.n_tours - 1 else best // 2 - 1] = best
+        self.tours[:len(kept)] = self.tours[kept]
+        self.n_tours = len(kept)
+        self._keep_all = False
+
+    def _decimate_steps(self):
+        # 'accepted' of a kept record covers the dropped one before it
+        kept = self.steps[1:self.n_steps:2].copy()
+        kept['accepted'] += self.steps[0:self.n_steps:2]['accepted']
+        self.steps[:len(kept)] = kept
+        self.n_steps = len(kept)
+        self.stride *= 2
+
+    def _flush_steps(self):
+        with open(self.path.with_suffix('.steps'), 'ab') as file:
+            self.steps[:self.n_steps].tofile(file)
+        self.n_steps = 0
+
+    def _flush_tours(self):
+        with open(self.path.with_suffix('.tours'), 'ab') as file:
+            self.tours[:self.n_tours].tofile(file)
+        self.n_tours = 0
+
+    def close(self):
+        '''
+        records the last step (with the moves accepted since the last record) and the final tour,
+        and writes the rest of the records to the files (if streaming)
+        '''
+        if self._last is not None:
+            step, distance, temp, tour = self._last
+            if self._skipped:
+                self._record_step(step, distance, temp)
+            if self._tour_step != step:
+                self._record_tour(step, distance, temp, tour)
+        if self.path is not None:
+            self._flush_steps()
+            self._flush_tours()
+
+    def states(self, cities: 'list[str]') -> 'list[dict]':
+        '''
+        frames for `visualizer.animate_me`, one per tour in memory (for a streaming recorder
+        use `tours_to_states` on the tours of `load_trajectory`)
+        @param cities: city names in the order of the distance matrix
+        '''
+        return tours_to_states(self.tours[:self.n_tours], cities)
+
+
+def tours_to_states(tours: np.ndarray, cities: 'list[str]') -> 'list[dict]':
+    return [
+        {
+            'title': f'Iteration: {record["step"]}; Distance: {record["distance"]} km',
+            'cities': [cities[city] for city in record['tour']],
+            'distance': round(float(record['distance']), 2),
+            'temp': round(float(record['temp']), 2),
+        }
+        for record in tours
+    ]
+
+
+def load_trajectory(path: Union[str, Path]) -> 'tuple[np.ndarray, np.ndarray]':
+    '''
+    reads the files of a streaming recorder
+    @return steps and tours as structured arrays
+    '''
+    path = Path(path)
+    steps = np.fromfile(path.with_suffix('.steps'), dtype=STEP_DTYPE)
+    with open(path.with_suffix('.tours'), 'rb') as file:
+        n_cities = int(np.fromfile(file, dtype='<i8', count=1)[0])
+        tours = np.fromfile(file, dtype=_tour_dtype(n_cities))
+    return steps, tours